@@ -0,0 +1,161 @@
+"""
+典型相關分析 - 置換檢定
+=====================================
+將 Y 組變數 (網路負面情緒) 的列相對於 X 組變數 (網路使用行為) 隨機置換，
+建立各對典型相關係數在虛無假設下的分布，計算每一對典型相關的 p 值。
+
+做法：X、Y 先各自中心化並以 SVD 白化 (取正交基底 Qx、Qy)，
+典型相關係數即為 Qx.T @ Qy 的奇異值。置換 Y 的列不會改變 Qy 的正交性，
+因此每次置換只需計算一個 p×q 小矩陣的 SVD，且可一次批次處理多個置換。
+白化矩陣以共享記憶體發布，子程序以名稱掛載，不需逐一序列化。
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared_array import SharedArray, attach_shared_array
+
+
+def whiten_block(data, tol=1e-10):
+    """中心化並白化一組變數，回傳正交基底 (n × rank)"""
+    data = np.asarray(data, dtype=float)
+    centered = data - data.mean(axis=0)
+    U, s, _ = np.linalg.svd(centered, full_matrices=False)
+
+    # 去除近乎共線的方向，避免除以接近 0 的奇異值
+    rank = int(np.sum(s > tol * s[0])) if s.size else 0
+    return U[:, :rank]
+
+
+def canonical_correlations(Qx, Qy):
+    """由白化後的兩組基底計算全部典型相關係數 (由大到小)"""
+    return np.linalg.svd(Qx.T @ Qy, compute_uv=False)
+
+
+def wilks_lambda(corrs):
+    """計算第 k 對以後 (含) 的 Wilks' Lambda，供逐步 (step-down) 檢定使用"""
+    corrs = np.asarray(corrs)
+    terms = 1.0 - np.clip(corrs, 0.0, 1.0) ** 2
+    # 由尾端往前累乘：Lambda_k = prod_{j >= k} (1 - r_j^2)
+    return np.flip(np.cumprod(np.flip(terms, axis=-1), axis=-1), axis=-1)
+
+
+# ============================================
+# 置換工作函數 (於子程序中執行)
+# ============================================
+_worker_Qx = None
+_worker_Qy = None
+
+
+def _init_worker(x_spec, y_spec):
+    """子程序初始化：以名稱掛載共享的白化矩陣，之後每個任務只需傳送亂數種子"""
+    global _worker_Qx, _worker_Qy
+    _worker_Qx = attach_shared_array(x_spec)
+    _worker_Qy = attach_shared_array(y_spec)
+
+
+def _permutation_batch(Qx, Qy, seed, n_perm, batch_size):
+    """以批次方式計算 n_perm 次置換的典型相關係數"""
+    rng = np.random.default_rng(seed)
+    n = Qy.shape[0]
+    base = np.arange(n)
+    results = []
+
+    for start in range(0, n_perm, batch_size):
+        size = min(batch_size, n_perm - start)
+        perms = rng.permuted(np.broadcast_to(base, (size, n)), axis=1)
+        # (p × n) @ (B × n × q) → (B × p × q)，再批次計算奇異值
+        cross = Qx.T @ Qy[perms]
+        results.append(np.linalg.svd(cross, compute_uv=False))
+
+    return np.concatenate(results, axis=0)
+
+
+def _run_task(task):
+    seed, n_perm, batch_size = task
+    return _permutation_batch(_worker_Qx, _worker_Qy, seed, n_perm, batch_size)
+
+
+def permutation_test_cca(X, Y, n_permutations=10000, n_jobs=None,
+                         random_state=42, batch_size=256, chunk_size=1000):
+    """
+    典型相關置換檢定
+
+    Parameters:
+    -----------
+    X, Y : array-like
+        兩組變數 (列為受訪者)，會在內部中心化與白化
+    n_permutations : int
+        置換次數
+    n_jobs : int or None
+        子程序數量，None 表示使用全部 CPU；1 表示不開啟程序池
+    random_state : int
+        亂數種子，結果可重現 (與 n_jobs 無關)
+    batch_size : int
+        每次向量化計算的置換數量
+    chunk_size : int
+        每個子程序任務負責的置換數量
+
+    Returns:
+    --------
+    dict
+        observed: 觀察到的典型相關係數
+        p_values: 各對典型相關係數的置換 p 值
+        wilks_p_values: 第 k 對以後 (含) 的 Wilks' Lambda 逐步檢定 p 值
+        null_distribution: 置換分布 (n_permutations × 典型相關數)
+    """
+    Qx = whiten_block(X)
+    Qy = whiten_block(Y)
+    observed = canonical_correlations(Qx, Qy)
+
+    # 依任務切分置換次數，每個任務使用獨立的子種子
+    counts = [min(chunk_size, n_permutations - start)
+              for start in range(0, n_permutations, chunk_size)]
+    seeds = np.random.SeedSequence(random_state).spawn(len(counts))
+    tasks = [(seed, count, batch_size) for seed, count in zip(seeds, counts)]
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    if n_jobs == 1 or len(tasks) == 1:
+        null_parts = [_permutation_batch(Qx, Qy, *task) for task in tasks]
+    else:
+        with SharedArray(Qx) as shared_x, SharedArray(Qy) as shared_y:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks)),
+                                     initializer=_init_worker,
+                                     initargs=(shared_x.spec, shared_y.spec)) as executor:
+                null_parts = list(executor.map(_run_task, tasks))
+
+    null = np.concatenate(null_parts, axis=0)
+
+    # 加 1 修正，避免 p 值為 0
+    exceed = (null >= observed - 1e-12).sum(axis=0)
+    p_values = (exceed + 1) / (n_permutations + 1)
+
+    wilks_observed = wilks_lambda(observed)
+    wilks_exceed = (wilks_lambda(null) <= wilks_observed + 1e-12).sum(axis=0)
+    wilks_p_values = (wilks_exceed + 1) / (n_permutations + 1)
+
+    return {
+        'observed': observed,
+        'p_values': p_values,
+        'wilks_p_values': wilks_p_values,
+        'null_distribution': null,
+        'n_permutations': n_permutations
+    }
+
+
+def print_permutation_results(results, n_pairs=None):
+    """輸出置換檢定結果"""
+    observed = results['observed']
+    n_pairs = len(observed) if n_pairs is None else min(n_pairs, len(observed))
+
+    print(f"\n=== 置換檢定結果 (置換次數 = {results['n_permutations']}) ===")
+    for i in range(n_pairs):
+        print(f"第{i+1}對典型相關: r = {observed[i]:.3f}, "
+              f"p = {results['p_values'][i]:.4f}, "
+              f"Wilks 逐步檢定 p = {results['wilks_p_values'][i]:.4f}")
@@ -0,0 +1,246 @@
+"""
+典型相關分析 - 正則化與核函數版本
+=====================================
+以完整的平台使用變數 (q9/q10/q11 系列，約 30 欄) 對應網路負面情緒變數時，
+一般 CCA 的共變異矩陣接近奇異，容易過度配適。
+
+- Ridge 正則化 CCA：以 (1 - τ) C + τ I 取代各組共變異矩陣，
+  每組變數只做一次特徵分解，不同 τ 只需重新縮放特徵值，
+  再對一個 p×q 小矩陣做 SVD，因此交叉驗證整個懲罰格點的成本很低。
+- 核函數 CCA (選用)：先以 Nyström 近似將兩組變數映射到 RBF 特徵空間，
+  再套用相同的 Ridge CCA，用於探索非線性關係。
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+from sklearn.kernel_approximation import Nystroem
+from sklearn.preprocessing import StandardScaler
+
+DEFAULT_PENALTIES = np.array([1e-3, 0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9])
+
+
+class _RidgeCCASolver:
+    """預先計算兩組變數的特徵分解，供多組懲罰值重複使用"""
+
+    def __init__(self, X, Y):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        n = X.shape[0]
+
+        self.x_mean = X.mean(axis=0)
+        self.y_mean = Y.mean(axis=0)
+        Xc = X - self.x_mean
+        Yc = Y - self.y_mean
+
+        # 每組只做一次特徵分解
+        self.ex, self.Vx = np.linalg.eigh(Xc.T @ Xc / (n - 1))
+        self.ey, self.Vy = np.linalg.eigh(Yc.T @ Yc / (n - 1))
+        self.ex = np.clip(self.ex, 0.0, None)
+        self.ey = np.clip(self.ey, 0.0, None)
+
+        # 交叉共變異矩陣轉換到特徵基底
+        self.cross = self.Vx.T @ (Xc.T @ Yc / (n - 1)) @ self.Vy
+
+    def solve(self, reg_x, reg_y, n_components):
+        """給定懲罰值，回傳 X、Y 權重與 (正則化後的) 典型相關係數"""
+        dx = 1.0 / np.sqrt((1.0 - reg_x) * self.ex + reg_x)
+        dy = 1.0 / np.sqrt((1.0 - reg_y) * self.ey + reg_y)
+
+        U, s, Wt = np.linalg.svd(dx[:, None] * self.cross * dy[None, :],
+                                 full_matrices=False)
+        k = min(n_components, len(s))
+
+        x_weights = self.Vx @ (dx[:, None] * U[:, :k])
+        y_weights = self.Vy @ (dy[:, None] * Wt[:k].T)
+        return x_weights, y_weights, s[:k]
+
+
+def _holdout_correlations(x_scores, y_scores):
+    """計算驗證資料上各對典型變量的相關係數"""
+    xc = x_scores - x_scores.mean(axis=0)
+    yc = y_scores - y_scores.mean(axis=0)
+    denom = np.sqrt((xc ** 2).sum(axis=0) * (yc ** 2).sum(axis=0))
+    return np.divide((xc * yc).sum(axis=0), denom,
+                     out=np.zeros(xc.shape[1]), where=denom > 0)
+
+
+class RegularizedCCA:
+    """Ridge 正則化 CCA，可選用 Nyström 近似的 RBF 核函數"""
+
+    def __init__(self, n_components=2, reg_x=0.1, reg_y=0.1, kernel=None,
+                 n_nystroem=200, gamma=None, random_state=42):
+        """
+        Parameters:
+        -----------
+        n_components : int
+            典型相關對數
+        reg_x, reg_y : float
+            X、Y 組的收縮懲罰 τ (0 ~ 1)，τ 越大越接近單位矩陣
+        kernel : None or 'rbf'
+            None 為線性 CCA；'rbf' 以 Nyström 近似核函數 CCA
+        n_nystroem : int
+            Nyström 近似使用的地標點數
+        gamma : float or None
+            RBF 核函數參數，None 使用 1 / 變數數
+        random_state : int
+            Nyström 地標點抽樣的亂數種子
+        """
+        self.n_components = n_components
+        self.reg_x = reg_x
+        self.reg_y = reg_y
+        self.kernel = kernel
+        self.n_nystroem = n_nystroem
+        self.gamma = gamma
+        self.random_state = random_state
+
+    def _fit_feature_maps(self, X, Y):
+        if self.kernel is None:
+            self.x_map_ = None
+            self.y_map_ = None
+            return X, Y
+
+        if self.kernel != 'rbf':
+            raise ValueError(f"不支援的核函數：{self.kernel}")
+
+        n_landmarks = min(self.n_nystroem, X.shape[0])
+        self.x_map_ = Nystroem(kernel='rbf', gamma=self.gamma,
+                               n_components=n_landmarks,
+                               random_state=self.random_state).fit(X)
+        self.y_map_ = Nystroem(kernel='rbf', gamma=self.gamma,
+                               n_components=n_landmarks,
+                               random_state=self.random_state).fit(Y)
+        return self.x_map_.transform(X), self.y_map_.transform(Y)
+
+    def _map(self, X, Y):
+        if self.kernel is None:
+            return np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+        return self.x_map_.transform(X), self.y_map_.transform(Y)
+
+    def fit(self, X, Y):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        Fx, Fy = self._fit_feature_maps(X, Y)
+
+        solver = _RidgeCCASolver(Fx, Fy)
+        self.x_mean_ = solver.x_mean
+        self.y_mean_ = solver.y_mean
+        self.x_weights_, self.y_weights_, self.canonical_correlations_ = solver.solve(
+            self.reg_x, self.reg_y, self.n_components
+        )
+
+        # 訓練資料上的 (未正則化) 典型相關係數
+        x_scores, y_scores = self.transform(X, Y)
+        self.train_correlations_ = _holdout_correlations(x_scores, y_scores)
+        return self
+
+    def transform(self, X, Y):
+        Fx, Fy = self._map(X, Y)
+        return ((Fx - self.x_mean_) @ self.x_weights_,
+                (Fy - self.y_mean_) @ self.y_weights_)
+
+    def fit_transform(self, X, Y):
+        return self.fit(X, Y).transform(X, Y)
+
+
+def select_ridge_penalty(X, Y, penalties=DEFAULT_PENALTIES, n_components=2,
+                         n_splits=5, kernel=None, n_nystroem=200, gamma=None,
+                         random_state=42):
+    """
+    以 K-fold 交叉驗證選擇 X、Y 兩組的懲罰值
+
+    每個 fold 只建立一次特徵分解，整個 (τx, τy) 格點共用；
+    評分為驗證 fold 上前 n_components 對典型變量相關係數的總和。
+
+    Returns:
+    --------
+    best : dict
+        最佳 reg_x、reg_y 與其交叉驗證分數
+    cv_table : DataFrame
+        每組懲罰值的平均與標準差分數
+    """
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    grid = list(itertools.product(penalties, penalties))
+    scores = np.zeros((n_splits, len(grid)))
+
+    kfold = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for fold, (train_idx, test_idx) in enumerate(kfold.split(X)):
+        # 核函數映射只依訓練 fold 擬合
+        model = RegularizedCCA(n_components=n_components, kernel=kernel,
+                               n_nystroem=n_nystroem, gamma=gamma,
+                               random_state=random_state)
+        Fx_train, Fy_train = model._fit_feature_maps(X[train_idx], Y[train_idx])
+        Fx_test, Fy_test = model._map(X[test_idx], Y[test_idx])
+
+        solver = _RidgeCCASolver(Fx_train, Fy_train)
+        Fx_test = Fx_test - solver.x_mean
+        Fy_test = Fy_test - solver.y_mean
+
+        for j, (reg_x, reg_y) in enumerate(grid):
+            x_weights, y_weights, _ = solver.solve(reg_x, reg_y, n_components)
+            corrs = _holdout_correlations(Fx_test @ x_weights, Fy_test @ y_weights)
+            scores[fold, j] = corrs.sum()
+
+    cv_table = pd.DataFrame({
+        'reg_x': [g[0] for g in grid],
+        'reg_y': [g[1] for g in grid],
+        'cv_mean': scores.mean(axis=0),
+        'cv_std': scores.std(axis=0)
+    }).sort_values('cv_mean', ascending=False).reset_index(drop=True)
+
+    best = cv_table.iloc[0].to_dict()
+    return best, cv_table
+
+
+def main():
+    # 載入數據
+    df = pd.read_csv('processed_data_with_score2.csv')
+
+    # X：完整的平台使用變數 (即時通訊、社群媒體、影音平台)
+    usage_cols = [col for col in df.columns
+                  if col.startswith(('q9_', 'q10_', 'q11_'))
+                  and col not in ('q9_90', 'q10_90', 'q11_90')]
+    X = df[usage_cols].apply(pd.to_numeric, errors='coerce').fillna(0)
+    X = X.loc[:, X.std() > 0]
+
+    # Y：網路負面情緒變數
+    Y = df[['q22_01_1', 'q22_02_1', 'q22_03_1', 'q22_04_1', 'q22_05_1',
+            'q23_01_1', 'q23_02_1', 'q23_03_1', 'q23_04_1', 'q23_05_1',
+            'q25_01_1', 'q25_02_1', 'q25_03_1', 'q25_04_1']].apply(pd.to_numeric, errors='coerce')
+    Y = Y.fillna(Y.mean())
+
+    print(f"平台使用變數數: {X.shape[1]}")
+    print(f"負面情緒變數數: {Y.shape[1]}")
+
+    X_scaled = StandardScaler().fit_transform(X)
+    Y_scaled = StandardScaler().fit_transform(Y)
+
+    # 線性 Ridge CCA
+    best, cv_table = select_ridge_penalty(X_scaled, Y_scaled)
+    print("\n=== Ridge CCA 交叉驗證結果 (前 5 名) ===")
+    print(cv_table.head().round(4).to_string(index=False))
+
+    rcca = RegularizedCCA(n_components=2, reg_x=best['reg_x'], reg_y=best['reg_y'])
+    rcca.fit(X_scaled, Y_scaled)
+    print(f"\n最佳懲罰值: τx = {best['reg_x']}, τy = {best['reg_y']}")
+    print(f"驗證集典型相關總和: {best['cv_mean']:.3f} (+/- {best['cv_std']:.3f})")
+    for i, r in enumerate(rcca.train_correlations_):
+        print(f"第{i+1}對典型相關係數 (全樣本): {r:.3f}")
+
+    print("\n=== X 變量的權重 (第一對，絕對值前 10) ===")
+    x_weights = pd.Series(rcca.x_weights_[:, 0], index=X.columns)
+    print(x_weights.reindex(x_weights.abs().sort_values(ascending=False).index)
+          .head(10).round(4).to_string())
+
+    # Nyström 核函數 CCA
+    best_k, cv_table_k = select_ridge_penalty(X_scaled, Y_scaled, kernel='rbf')
+    print("\n=== 核函數 CCA (RBF, Nyström) 交叉驗證結果 (前 5 名) ===")
+    print(cv_table_k.head().round(4).to_string(index=False))
+    print(f"\n線性 vs 核函數 驗證集分數: {best['cv_mean']:.3f} vs {best_k['cv_mean']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
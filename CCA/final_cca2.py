@@ -1,3 +1,5 @@
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -5,6 +7,12 @@ import seaborn as sns
 from sklearn.cross_decomposition import CCA
 from sklearn.preprocessing import StandardScaler
 import statsmodels.multivariate.cancorr as cancorr
+from cca_permutation import permutation_test_cca, print_permutation_results
+
+# 共用模組位於專案根目錄
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from figure_renderer import FigureSpec, render_figures
+
 def setup_chinese_font():
     """設置支援中文的字體"""
     plt.rcParams['font.family'] = 'Arial Unicode MS'
@@ -12,15 +20,27 @@ def setup_chinese_font():
 
 def plot_correlation_heatmap(data, title):
     """繪製相關係數熱圖"""
-    plt.figure(figsize=(10, 8))
+    fig = plt.figure(figsize=(10, 8))
     sns.heatmap(data.corr(), annot=True, cmap='coolwarm', fmt=".2f", linewidths=0.5)
     plt.title(title)
-    plt.show()
+    return fig
+
+def plot_canonical_scatter(X_c, Y_c, corr1, corr2):
+    """繪製典型相關變量的散點圖"""
+    fig = plt.figure(figsize=(10, 6))
+    plt.scatter(X_c[:, 0], Y_c[:, 0], alpha=0.5, label=f"第一對典型相關 (r = {corr1:.3f})")
+    plt.scatter(X_c[:, 1], Y_c[:, 1], alpha=0.5, label=f"第二對典型相關 (r = {corr2:.3f})")
+    plt.xlabel("網路使用行為典型變量")
+    plt.ylabel("網路負面情緒典型變量")
+    plt.title("典型相關分析散點圖")
+    plt.legend()
+    plt.grid()
+    return fig
 
 def plot_unified_weights(x_weights, y_weights, x_columns, y_columns, pair_number):
     """繪製統一的權重圖"""
     # 創建一個圖
-    plt.figure(figsize=(15, 6))
+    fig = plt.figure(figsize=(15, 6))
     
     # 計算所有權重的最大和最小值，用於統一y軸範圍
     min_weight = min(np.min(x_weights), np.min(y_weights))
@@ -58,7 +78,7 @@ def plot_unified_weights(x_weights, y_weights, x_columns, y_columns, pair_number
     
     # 調整布局
     plt.tight_layout()
-    plt.show()
+    return fig
 
 def main():
     # 載入數據
@@ -74,10 +94,14 @@ def main():
     X = X.fillna(X.mean())
     Y = Y.fillna(Y.mean())
 
-    # 繪製原始變數的相關係數熱圖
+    # 原始變數的相關係數熱圖 (字型設定隨繪圖規格送進子程序)
     setup_chinese_font()
-    plot_correlation_heatmap(X, "相關係數熱圖 (網路使用行為)")
-    plot_correlation_heatmap(Y, "相關係數熱圖 (網路負面情緒)")
+    figures = [
+        FigureSpec(plot_correlation_heatmap, 'cca_corr_usage',
+                   {'data': X, 'title': "相關係數熱圖 (網路使用行為)"}),
+        FigureSpec(plot_correlation_heatmap, 'cca_corr_emotion',
+                   {'data': Y, 'title': "相關係數熱圖 (網路負面情緒)"})
+    ]
 
     # 標準化數據
     scaler = StandardScaler()
@@ -94,6 +118,10 @@ def main():
     print(f"\n第一對典型相關係數: {corr1:.3f}")
     print(f"第二對典型相關係數: {corr2:.3f}")
 
+    # 置換檢定 (打亂 Y 組與 X 組的對應關係)
+    perm_results = permutation_test_cca(X_scaled, Y_scaled, n_permutations=10000)
+    print_permutation_results(perm_results, n_pairs=2)
+
     # 輸出典型變量的權重 (Weights)
     print("\n=== X 變量的權重 (Weights) ===")
     for i, col in enumerate(X.columns):
@@ -103,33 +131,20 @@ def main():
     for i, col in enumerate(Y.columns):
         print(f"{col}: 第一對 = {cca.y_weights_[i, 0]:.4f}, 第二對 = {cca.y_weights_[i, 1]:.4f}")
 
-    # 繪製典型相關變量的散點圖
-    plt.figure(figsize=(10, 6))
-    plt.scatter(X_c[:, 0], Y_c[:, 0], alpha=0.5, label=f"第一對典型相關 (r = {corr1:.3f})")
-    plt.scatter(X_c[:, 1], Y_c[:, 1], alpha=0.5, label=f"第二對典型相關 (r = {corr2:.3f})")
-    plt.xlabel("網路使用行為典型變量")
-    plt.ylabel("網路負面情緒典型變量")
-    plt.title("典型相關分析散點圖")
-    plt.legend()
-    plt.grid()
-    plt.show()
-
-    # 使用新的統一權重圖函數
-    plot_unified_weights(
-        cca.x_weights_[:, 0], 
-        cca.y_weights_[:, 0], 
-        X.columns, 
-        Y.columns, 
-        "一"
-    )
-    
-    plot_unified_weights(
-            cca.x_weights_[:, 1], 
-            cca.y_weights_[:, 1], 
-            X.columns, 
-            Y.columns, 
-            "二"
-        )
+    # 典型相關變量的散點圖與兩對典型相關的權重圖
+    figures.append(FigureSpec(plot_canonical_scatter, 'cca_scatter',
+                              {'X_c': X_c, 'Y_c': Y_c, 'corr1': corr1, 'corr2': corr2}))
+    for pair, pair_number in enumerate(["一", "二"]):
+        figures.append(FigureSpec(plot_unified_weights, f'cca_weights_pair{pair + 1}', {
+            'x_weights': cca.x_weights_[:, pair],
+            'y_weights': cca.y_weights_[:, pair],
+            'x_columns': list(X.columns),
+            'y_columns': list(Y.columns),
+            'pair_number': pair_number
+        }))
+
+    # 所有圖表於程序池平行繪製並存檔
+    render_figures(figures)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
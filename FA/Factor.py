@@ -6,8 +6,12 @@ from scipy import stats
 import seaborn as sns
 import matplotlib.pyplot as plt
 from io import StringIO
-import matplotlib.pyplot as plt
 import os
+import sys
+
+# 共用模組位於專案根目錄
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from figure_renderer import FigureSpec, render_figures
 
 # 設定中文字體
 plt.rcParams['font.family'] = ['Arial Unicode MS']  # Mac OS 的通用中文字體
@@ -247,26 +251,24 @@ def compare_rotation_methods(data, n_factors):
     
     return results
 
-def plot_scree(data, output_dir):
-    fa = FactorAnalyzer()
-    fa.fit(data)
-    ev, v = fa.get_eigenvalues()
-    
-    plt.figure(figsize=(10, 6))
+def draw_scree(ev):
+    fig = plt.figure(figsize=(10, 6))
     plt.plot(range(1, len(ev) + 1), ev)
     plt.title('碎石圖')
     plt.xlabel('因素數')
     plt.ylabel('特徵值')
     plt.axhline(y=1, color='r', linestyle='--')
-    
-    # 儲存圖片
-    plt.savefig(os.path.join(output_dir, 'scree_plot.png'), 
-                dpi=300, bbox_inches='tight')
-    plt.show()
-    print(f"碎石圖已儲存至 {output_dir}/scree_plot.png")
+    return fig
 
-def plot_factor_loadings(loadings, output_dir):
-    plt.figure(figsize=(12, 8))
+def plot_scree(data, output_dir):
+    """計算特徵值，回傳碎石圖的繪圖規格"""
+    fa = FactorAnalyzer()
+    fa.fit(data)
+    ev, v = fa.get_eigenvalues()
+    return FigureSpec(draw_scree, 'scree_plot', {'ev': ev}, output_dir=output_dir, dpi=300)
+
+def draw_factor_loadings(loadings):
+    fig = plt.figure(figsize=(12, 8))
     
     # 設定熱圖參數
     sns.heatmap(loadings, 
@@ -282,12 +284,12 @@ def plot_factor_loadings(loadings, output_dir):
     
     # 調整版面配置
     plt.tight_layout()
-    
-    # 儲存圖片
-    plt.savefig(os.path.join(output_dir, 'factor_loadings_heatmap.png'), 
-                dpi=300, bbox_inches='tight')
-    plt.show()
-    print(f"因素負荷量熱圖已儲存至 {output_dir}/factor_loadings_heatmap.png")
+    return fig
+
+def plot_factor_loadings(loadings, output_dir):
+    """回傳因素負荷量熱圖的繪圖規格"""
+    return FigureSpec(draw_factor_loadings, 'factor_loadings_heatmap', {'loadings': loadings},
+                      output_dir=output_dir, dpi=300)
 
 def calculate_and_save_factor_scores(data, loadings, output_dir):
     """計算因素分數並儲存結果"""
@@ -356,28 +358,35 @@ def prepare_combined_dataset(factor_scores_df, original_data):
     
     return combined_data
 
-def plot_factor_analysis_results(factor_scores_df, output_dir):
-    """產生因素分析結果的視覺化"""
-    # 因素分數分布圖
-    plt.figure(figsize=(12, 6))
+def draw_factor_scores_distribution(factor_scores_df):
+    """因素分數分布圖"""
+    fig = plt.figure(figsize=(12, 6))
     for col in factor_scores_df.columns:
         sns.kdeplot(data=factor_scores_df[col], label=col)
     plt.title('因素分數分布')
     plt.xlabel('因素分數')
     plt.ylabel('密度')
     plt.legend()
-    plt.savefig(os.path.join(output_dir, 'factor_scores_distribution.png'))
-    plt.close()
-    
-    # 因素間關係矩陣圖
-    plt.figure(figsize=(10, 8))
+    return fig
+
+def draw_factor_correlation_matrix(factor_scores_df):
+    """因素間關係矩陣圖"""
+    fig = plt.figure(figsize=(10, 8))
     sns.heatmap(factor_scores_df.corr(), 
                 annot=True, 
                 cmap='coolwarm',
                 fmt='.2f')
     plt.title('因素間相關係數矩陣')
-    plt.savefig(os.path.join(output_dir, 'factor_correlation_matrix.png'))
-    plt.close()
+    return fig
+
+def plot_factor_analysis_results(factor_scores_df, output_dir):
+    """回傳因素分析結果視覺化的繪圖規格"""
+    return [
+        FigureSpec(draw_factor_scores_distribution, 'factor_scores_distribution',
+                   {'factor_scores_df': factor_scores_df}, output_dir=output_dir),
+        FigureSpec(draw_factor_correlation_matrix, 'factor_correlation_matrix',
+                   {'factor_scores_df': factor_scores_df}, output_dir=output_dir)
+    ]
 
 def main():
     try:
@@ -392,18 +401,21 @@ def main():
         kmo_all, kmo_model = detailed_kmo_analysis(analysis_data)
         chi_square, p_value = detailed_bartlett_analysis(analysis_data)
         ev, cum_var_ratio = enhanced_factor_extraction(analysis_data)
-        plot_scree(analysis_data, output_dir)
+        figures = [plot_scree(analysis_data, output_dir)]
         
         # 執行因素分析
         n_factors = sum(ev > 1)
         rotation_results = compare_rotation_methods(analysis_data, n_factors)
         loadings, communalities, eigenvalues, explained_variance = perform_factor_analysis(analysis_data, n_factors)
-        plot_factor_loadings(loadings, output_dir)
+        figures.append(plot_factor_loadings(loadings, output_dir))
         
         # 計算因素分數和整合資料
         factor_scores_df = calculate_and_save_factor_scores(analysis_data, loadings, output_dir)
         combined_data = prepare_combined_dataset(factor_scores_df, df)
-        plot_factor_analysis_results(factor_scores_df, output_dir)
+        figures += plot_factor_analysis_results(factor_scores_df, output_dir)
+        
+        # 所有圖表於程序池平行繪製並存檔
+        render_figures(figures)
         
         # 儲存結果
         combined_data.to_csv(os.path.join(output_dir, 'combined_data_for_analysis.csv'), index=False)
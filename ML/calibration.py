@@ -0,0 +1,290 @@
+"""
+機率校準
+=====================================
+RF / XGBoost / LightGBM 以 class_weight='balanced' (或 scale_pos_weight) 訓練，
+輸出的 y_prob 明顯高估高風險機率，不宜直接顯示在儀表板上。
+
+本模組以分類訓練集內的 out-of-fold 機率擬合校準器 (ml_models.py 的快取或分析器的 oof_arrays)。
+這些機率來自與正式模型相同設定、只在訓練集內交叉驗證的模型，
+校準器再套用到以整個訓練集訓練的正式模型 (與 CalibratedClassifierCV(ensemble=False) 相同做法)：
+
+- 校準方法：isotonic、Platt (logit 上的邏輯迴歸)、beta calibration
+- 以 fold 交叉擬合評估 ECE 與 Brier score (每個 fold 的校準器不看該 fold)，
+  並繪製可靠度圖 (reliability diagram)
+- 最終校準器以全部 out-of-fold 機率擬合，存成分段線性查表 (x, y)，
+  評分時只需一次 np.interp
+- 查表會套用在評分與匯出：model_artifact.py 的模型檔、stacking_ensemble.py 的堆疊模型
+  (predict_proba 預設輸出校準後機率) 與 dashboard_export.py 的測試集機率指標；
+  分類決策 (predict) 仍以未校準分數比較門檻，與 threshold_optimizer.py 的門檻一致
+"""
+
+import json
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+
+from ml_models import OUTPUT_DIR, OOF_CACHE_PATH
+from threshold_optimizer import load_oof_cache
+
+CALIBRATION_PATH = os.path.join(OUTPUT_DIR, 'calibration_maps.json')
+CALIBRATION_METHODS = ['isotonic', 'platt', 'beta']
+
+# 參數式校準器查表的節點數 (於 logit 尺度等距，兩端較密)
+N_GRID = 257
+EPS = 1e-6
+N_BINS = 10
+
+
+class CalibrationMap:
+    """分段線性的校準查表"""
+
+    def __init__(self, x, y, method=None):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.method = method
+
+    def __call__(self, prob):
+        return np.interp(prob, self.x, self.y)
+
+    def to_dict(self):
+        return {'method': self.method, 'x': self.x.round(8).tolist(), 'y': self.y.round(8).tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['x'], data['y'], data.get('method'))
+
+
+def _probability_grid():
+    logits = np.linspace(np.log(EPS / (1 - EPS)), np.log((1 - EPS) / EPS), N_GRID - 2)
+    return np.concatenate([[0.0], 1.0 / (1.0 + np.exp(-logits)), [1.0]])
+
+
+def _logit(prob):
+    prob = np.clip(prob, EPS, 1 - EPS)
+    return np.log(prob / (1 - prob))
+
+
+def _beta_features(prob):
+    prob = np.clip(prob, EPS, 1 - EPS)
+    return np.column_stack([np.log(prob), -np.log(1 - prob)])
+
+
+def fit_calibration_map(prob, y, method):
+    """
+    擬合校準器並轉為查表
+
+    Parameters:
+    -----------
+    prob : array
+        未校準的預測機率
+    y : array
+        真實標籤 (0/1)
+    method : {'isotonic', 'platt', 'beta'}
+
+    Returns:
+    --------
+    CalibrationMap
+    """
+    prob = np.asarray(prob, dtype=float)
+    if method == 'isotonic':
+        iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(prob, y)
+        # 分段線性端點即為查表，補上 0 與 1 使整個區間有定義
+        x = np.concatenate([[0.0], iso.X_thresholds_, [1.0]])
+        y_map = np.concatenate([[iso.y_thresholds_[0]], iso.y_thresholds_, [iso.y_thresholds_[-1]]])
+        x, index = np.unique(x, return_index=True)
+        return CalibrationMap(x, y_map[index], method)
+
+    grid = _probability_grid()
+    if method == 'platt':
+        model = LogisticRegression(C=1e6).fit(_logit(prob)[:, None], y)
+        return CalibrationMap(grid, model.predict_proba(_logit(grid)[:, None])[:, 1], method)
+    if method == 'beta':
+        # Kull et al. (2017)：logit(q) = a·ln(p) − b·ln(1−p) + c，a、b 限制為非負
+        model = LogisticRegression(C=1e6).fit(_beta_features(prob), y)
+        features = _beta_features(grid)
+        if np.any(model.coef_ < 0):
+            keep = model.coef_[0] >= 0
+            if not keep.any():
+                return CalibrationMap([0.0, 1.0], [np.mean(y)] * 2, method)
+            model = LogisticRegression(C=1e6).fit(_beta_features(prob)[:, keep], y)
+            features = features[:, keep]
+        return CalibrationMap(grid, model.predict_proba(features)[:, 1], method)
+    raise ValueError(f"未知的校準方法: {method}")
+
+
+def expected_calibration_error(prob, y, n_bins=N_BINS):
+    """等寬分箱的 ECE：各箱 |平均預測 − 實際比例| 依樣本數加權"""
+    bins = np.minimum((np.asarray(prob) * n_bins).astype(int), n_bins - 1)
+    pred_sum = np.bincount(bins, weights=prob, minlength=n_bins)
+    true_sum = np.bincount(bins, weights=y, minlength=n_bins)
+    return np.abs(pred_sum - true_sum).sum() / len(prob)
+
+
+def brier_score(prob, y):
+    return np.mean((np.asarray(prob) - np.asarray(y)) ** 2)
+
+
+def reliability_curve(prob, y, n_bins=N_BINS):
+    """各分箱的平均預測機率與實際比例 (空箱略過)"""
+    bins = np.minimum((np.asarray(prob) * n_bins).astype(int), n_bins - 1)
+    counts = np.bincount(bins, minlength=n_bins)
+    nonempty = counts > 0
+    mean_pred = np.bincount(bins, weights=prob, minlength=n_bins)[nonempty] / counts[nonempty]
+    frac_pos = np.bincount(bins, weights=y, minlength=n_bins)[nonempty] / counts[nonempty]
+    return mean_pred, frac_pos, counts[nonempty]
+
+
+def cross_fitted_calibration(prob, y, folds, method):
+    """以 fold 交叉擬合：每個 fold 的機率由其他 fold 擬合的校準器轉換"""
+    calibrated = np.empty_like(prob, dtype=float)
+    for fold in np.unique(folds):
+        test = folds == fold
+        calibrated[test] = fit_calibration_map(prob[~test], y[~test], method)(prob[test])
+    return calibrated
+
+
+def select_calibration(prob, y, folds, methods=CALIBRATION_METHODS):
+    """
+    以 fold 交叉擬合比較各校準方法，並以全部機率擬合 Brier 最低的方法
+
+    Returns:
+    --------
+    rows : list of dict
+        各方法 (含未校準) 的 ECE 與 Brier
+    cal_map : CalibrationMap
+    calibrated : dict
+        方法 -> 交叉擬合後的機率
+    """
+    prob = np.asarray(prob, dtype=float)
+    y = np.asarray(y, dtype=float)
+    calibrated = {'uncalibrated': prob}
+    rows = [{'Method': 'uncalibrated', 'ECE': expected_calibration_error(prob, y),
+             'Brier': brier_score(prob, y)}]
+    for method in methods:
+        cal_prob = cross_fitted_calibration(prob, y, folds, method)
+        calibrated[method] = cal_prob
+        rows.append({'Method': method, 'ECE': expected_calibration_error(cal_prob, y),
+                     'Brier': brier_score(cal_prob, y)})
+
+    best_method = min(rows[1:], key=lambda row: row['Brier'])['Method']
+    return rows, fit_calibration_map(prob, y, best_method), calibrated
+
+
+def calibrate_models(cache, methods=CALIBRATION_METHODS):
+    """
+    評估各模型、各校準方法，並以全部 out-of-fold 機率擬合最終查表
+
+    Parameters:
+    -----------
+    cache : dict
+        load_oof_cache 或 CyberbullyingMLAnalyzer.oof_arrays 的結果
+
+    Returns:
+    --------
+    metrics : DataFrame
+        模型 × 方法 的 ECE 與 Brier (交叉擬合)
+    maps : dict
+        模型名稱 -> Brier 最低方法的 CalibrationMap
+    calibrated : dict
+        模型名稱 -> {方法 -> 交叉擬合後的機率}，供繪圖使用
+    """
+    rows, maps, calibrated = [], {}, {}
+    for j, model_name in enumerate(cache['model_names']):
+        model_rows, maps[model_name], calibrated[model_name] = select_calibration(
+            cache['oof_probs'][:, j], cache['y_binary'], cache['folds'], methods)
+        rows.extend({'Model': model_name, **row} for row in model_rows)
+
+    return pd.DataFrame(rows), maps, calibrated
+
+
+def fit_calibration_maps(analyzer, methods=CALIBRATION_METHODS):
+    """
+    由已訓練的分析器 (訓練集內 out-of-fold 機率) 擬合各模型的校準查表，不經快取檔
+
+    評分與匯出時使用，查表必定對應分析器目前的正式模型
+
+    Returns:
+    --------
+    dict
+        模型名稱 -> CalibrationMap
+    """
+    return calibrate_models(analyzer.oof_arrays(), methods)[1]
+
+
+def save_calibration_maps(maps, metrics, path=CALIBRATION_PATH):
+    """儲存校準查表 (JSON)"""
+    payload = {}
+    for model_name, cal_map in maps.items():
+        row = metrics[(metrics['Model'] == model_name) & (metrics['Method'] == cal_map.method)].iloc[0]
+        payload[model_name] = {**cal_map.to_dict(), 'ece': float(row['ECE']), 'brier': float(row['Brier'])}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    print(f"已儲存: {path}")
+    return path
+
+
+def load_calibration_maps(path=CALIBRATION_PATH):
+    """讀取校準查表：模型名稱 -> CalibrationMap"""
+    with open(path, encoding='utf-8') as f:
+        return {name: CalibrationMap.from_dict(data) for name, data in json.load(f).items()}
+
+
+def plot_reliability_diagrams(calibrated, y, maps, path=os.path.join(OUTPUT_DIR, 'calibration_reliability.png')):
+    """繪製各模型校準前後的可靠度圖"""
+    model_names = list(calibrated)
+    n_cols = min(3, len(model_names))
+    n_rows = int(np.ceil(len(model_names) / n_cols))
+    fig, axes = plt.subplots(n_rows, n_cols, figsize=(5 * n_cols, 5 * n_rows), squeeze=False)
+
+    for ax, model_name in zip(axes.flat, model_names):
+        for label, style in [('uncalibrated', 'o--'), (maps[model_name].method, 's-')]:
+            mean_pred, frac_pos, _ = reliability_curve(calibrated[model_name][label], y)
+            name = '未校準' if label == 'uncalibrated' else f'校準 ({label})'
+            ax.plot(mean_pred, frac_pos, style, linewidth=2, markersize=5, label=name)
+        ax.plot([0, 1], [0, 1], 'k:', linewidth=1, label='完美校準')
+        ax.set_xlabel('平均預測機率', fontsize=11)
+        ax.set_ylabel('實際高風險比例', fontsize=11)
+        ax.set_title(model_name, fontsize=13)
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1)
+        ax.legend(loc='upper left', fontsize=9)
+        ax.grid(True, alpha=0.3)
+
+    for ax in list(axes.flat)[len(model_names):]:
+        ax.axis('off')
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close()
+    print(f"已儲存: {path}")
+
+
+def main():
+    """主程式"""
+    print("=" * 60)
+    print("機率校準 (使用快取的 out-of-fold 機率)")
+    print("=" * 60)
+
+    cache = load_oof_cache(OOF_CACHE_PATH)
+    metrics, maps, calibrated = calibrate_models(cache)
+
+    print("\n【校準指標 (fold 交叉擬合)】")
+    print(metrics.round(4).to_string(index=False))
+    metrics.to_csv(os.path.join(OUTPUT_DIR, 'calibration_metrics.csv'), index=False, encoding='utf-8-sig')
+
+    print("\n【各模型採用的校準方法】")
+    for model_name, cal_map in maps.items():
+        print(f"  {model_name:<20} {cal_map.method} (查表 {len(cal_map.x)} 點)")
+
+    save_calibration_maps(maps, metrics)
+    plot_reliability_diagrams(calibrated, cache['y_binary'].astype(float), maps)
+
+    return metrics, maps
+
+
+if __name__ == "__main__":
+    metrics, maps = main()
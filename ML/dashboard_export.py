@@ -0,0 +1,280 @@
+"""
+儀表板資料匯出
+=====================================
+dashboard/src/data/analysisData.js 的模型比較、特徵重要性、聚類摘要與資料集統計
+原本是從 output/*.csv 手動抄寫，每次重新分析後都要改程式碼並重新建置儀表板。
+
+本模組在 save_results 的最後輸出一份精簡 JSON，儀表板於掛載前以 fetch 載入
+(dashboard/src/main.js)：
+
+- 只包含 Vue 圖表用到的欄位，數值已四捨五入、ROC 曲線已去除中間點
+- 各模型附上套用校準查表 (calibration.py，以訓練集 out-of-fold 機率擬合) 後的測試集
+  Brier score 與 ECE，即評分時實際輸出的機率品質；ROC 與混淆矩陣依排序與未校準門檻，
+  不受單調的校準查表影響
+- 以 DASHBOARD_DATA_VERSION 標記格式；儀表板只接受相同版本，否則保留內建的預設值
+- K-Means 的群編號每次執行都可能不同，聚類的名稱、說明、風險等級與顏色
+  一律由該群的輪廓 (平均分數排名、性別組成、年齡、上網時間) 推導，不依群編號對應
+- 先寫入暫存檔再取代，執行中斷時不會留下不完整的 JSON
+
+GitHub Pages (.github/workflows/deploy.yml) 從 git 建置，重新分析後需提交
+dashboard/public/data/analysis_results.json 才會更新線上儀表板。
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from sklearn.metrics import confusion_matrix, roc_curve
+
+from calibration import brier_score, expected_calibration_error, fit_calibration_maps
+
+DASHBOARD_DATA_VERSION = 2
+DASHBOARD_DATA_PATH = os.path.join('..', 'dashboard', 'public', 'data', 'analysis_results.json')
+
+# 儀表板顯示的特徵重要性筆數
+TOP_FEATURES = 10
+
+# ROC 曲線對應的 rocCurveData 鍵
+ROC_MODELS = {'Random Forest': 'randomForest', 'Logistic Regression': 'logisticRegression'}
+
+# 特徵類別 (FeatureImportanceChart.vue 的 categoryColors)
+DEMOGRAPHIC_FEATURES = {'q1', 'q2', 'q3', 'q4'}
+PSYCHOLOGY_PREFIXES = ('q27_', 'q28_', 'q29_')
+
+# 出生年 (民國) 換算年齡的基準年
+REFERENCE_YEAR = 2024 - 1911
+
+# 聚類描述：依平均分數由低到高排名的顏色 (與 analysisData.js 內建的聚類顏色相同)
+CLUSTER_COLORS = ['#10b981', '#22c55e', '#3b82f6', '#f59e0b', '#ef4444']
+RISK_DESCRIPTIONS = {'low': '霸凌傾向較低', 'medium': '霸凌傾向中等', 'high': '霸凌傾向較高'}
+
+# 聚類命名的門檻
+MAJORITY_RATIO = 70          # 單一性別佔比 (%) 達此值即以該性別命名
+YOUNG_AGE, OLDER_AGE = 35, 50
+HEAVY_INTERNET_HOURS = 8
+
+
+def feature_category(feature):
+    """特徵類別：人口統計、心理特徵，其餘 (上網時間、平台使用與衍生特徵) 為行為特徵"""
+    if feature in DEMOGRAPHIC_FEATURES:
+        return 'demographic'
+    if feature.startswith(PSYCHOLOGY_PREFIXES):
+        return 'psychology'
+    return 'behavior'
+
+
+def _round(values, digits):
+    return [round(float(value), digits) for value in values]
+
+
+def _dataset_stats(analyzer):
+    """資料集統計摘要 (datasetStats，未加權的樣本描述)"""
+    df = analyzer.df
+    target = df['total_score']
+    age = REFERENCE_YEAR - df['q2'].dropna()
+    gender = df['q1'].value_counts(normalize=True)
+    return {
+        'totalSamples': int(len(df)),
+        'totalFeatures': int(df.shape[1]),
+        'targetVariable': 'total_score',
+        'targetStats': {
+            'mean': round(float(target.mean()), 2),
+            'std': round(float(target.std()), 2),
+            'min': round(float(target.min()), 2),
+            'max': round(float(target.max()), 2),
+            'q25': round(float(target.quantile(0.25)), 2),
+            'q50': round(float(target.quantile(0.50)), 2),
+            'q75': round(float(target.quantile(0.75)), 2)
+        },
+        'missingRate': round(float(df.isnull().to_numpy().mean() * 100), 2),
+        'genderRatio': {
+            'male': round(float(gender.get(1, 0) * 100), 1),
+            'female': round(float(gender.get(2, 0) * 100), 1)
+        },
+        'ageRange': {
+            'min': int(round(age.min())),
+            'max': int(round(age.max())),
+            'mean': int(round(age.mean()))
+        }
+    }
+
+
+def _roc_curves(analyzer):
+    """測試集 ROC 曲線 (rocCurveData)，只保留轉折點並取三位小數"""
+    curves = {}
+    for model_name, key in ROC_MODELS.items():
+        results = analyzer.clf_results.get(model_name)
+        if results is None:
+            continue
+        fpr, tpr, _ = roc_curve(analyzer.y_test_clf, results['y_prob'], drop_intermediate=True)
+        curves[key] = {'fpr': _round(fpr, 3), 'tpr': _round(tpr, 3), 'auc': round(float(results['auc']), 4)}
+    return curves
+
+
+def _confusion_matrix(analyzer):
+    """F1 最高模型的測試集混淆矩陣 (與 plot_classification_results 相同)"""
+    best_model = max(analyzer.clf_results, key=lambda name: analyzer.clf_results[name]['f1'])
+    tn, fp, fn, tp = confusion_matrix(analyzer.y_test_clf, analyzer.clf_results[best_model]['y_pred'],
+                                      labels=[0, 1]).ravel()
+    return {
+        'model': best_model,
+        'trueNegative': int(tn),
+        'falsePositive': int(fp),
+        'falseNegative': int(fn),
+        'truePositive': int(tp)
+    }
+
+
+def risk_levels(mean_scores):
+    """
+    依平均分數排名決定各群的風險等級
+
+    排名最高的 ceil(n/3) 群為 high、最低的 floor(n/3) 群為 low，其餘為 medium。
+    """
+    mean_scores = np.asarray(mean_scores, dtype=float)
+    n = len(mean_scores)
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[np.argsort(mean_scores, kind='mergesort')] = np.arange(n)
+    n_high = -(-n // 3)
+    return ['high' if rank >= n - n_high else 'low' if rank < n // 3 else 'medium' for rank in ranks]
+
+
+def describe_clusters(clusters):
+    """
+    由各群輪廓推導名稱、說明、風險等級與顏色 (就地加入 clusterResults 的欄位)
+
+    Parameters:
+    -----------
+    clusters : list of dict
+        含 meanScore、meanAge、femaleRatio、internetHours 的聚類摘要
+    """
+    levels = risk_levels([c['meanScore'] for c in clusters])
+    order = np.argsort([c['meanScore'] for c in clusters], kind='mergesort')
+    colors = {int(i): CLUSTER_COLORS[rank % len(CLUSTER_COLORS)] for rank, i in enumerate(order)}
+
+    for i, (c, level) in enumerate(zip(clusters, levels)):
+        if c['femaleRatio'] >= MAJORITY_RATIO:
+            gender = '女性'
+        elif c['femaleRatio'] <= 100 - MAJORITY_RATIO:
+            gender = '男性'
+        else:
+            gender = '男女混合'
+        if c['meanAge'] < YOUNG_AGE:
+            age = '年輕'
+        elif c['meanAge'] >= OLDER_AGE:
+            age = '年長'
+        else:
+            age = '中年'
+        heavy = c['internetHours'] >= HEAVY_INTERNET_HOURS
+
+        c['riskLevel'] = level
+        c['label'] = f"{age}{gender}{'重度上網' if heavy else ''}群"
+        c['description'] = (f"平均 {c['meanAge']} 歲，女性 {c['femaleRatio']}%，"
+                            f"每日上網 {c['internetHours']} 小時，{RISK_DESCRIPTIONS[level]}")
+        c['color'] = colors[i]
+
+    # 輪廓相近的群名稱相同時，依平均分數由低到高加上 A、B…
+    for label in {c['label'] for c in clusters}:
+        same = [c for c in clusters if c['label'] == label]
+        if len(same) > 1:
+            for k, c in enumerate(sorted(same, key=lambda c: c['meanScore'])):
+                c['label'] = f'{label} {chr(ord("A") + k)}'
+    return clusters
+
+
+def build_dashboard_data(analyzer, top_features=TOP_FEATURES):
+    """
+    整理儀表板所需的分析結果
+
+    Parameters:
+    -----------
+    analyzer : CyberbullyingMLAnalyzer
+        已完成分類模型訓練與 K-Means 聚類的分析器
+    top_features : int
+        匯出的特徵重要性筆數
+
+    Returns:
+    --------
+    dict
+        可直接序列化為 JSON 的儀表板資料
+    """
+    # 測試集上評分時實際輸出的 (校準後) 機率
+    calibration_maps = fit_calibration_maps(analyzer)
+    y_test = np.asarray(analyzer.y_test_clf, dtype=float)
+    served_prob = {name: calibration_maps[name](results['y_prob'])
+                   for name, results in analyzer.clf_results.items()}
+
+    classification = [
+        {
+            'model': name,
+            'accuracy': round(float(results['accuracy']), 4),
+            'f1Score': round(float(results['f1']), 4),
+            'aucRoc': round(float(results['auc']), 4),
+            'cvMean': round(float(results['cv_mean']), 4),
+            'cvStd': round(float(results['cv_std']), 4),
+            'calibration': calibration_maps[name].method,
+            'brier': round(float(brier_score(served_prob[name], y_test)), 4),
+            'ece': round(float(expected_calibration_error(served_prob[name], y_test)), 4)
+        }
+        for name, results in analyzer.clf_results.items()
+    ]
+
+    features = [
+        {
+            'feature': row.feature,
+            'name': analyzer.feature_names.get(row.feature, row.feature),
+            'importance': round(float(row.importance), 4),
+            'category': feature_category(row.feature)
+        }
+        for row in analyzer.rf_clf_importance.head(top_features).itertuples()
+    ]
+
+    clusters = [
+        {
+            'cluster': int(profile['cluster']),
+            'size': int(profile['n']),
+            'percentage': round(float(profile['share'] * 100), 1),
+            'meanScore': round(float(profile['score_mean']), 2),
+            'stdScore': None if np.isnan(profile['score_std']) else round(float(profile['score_std']), 2),
+            'meanAge': int(round(REFERENCE_YEAR - profile['birth_year'])),
+            'femaleRatio': round(float(profile['female_ratio'] * 100), 1),
+            'internetHours': round(float(profile['internet_hours']), 1)
+        }
+        for _, profile in analyzer.cluster_profiles().iterrows()
+    ]
+    describe_clusters(clusters)
+
+    return {
+        'version': DASHBOARD_DATA_VERSION,
+        'generatedAt': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'weighted': analyzer.sample_weight is not None,
+        'projectInfo': {
+            'sampleSize': int(len(analyzer.df)),
+            'features': int(len(analyzer.feature_cols))
+        },
+        'datasetStats': _dataset_stats(analyzer),
+        'classificationResults': classification,
+        'featureImportance': features,
+        'clusterResults': clusters,
+        'rocCurveData': _roc_curves(analyzer),
+        'confusionMatrix': _confusion_matrix(analyzer)
+    }
+
+
+def export_dashboard_data(analyzer, path=DASHBOARD_DATA_PATH):
+    """
+    輸出儀表板資料 JSON (精簡格式，先寫入暫存檔再取代)
+
+    Returns:
+    --------
+    str
+        輸出路徑
+    """
+    data = build_dashboard_data(analyzer)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,448 @@
+"""
+資料漂移監測
+=====================================
+以新一波問卷資料評分前，先確認輸入特徵的分布與 2021 年訓練資料一致。
+
+- 正式訓練時 (ml_models.py 的 main) 為每個特徵儲存精簡的參考分布：
+  分箱邊界與各箱次數 (含缺失值箱)，以及 101 點的分位數骨架 (quantile sketch)
+- 新資料以固定大小的區塊串流處理，每個區塊只累加各箱次數，記憶體用量固定
+- 計算 PSI、KS (於分位數骨架上近似) 與 Jensen-Shannon 距離，標記漂移的特徵
+- 門檻隨樣本數調整：指標須超過固定門檻 (實務上有意義的差異)，且在批次筆數下
+  顯著超出抽樣誤差 (KS 以雙樣本漸近 p 值，PSI/JS 以參考分布模擬的虛無分布，
+  並以 Bonferroni 校正特徵數)，小批次的抽樣波動不會被誤判為漂移
+
+所有特徵的分箱串接在同一組陣列中 (以位移區分)，每個區塊只需一次 bincount。
+StackingEnsemble 與 ModelArtifact 對原始問卷資料評分前會呼叫 check_scoring_batch，
+有特徵漂移時拋出例外，不會產生評分結果。
+"""
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_engineering import select_features
+from ml_models import OUTPUT_DIR
+
+DRIFT_REFERENCE_PATH = os.path.join(OUTPUT_DIR, 'drift_reference.npz')
+
+N_BINS = 10
+MAX_DISCRETE_VALUES = 20
+N_QUANTILES = 101
+CHUNK_SIZE = 200_000
+EPS = 1e-6
+
+# 漂移判定門檻 (最小效果量；另須通過下方的顯著性檢定)
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.2
+KS_DRIFT = 0.1
+JS_DRIFT = 0.1
+
+# 同分布批次被誤判為漂移的機率上限 (所有特徵合計，Bonferroni 校正)
+DRIFT_ALPHA = 0.01
+# PSI/JS 虛無分布的模擬：每批次數、最少模擬次數 (α/特徵數 × 次數) 與亂數種子
+NULL_BATCH_SIZE = 5000
+NULL_MIN_EXCEEDANCES = 20
+NULL_SEED = 0
+
+# 評分前漂移檢查的最少筆數 (筆數太少時分布指標沒有意義)
+MIN_CHECK_ROWS = 100
+
+# 訓練時的同分布檢查：訓練資料隨機子樣本被標記為漂移的比例上限
+FALSE_ALARM_BATCH_SIZES = (100, 200, 400)
+FALSE_ALARM_N_BATCHES = 20
+MAX_FALSE_ALARM_RATE = 0.05
+
+
+def _bin_edges(values):
+    """分箱邊界：離散變數取相鄰取值的中點，連續變數取十分位數"""
+    unique = np.unique(values)
+    if len(unique) <= MAX_DISCRETE_VALUES:
+        return (unique[:-1] + unique[1:]) / 2
+    return np.unique(np.quantile(values, np.linspace(0, 1, N_BINS + 1)[1:-1]))
+
+
+def _offsets(parts):
+    return np.cumsum([0] + [len(part) for part in parts])
+
+
+def _kl_divergence(p, m):
+    """KL(p || m)，以 2 為底，沿最後一軸加總 (m 在 p > 0 處必大於 0)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(p > 0, p * np.log2(p / m), 0.0)
+    return np.sum(terms, axis=-1)
+
+
+def _psi(p, q):
+    """Population Stability Index，沿最後一軸加總"""
+    p_eps, q_eps = np.maximum(p, EPS), np.maximum(q, EPS)
+    return np.sum((q_eps - p_eps) * np.log(q_eps / p_eps), axis=-1)
+
+
+def _js_distance(p, q):
+    """Jensen-Shannon 距離 (以 2 為底，介於 0 與 1)，沿最後一軸計算"""
+    m = (p + q) / 2
+    return np.sqrt(np.maximum((_kl_divergence(p, m) + _kl_divergence(q, m)) / 2, 0.0))
+
+
+def _ks_p_value(ks, n_ref, n_new):
+    """雙樣本 KS 的漸近 p 值 (離散特徵時偏保守)"""
+    if n_ref == 0 or n_new == 0:
+        return 1.0
+    effective_n = n_ref * n_new / (n_ref + n_new)
+    return float(min(1.0, 2 * np.exp(-2 * ks ** 2 * effective_n)))
+
+
+def _null_p_values(rng, probs, n_ref, n_new, observed, alpha):
+    """
+    以參考分布模擬「兩邊同分布」時的 PSI 與 JS 距離，估計觀察值的 Monte Carlo p 值
+
+    參考資料與新資料各自以 Poisson 近似多項抽樣 (n_ref、n_new 筆)，
+    涵蓋稀有箱在小批次中為 0 的情形 (PSI 以 EPS 平滑時會明顯放大)。
+    分批模擬，超過門檻的次數已無法達到 alpha 時提早停止。
+
+    Parameters:
+    -----------
+    rng : numpy.random.Generator
+        亂數產生器
+    probs : ndarray
+        參考分布各箱比例
+    n_ref, n_new : int
+        參考資料與新資料的筆數
+    observed : dict
+        指標名稱 ('psi' / 'js_distance') → 觀察值，只估計其中的指標
+    alpha : float
+        單一特徵的顯著水準
+
+    Returns:
+    --------
+    dict
+        指標名稱 → p 值
+    """
+    metrics = {'psi': _psi, 'js_distance': _js_distance}
+    max_simulations = int(np.ceil(NULL_MIN_EXCEEDANCES / alpha))
+    # 模擬完成時 p 值 <= alpha 所容許的超過次數
+    allowed = alpha * (max_simulations + 1) - 1
+    exceed = dict.fromkeys(observed, 0)
+    total = 0
+    while total < max_simulations:
+        size = min(NULL_BATCH_SIZE, max_simulations - total)
+        ref = rng.poisson(probs * n_ref, size=(size, len(probs)))
+        new = rng.poisson(probs * n_new, size=(size, len(probs)))
+        p = ref / np.maximum(ref.sum(axis=1, keepdims=True), 1)
+        q = new / np.maximum(new.sum(axis=1, keepdims=True), 1)
+        for name, value in observed.items():
+            exceed[name] += int((metrics[name](p, q) >= value).sum())
+        total += size
+        if all(count > allowed for count in exceed.values()):
+            break
+    return {name: (1 + count) / (1 + total) for name, count in exceed.items()}
+
+
+class DriftReference:
+    """訓練資料的參考分布 (所有特徵串接於扁平陣列)"""
+
+    def __init__(self, feature_cols, edges, edge_offsets, counts, count_offsets,
+                 grid, grid_offsets, grid_cdf, n_rows, feature_params=None):
+        self.feature_cols = list(feature_cols)
+        # 訓練時的特徵工程參數 (feature_engineering.fit_feature_params)，補算衍生特徵時沿用
+        self.feature_params = feature_params or {}
+        self.edges = np.asarray(edges, dtype=float)
+        self.edge_offsets = np.asarray(edge_offsets, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.count_offsets = np.asarray(count_offsets, dtype=np.int64)
+        self.grid = np.asarray(grid, dtype=float)
+        self.grid_offsets = np.asarray(grid_offsets, dtype=np.int64)
+        self.grid_cdf = np.asarray(grid_cdf, dtype=float)
+        self.n_rows = int(n_rows)
+
+    @classmethod
+    def from_frame(cls, X, feature_params=None):
+        """
+        由訓練特徵建立參考分布
+
+        Parameters:
+        -----------
+        X : DataFrame
+            訓練特徵 (可含缺失值，缺失值計入最後一個箱)
+        feature_params : dict or None
+            訓練時的特徵工程參數
+        """
+        edges, counts, grids, cdfs = [], [], [], []
+        for col in X.columns:
+            values = X[col].to_numpy(dtype=float)
+            observed = values[~np.isnan(values)]
+            col_edges = _bin_edges(observed)
+            # 箱數 = 邊界數 + 1，再加一個缺失值箱
+            bins = np.searchsorted(col_edges, observed, side='right')
+            col_counts = np.bincount(bins, minlength=len(col_edges) + 1)
+            col_counts = np.append(col_counts, np.isnan(values).sum())
+
+            grid = np.unique(np.quantile(observed, np.linspace(0, 1, N_QUANTILES)))
+            cdf = np.searchsorted(np.sort(observed), grid, side='right') / len(observed)
+
+            edges.append(col_edges)
+            counts.append(col_counts)
+            grids.append(grid)
+            cdfs.append(cdf)
+
+        return cls(X.columns, np.concatenate(edges), _offsets(edges),
+                   np.concatenate(counts), _offsets(counts),
+                   np.concatenate(grids), _offsets(grids), np.concatenate(cdfs), len(X),
+                   feature_params)
+
+    def save(self, path=DRIFT_REFERENCE_PATH):
+        np.savez(path, feature_cols=np.array(self.feature_cols, dtype=str),
+                 edges=self.edges, edge_offsets=self.edge_offsets,
+                 counts=self.counts, count_offsets=self.count_offsets,
+                 grid=self.grid, grid_offsets=self.grid_offsets, grid_cdf=self.grid_cdf,
+                 n_rows=self.n_rows, feature_params=json.dumps(self.feature_params))
+        return path
+
+    @classmethod
+    def load(cls, path=DRIFT_REFERENCE_PATH):
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+        if 'feature_params' in arrays:
+            arrays['feature_params'] = json.loads(str(arrays['feature_params']))
+        return cls(**arrays)
+
+
+class DriftAccumulator:
+    """以區塊串流累加新資料的分箱次數與分位數骨架次數，記憶體用量與資料筆數無關"""
+
+    def __init__(self, reference):
+        self.reference = reference
+        self.counts = np.zeros_like(reference.counts)
+        self.grid_counts = np.zeros(len(reference.grid), dtype=np.int64)
+        self.observed = np.zeros(len(reference.feature_cols), dtype=np.int64)
+        self.n_rows = 0
+
+    def update(self, chunk):
+        """累加一個區塊 (DataFrame，需包含 reference.feature_cols)"""
+        ref = self.reference
+        values = chunk[ref.feature_cols].to_numpy(dtype=float)
+        bin_index = np.empty(values.shape, dtype=np.int64)
+        grid_index = np.empty(values.shape, dtype=np.int64)
+
+        for j in range(values.shape[1]):
+            col = values[:, j]
+            missing = np.isnan(col)
+            edges = ref.edges[ref.edge_offsets[j]:ref.edge_offsets[j + 1]]
+            grid = ref.grid[ref.grid_offsets[j]:ref.grid_offsets[j + 1]]
+
+            # 缺失值落在最後一個箱；NaN 在 searchsorted 中排在最後，分位數骨架以哨兵值略過
+            bins = np.searchsorted(edges, col, side='right')
+            bin_index[:, j] = np.where(missing, len(edges) + 1, bins) + ref.count_offsets[j]
+            # 小於等於 grid[k] 的筆數 = 落在位置 <= k 的筆數，之後以累積和還原
+            positions = np.searchsorted(grid, col, side='left')
+            grid_index[:, j] = np.where(missing | (positions >= len(grid)), -1,
+                                        positions + ref.grid_offsets[j])
+            self.observed[j] += (~missing).sum()
+
+        self.counts += np.bincount(bin_index.ravel(), minlength=len(self.counts))
+        valid = grid_index[grid_index >= 0]
+        self.grid_counts += np.bincount(valid, minlength=len(self.grid_counts))
+        self.n_rows += len(values)
+        return self
+
+    def report(self, alpha=DRIFT_ALPHA, random_state=NULL_SEED):
+        """
+        計算各特徵的 PSI、KS、JS 距離與缺失率變化
+
+        指標超過固定門檻只代表差異夠大；另須在新資料的筆數下顯著 (p 值 <= alpha / 特徵數)
+        才判為漂移，否則為警示。未超過固定門檻的指標不做檢定 (p 值記為 1)。
+
+        Parameters:
+        -----------
+        alpha : float
+            同分布資料有任一特徵被判為漂移的機率上限
+        random_state : int
+            PSI/JS 虛無分布模擬的亂數種子 (相同資料得到相同報告)
+        """
+        ref = self.reference
+        rng = np.random.default_rng(random_state)
+        feature_alpha = alpha / len(ref.feature_cols)
+        rows = []
+        for j, col in enumerate(ref.feature_cols):
+            start, stop = ref.count_offsets[j], ref.count_offsets[j + 1]
+            ref_counts, new_counts = ref.counts[start:stop], self.counts[start:stop]
+            p = ref_counts / max(ref_counts.sum(), 1)
+            q = new_counts / max(new_counts.sum(), 1)
+            psi, js = float(_psi(p, q)), float(_js_distance(p, q))
+
+            g_start, g_stop = ref.grid_offsets[j], ref.grid_offsets[j + 1]
+            new_cdf = np.cumsum(self.grid_counts[g_start:g_stop]) / max(self.observed[j], 1)
+            ks = float(np.max(np.abs(new_cdf - ref.grid_cdf[g_start:g_stop])))
+
+            p_value = 1.0
+            if ks >= KS_DRIFT:
+                # 參考資料的非缺失筆數 = 缺失值箱以外的次數
+                p_value = _ks_p_value(ks, ref_counts[:-1].sum(), self.observed[j])
+            exceeded = {name: value for name, value, cutoff in
+                        (('psi', psi, PSI_DRIFT), ('js_distance', js, JS_DRIFT)) if value >= cutoff}
+            if exceeded:
+                p_values = _null_p_values(rng, p, ref_counts.sum(), new_counts.sum(), exceeded, feature_alpha)
+                p_value = min(p_value, *p_values.values())
+
+            status = 'ok'
+            if p_value <= feature_alpha:
+                status = 'drift'
+            elif psi >= PSI_WARNING or ks >= KS_DRIFT or js >= JS_DRIFT:
+                status = 'warning'
+
+            rows.append({'feature': col, 'psi': psi, 'ks': ks, 'js_distance': js, 'p_value': p_value,
+                         'missing_ref': p[-1], 'missing_new': q[-1], 'status': status})
+        return pd.DataFrame(rows)
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """DataFrame 依固定大小切塊；可迭代物件 (例如 pd.read_csv(chunksize=...)) 直接沿用"""
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+    else:
+        yield from data
+
+
+def check_drift(data, reference=None, chunk_size=CHUNK_SIZE, feature_builder=None):
+    """
+    以串流方式比較新資料與參考分布
+
+    Parameters:
+    -----------
+    data : DataFrame or iterable of DataFrame
+        新資料 (原始問卷欄位)
+    reference : DriftReference or None
+        None 時讀取 DRIFT_REFERENCE_PATH
+    chunk_size : int
+        區塊大小
+    feature_builder : callable or None
+        區塊 → 特徵 DataFrame (例如補算衍生特徵)；None 表示直接取欄位
+
+    Returns:
+    --------
+    DataFrame
+        各特徵的漂移指標與狀態 (ok / warning / drift)
+    """
+    reference = reference or DriftReference.load()
+    accumulator = DriftAccumulator(reference)
+    for chunk in iter_chunks(data, chunk_size):
+        if feature_builder is not None:
+            chunk = feature_builder(chunk)
+        accumulator.update(chunk)
+    return accumulator.report()
+
+
+def assert_no_drift(report):
+    """有特徵漂移時拋出例外，避免在發布評分結果前遺漏"""
+    drifted = report.loc[report['status'] == 'drift', 'feature'].tolist()
+    if drifted:
+        raise ValueError(f"輸入資料分布漂移，暫停發布評分: {', '.join(drifted)}")
+
+
+def check_scoring_batch(X, feature_cols, feature_params=None, reference=None, min_rows=MIN_CHECK_ROWS):
+    """
+    評分前的漂移檢查 (StackingEnsemble、ModelArtifact 對原始問卷資料評分時呼叫)
+
+    Parameters:
+    -----------
+    X : DataFrame
+        待評分的原始問卷資料
+    feature_cols : list of str
+        模型的特徵欄位，必須與參考分布相同
+    feature_params : dict or None
+        模型的特徵工程參數 (補算衍生特徵用)；None 時沿用參考分布保存的參數
+    reference : DriftReference or None
+        None 時讀取 DRIFT_REFERENCE_PATH (由 ml_models.py 的 main 儲存)
+    min_rows : int
+        筆數少於此值時略過檢查
+
+    Returns:
+    --------
+    DataFrame or None
+        漂移報告；筆數不足而略過時為 None。有特徵漂移時拋出例外
+    """
+    if len(X) < min_rows:
+        print(f"評分資料只有 {len(X)} 筆 (少於 {min_rows} 筆)，略過漂移檢查")
+        return None
+
+    reference = reference or DriftReference.load()
+    if list(reference.feature_cols) != list(feature_cols):
+        raise ValueError("漂移參考分布的特徵與模型不一致，請重新執行 ml_models.py 後再評分")
+
+    params = reference.feature_params if feature_params is None else feature_params
+    report = check_drift(X, reference,
+                         feature_builder=lambda chunk: select_features(chunk, reference.feature_cols, params))
+    assert_no_drift(report)
+    return report
+
+
+def false_alarm_rates(X, reference, batch_sizes=FALSE_ALARM_BATCH_SIZES,
+                      n_batches=FALSE_ALARM_N_BATCHES, random_state=0):
+    """
+    同分布檢查：訓練特徵的隨機子樣本與參考分布同分布，不應被判為漂移
+
+    Parameters:
+    -----------
+    X : DataFrame
+        訓練特徵 (建立參考分布的同一份資料)
+    reference : DriftReference
+        參考分布
+    batch_sizes : tuple of int
+        子樣本筆數
+    n_batches : int
+        每種筆數的子樣本數
+    random_state : int
+        抽樣的亂數種子
+
+    Returns:
+    --------
+    DataFrame
+        各子樣本筆數被判為漂移的比例
+    """
+    rng = np.random.default_rng(random_state)
+    rows = []
+    for size in batch_sizes:
+        flagged = 0
+        for _ in range(n_batches):
+            batch = X.iloc[rng.choice(len(X), size=min(size, len(X)), replace=False)]
+            report = DriftAccumulator(reference).update(batch).report()
+            flagged += int((report['status'] == 'drift').any())
+        rows.append({'batch_size': size, 'flagged': flagged, 'false_alarm_rate': flagged / n_batches})
+    return pd.DataFrame(rows)
+
+
+def main():
+    """主程式：python drift_monitor.py <新一波資料.csv>"""
+    print("=" * 60)
+    print("資料漂移監測")
+    print("=" * 60)
+
+    reference = DriftReference.load()
+    data_path = sys.argv[1] if len(sys.argv) > 1 else '../data/processed_data_with_score.csv'
+    print(f"參考資料: {reference.n_rows} 筆，{len(reference.feature_cols)} 個特徵")
+    print(f"新資料: {data_path}")
+
+    start = time.perf_counter()
+    report = check_drift(pd.read_csv(data_path, chunksize=CHUNK_SIZE), reference,
+                         feature_builder=lambda chunk: select_features(chunk, reference.feature_cols,
+                                                                       reference.feature_params))
+    print(f"耗時: {time.perf_counter() - start:.2f} 秒")
+
+    print(report.round(4).to_string(index=False))
+    report.to_csv(os.path.join(OUTPUT_DIR, 'drift_report.csv'), index=False, encoding='utf-8-sig')
+
+    flagged = report[report['status'] != 'ok']
+    print(f"\n漂移: {(report['status'] == 'drift').sum()} 個，警示: {(report['status'] == 'warning').sum()} 個")
+    if len(flagged):
+        print(flagged[['feature', 'psi', 'ks', 'js_distance', 'p_value', 'status']].round(4).to_string(index=False))
+
+    return report
+
+
+if __name__ == "__main__":
+    report = main()
@@ -0,0 +1,216 @@
+"""
+特徵工程 - 平台使用彙總特徵
+=====================================
+q9_* (即時通訊)、q10_* (社群媒體)、q11_* (影音平台) 為逐一平台的 0/1 虛擬變數。
+本模組以一次 NumPy 運算衍生：
+
+- 各類別使用的平台數與平台總數
+- 平台類別多樣性 (三類平台數占比的 Shannon entropy)
+- 與每日上網時間 (q7) 的交互作用
+
+特徵工程以步驟 (step) 註冊於 FEATURE_STEPS，每個步驟的輸出依輸入欄位內容的
+雜湊值快取；prepare_features 只計算一次，分類、回歸與聚類共用同一份特徵矩陣。
+
+需要由資料估計的參數 (例如 q7 缺失值的填補中位數) 只在訓練資料上以 fit_feature_params
+估計一次，隨模型保存；評分時沿用訓練參數，不以評分批次本身重新估計。
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+FEATURE_CACHE_DIR = os.path.join('output', 'feature_cache')
+
+# 特徵定義變更時遞增，使舊快取失效
+FEATURE_VERSION = 1
+
+# 平台類別 (欄位前綴)；*_90 為「都沒有使用」選項，不列入平台數
+PLATFORM_GROUPS = {
+    'messaging': 'q9_',
+    'social': 'q10_',
+    'video': 'q11_'
+}
+
+PLATFORM_FEATURE_NAMES = {
+    'n_messaging': '即時通訊平台數',
+    'n_social': '社群媒體平台數',
+    'n_video': '影音平台數',
+    'n_platforms': '平台總數',
+    'platform_entropy': '平台類別多樣性',
+    'q7_x_n_messaging': '上網時間×即時通訊平台數',
+    'q7_x_n_social': '上網時間×社群媒體平台數',
+    'q7_x_n_video': '上網時間×影音平台數',
+    'q7_x_n_platforms': '上網時間×平台總數'
+}
+
+
+def platform_columns(columns):
+    """依類別取得平台虛擬變數欄位"""
+    return {group: [col for col in columns if col.startswith(prefix) and col != f'{prefix}90']
+            for group, prefix in PLATFORM_GROUPS.items()}
+
+
+def platform_feature_params(df):
+    """平台彙總特徵的訓練參數：q7 缺失值的填補中位數"""
+    return {'q7_median': float(np.nanmedian(df['q7'].to_numpy(dtype=float)))}
+
+
+def platform_aggregate_features(df, q7_median=None):
+    """
+    平台數、類別多樣性與上網時間交互作用
+
+    Parameters:
+    -----------
+    df : DataFrame
+        原始問卷資料 (需包含 q7 與 q9_/q10_/q11_ 欄位)
+    q7_median : float or None
+        q7 缺失值的填補值 (訓練資料的中位數)；None 時以 df 本身估計
+
+    Returns:
+    --------
+    DataFrame
+        與 df 同索引的衍生特徵
+    """
+    groups = platform_columns(df.columns)
+    cols = [col for group_cols in groups.values() for col in group_cols]
+
+    # 平台矩陣 (n × p) 乘上類別指示矩陣 (p × 3)，一次得到各類別平台數
+    usage = np.nan_to_num(df[cols].to_numpy(dtype=float))
+    membership = np.zeros((len(cols), len(groups)))
+    start = 0
+    for j, group_cols in enumerate(groups.values()):
+        membership[start:start + len(group_cols), j] = 1
+        start += len(group_cols)
+    counts = usage @ membership
+    total = counts.sum(axis=1)
+
+    # 各類別占比的 entropy，未使用任何平台者為 0
+    share = np.divide(counts, total[:, None], out=np.zeros_like(counts), where=total[:, None] > 0)
+    entropy = -np.sum(share * np.log(share, out=np.zeros_like(share), where=share > 0), axis=1)
+
+    q7 = df['q7'].to_numpy(dtype=float)
+    if q7_median is None:
+        q7_median = platform_feature_params(df)['q7_median']
+    q7 = np.where(np.isnan(q7), q7_median, q7)
+    counts_all = np.column_stack([counts, total])
+    interactions = q7[:, None] * counts_all
+
+    names = [f'n_{group}' for group in groups] + ['n_platforms']
+    values = np.column_stack([counts_all, entropy, interactions])
+    columns = names + ['platform_entropy'] + [f'q7_x_{name}' for name in names]
+    return pd.DataFrame(values, index=df.index, columns=columns)
+
+
+def _platform_inputs(df):
+    groups = platform_columns(df.columns)
+    return ['q7'] + [col for group_cols in groups.values() for col in group_cols]
+
+
+# 註冊的特徵工程步驟：名稱 -> (輸入欄位函數, 特徵函數, 特徵中文名稱, 訓練參數估計函數)
+FEATURE_STEPS = {
+    'platform_aggregates': (_platform_inputs, platform_aggregate_features, PLATFORM_FEATURE_NAMES,
+                            platform_feature_params)
+}
+
+
+def fit_feature_params(df, steps=None):
+    """
+    由訓練資料估計各步驟的參數 (隨模型保存，評分時傳回 build_engineered_features / select_features)
+
+    Returns:
+    --------
+    dict
+        步驟名稱 -> 參數 dict (皆為 JSON 可序列化的純量)
+    """
+    steps = list(FEATURE_STEPS) if steps is None else steps
+    return {step_name: FEATURE_STEPS[step_name][3](df) for step_name in steps}
+
+
+def input_hash(df, columns, step_name, params=None):
+    """以輸入欄位名稱、內容與步驟參數計算雜湊值，作為快取鍵"""
+    digest = hashlib.sha256(f'{step_name}:{FEATURE_VERSION}:{",".join(columns)}'.encode('utf-8'))
+    digest.update(np.ascontiguousarray(df[columns].to_numpy(dtype=float)).tobytes())
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def build_engineered_features(df, steps=None, cache_dir=FEATURE_CACHE_DIR, params=None):
+    """
+    執行特徵工程步驟，輸出依輸入雜湊快取
+
+    Parameters:
+    -----------
+    df : DataFrame
+        原始問卷資料
+    steps : list of str or None
+        要執行的步驟名稱，None 表示全部已註冊步驟
+    cache_dir : str or None
+        快取資料夾，None 表示不快取
+    params : dict or None
+        fit_feature_params 的結果 (訓練參數)；未提供的步驟以 df 本身估計
+
+    Returns:
+    --------
+    features : DataFrame
+        所有步驟的衍生特徵
+    feature_names : dict
+        特徵欄位 -> 中文名稱
+    """
+    steps = list(FEATURE_STEPS) if steps is None else steps
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    parts = []
+    feature_names = {}
+    for step_name in steps:
+        input_columns, build, names, fit_params = FEATURE_STEPS[step_name]
+        columns = input_columns(df)
+        step_params = (params or {}).get(step_name) or fit_params(df)
+        cache_path = (os.path.join(cache_dir, f'{step_name}_{input_hash(df, columns, step_name, step_params)}.npz')
+                      if cache_dir else None)
+
+        if cache_path and os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as cached:
+                features = pd.DataFrame(cached['values'], index=df.index,
+                                        columns=[str(col) for col in cached['columns']])
+            print(f"特徵工程 [{step_name}]: 使用快取 {cache_path}")
+        else:
+            features = build(df, **step_params)
+            if cache_path:
+                np.savez(cache_path, values=features.to_numpy(), columns=np.array(features.columns, dtype=str))
+                print(f"特徵工程 [{step_name}]: 新增 {features.shape[1]} 個特徵")
+
+        parts.append(features)
+        feature_names.update(names)
+
+    return pd.concat(parts, axis=1), feature_names
+
+
+def select_features(df, feature_cols, params=None):
+    """
+    依 feature_cols 取出特徵；缺少的衍生特徵由原始欄位即時計算 (評分新資料時使用，不快取)
+
+    Parameters:
+    -----------
+    df : DataFrame
+        原始問卷資料 (可只含原始欄位)
+    feature_cols : list of str
+        模型訓練時的特徵欄位
+    params : dict or None
+        訓練時的特徵工程參數 (fit_feature_params)；評分時應提供，
+        否則缺失值以評分批次本身的統計量填補
+
+    Returns:
+    --------
+    DataFrame
+    """
+    missing = [col for col in feature_cols if col not in df.columns]
+    if missing:
+        steps = [name for name, (_, _, names, _) in FEATURE_STEPS.items()
+                 if any(col in names for col in missing)]
+        engineered, _ = build_engineered_features(df, steps=steps, cache_dir=None, params=params)
+        df = pd.concat([df, engineered[[col for col in engineered.columns if col in missing]]], axis=1)
+    return df[feature_cols]
@@ -0,0 +1,285 @@
+"""
+自動特徵選取
+=====================================
+目前約 40 個特徵全部投入每個模型，且 q9/q10/q11 中有一半的平台在 672 筆樣本裡幾乎無人使用。
+
+選取流程 (全部只使用分類訓練集列，fold 也在訓練集內分割，測試集保留給
+train_classification_models 評估選出的特徵)：
+1. 變異數 / 低頻過濾：去除變異數過小或 0/1 變數中少數類別比例過低的特徵
+2. 互資訊 (mutual information)：每個 fold 只在訓練列計算一次，作為特徵排序的參考
+3. 遞迴特徵消去 (RFE)：每個 fold 保留一個 warm start 的邏輯迴歸，
+   移除特徵後以剩餘欄位的係數作為下一次擬合的起點，收斂只需少量迭代
+
+每個特徵子集的評估結果 (各 fold AUC 與係數重要性) 依子集內容快取於 JSON，
+搜尋中回到評估過的子集時直接讀取，不重新擬合。
+選出的特徵寫入 output/selected_features.json，prepare_features 會自動套用。
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_selection import mutual_info_classif
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import roc_auc_score
+
+from ml_models import CyberbullyingMLAnalyzer, OUTPUT_DIR, SELECTED_FEATURES_PATH
+
+SELECTION_DIR = os.path.join(OUTPUT_DIR, 'feature_selection')
+SUBSET_CACHE_PATH = os.path.join(SELECTION_DIR, 'subset_scores.json')
+
+MIN_VARIANCE = 1e-3
+MIN_FREQUENCY = 0.02   # 0/1 變數少數類別比例下限 (672 筆約 13 人)
+
+
+def variance_filter(X, feature_cols, min_variance=MIN_VARIANCE, min_frequency=MIN_FREQUENCY):
+    """
+    變異數與低頻過濾
+
+    Returns:
+    --------
+    kept : list of str
+        保留的特徵
+    report : DataFrame
+        各特徵的變異數、少數類別比例與是否保留
+    """
+    X = np.asarray(X, dtype=float)
+    variance = X.var(axis=0)
+    binary = np.all((X == 0) | (X == 1), axis=0)
+    minority = np.where(binary, np.minimum(X.mean(axis=0), 1 - X.mean(axis=0)), np.nan)
+
+    keep = (variance >= min_variance) & ~(binary & (minority < min_frequency))
+    report = pd.DataFrame({'feature': feature_cols, 'variance': variance,
+                           'binary': binary, 'minority_rate': minority, 'kept': keep})
+    return [col for col, k in zip(feature_cols, keep) if k], report
+
+
+def fold_mutual_information(X, y, cv_splits, discrete_mask=None, random_state=42):
+    """每個 fold 以訓練列計算一次互資訊，回傳 (fold 數 × 特徵數)"""
+    return np.vstack([
+        mutual_info_classif(X[train_idx], y[train_idx], discrete_features=discrete_mask,
+                            random_state=random_state)
+        for train_idx, _ in cv_splits
+    ])
+
+
+def subset_key(features):
+    """特徵子集的快取鍵 (與順序無關)"""
+    return hashlib.sha256('|'.join(sorted(features)).encode('utf-8')).hexdigest()[:16]
+
+
+class SubsetScoreCache:
+    """特徵子集評估結果的 JSON 快取"""
+
+    def __init__(self, path=SUBSET_CACHE_PATH, context=''):
+        """
+        Parameters:
+        -----------
+        path : str
+            快取檔
+        context : str
+            資料、fold 與模型設定的識別字串，設定不同時不共用快取
+        """
+        self.path = path
+        self.context = context
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('context') == context:
+                self.entries = stored['entries']
+
+    def get(self, features):
+        return self.entries.get(subset_key(features))
+
+    def put(self, features, result):
+        self.entries[subset_key(features)] = result
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'context': self.context, 'entries': self.entries}, f, ensure_ascii=False)
+
+
+class WarmStartRFE:
+    """以 warm start 邏輯迴歸進行遞迴特徵消去，子集評估結果快取"""
+
+    def __init__(self, X, y, feature_cols, cv_splits, cache, C=1.0, random_state=42):
+        self.X = np.asarray(X, dtype=float)
+        self.y = np.asarray(y)
+        self.feature_cols = list(feature_cols)
+        self.column_index = {col: j for j, col in enumerate(self.feature_cols)}
+        self.cv_splits = cv_splits
+        self.cache = cache
+        self.C = C
+        self.random_state = random_state
+        # 每個 fold 一個模型，係數在消去過程中延續
+        self.fold_models = [None] * len(cv_splits)
+        self.fold_features = [None] * len(cv_splits)
+
+    def _fold_model(self, fold, features):
+        model = self.fold_models[fold]
+        if model is None:
+            model = LogisticRegression(C=self.C, class_weight='balanced', max_iter=1000,
+                                       warm_start=True, random_state=self.random_state)
+            self.fold_models[fold] = model
+        elif self.fold_features[fold] is not None:
+            # 以上一個子集的係數作為起點：保留仍在子集中的欄位，新增欄位由 0 開始
+            previous = {col: j for j, col in enumerate(self.fold_features[fold])}
+            coef = np.array([[model.coef_[0, previous[col]] if col in previous else 0.0
+                              for col in features]])
+            model.coef_ = coef
+        self.fold_features[fold] = list(features)
+        return model
+
+    def evaluate(self, features):
+        """評估特徵子集：各 fold 的 AUC 與平均係數絕對值 (快取)"""
+        cached = self.cache.get(features)
+        if cached is not None:
+            return cached
+
+        columns = [self.column_index[col] for col in features]
+        aucs, importance = [], []
+        for fold, (train_idx, test_idx) in enumerate(self.cv_splits):
+            model = self._fold_model(fold, features)
+            model.fit(self.X[np.ix_(train_idx, columns)], self.y[train_idx])
+            prob = model.predict_proba(self.X[np.ix_(test_idx, columns)])[:, 1]
+            aucs.append(roc_auc_score(self.y[test_idx], prob))
+            importance.append(np.abs(model.coef_[0]))
+
+        result = {'features': list(features), 'fold_auc': aucs,
+                  'importance': np.mean(importance, axis=0).tolist()}
+        self.cache.put(features, result)
+        return result
+
+    def run(self, start_features, min_features=5, tie_breaker=None):
+        """
+        由 start_features 開始，每次移除係數重要性最低的特徵
+
+        Parameters:
+        -----------
+        tie_breaker : dict or None
+            特徵 -> 次要排序分數 (例如互資訊)，重要性相同時先移除分數較低者
+
+        Returns:
+        --------
+        DataFrame
+            每一步的特徵數、平均 AUC、標準誤與移除的特徵
+        """
+        tie_breaker = tie_breaker or {}
+        features = list(start_features)
+        path = []
+        while True:
+            result = self.evaluate(features)
+            aucs = np.array(result['fold_auc'])
+            step = {'n_features': len(features), 'auc_mean': aucs.mean(),
+                    'auc_se': aucs.std(ddof=1) / np.sqrt(len(aucs)),
+                    'features': list(features), 'removed': None}
+            path.append(step)
+            if len(features) <= min_features:
+                break
+
+            order = sorted(range(len(features)),
+                           key=lambda j: (result['importance'][j], tie_breaker.get(features[j], 0.0)))
+            step['removed'] = features[order[0]]
+            features = [col for j, col in enumerate(features) if j != order[0]]
+
+        return pd.DataFrame(path)
+
+
+def run_feature_selection(analyzer, min_features=5, one_se_rule=True):
+    """
+    執行完整的特徵選取流程
+
+    Parameters:
+    -----------
+    analyzer : CyberbullyingMLAnalyzer
+        已執行 prepare_features (建議 use_selected_features=False，由全部特徵開始)
+    min_features : int
+        遞迴消去的最少特徵數
+    one_se_rule : bool
+        True 時選擇平均 AUC 在最佳值一個標準誤內、特徵數最少的子集
+
+    Returns:
+    --------
+    selected : list of str
+    path : DataFrame
+        遞迴消去路徑
+    report : DataFrame
+        各特徵的過濾與互資訊結果
+    """
+    X = analyzer.X_scaled
+    raw = analyzer.X[analyzer.feature_cols].to_numpy(dtype=float)
+    y = analyzer.y_binary.to_numpy()
+
+    # 與 train_classification_models 相同的分割；fold 的列位置都在訓練集內
+    analyzer.clf_train_idx, analyzer.clf_test_idx = analyzer._classification_split()
+    train_idx = analyzer.clf_train_idx
+    cv_splits = analyzer._classification_cv_splits()
+    print(f"特徵選取使用訓練集 {len(train_idx)} 筆 (保留測試集 {len(analyzer.clf_test_idx)} 筆)")
+
+    # 1. 變異數 / 低頻過濾 (以訓練集標準化前的原始值判斷)
+    kept, report = variance_filter(raw[train_idx], analyzer.feature_cols)
+    print(f"變異數 / 低頻過濾: {len(analyzer.feature_cols)} → {len(kept)} 個特徵")
+
+    # 2. 各 fold 的互資訊 (只計算一次)
+    discrete = report['binary'].to_numpy()
+    mi = fold_mutual_information(X, y, cv_splits, discrete_mask=discrete,
+                                 random_state=analyzer.random_state)
+    report['mutual_info'] = mi.mean(axis=0)
+    report['mutual_info_std'] = mi.std(axis=0)
+    mi_lookup = dict(zip(analyzer.feature_cols, report['mutual_info']))
+
+    # 3. warm start 遞迴特徵消去
+    context = hashlib.sha256(
+        np.ascontiguousarray(X[train_idx]).tobytes() + y[train_idx].tobytes() +
+        np.concatenate([test_idx for _, test_idx in cv_splits]).tobytes() +
+        '|'.join(analyzer.feature_cols).encode('utf-8')
+    ).hexdigest()[:16]
+    cache = SubsetScoreCache(context=context)
+    rfe = WarmStartRFE(X, y, analyzer.feature_cols, cv_splits, cache,
+                       random_state=analyzer.random_state)
+    path = rfe.run(kept, min_features=min_features, tie_breaker=mi_lookup)
+
+    best = path['auc_mean'].idxmax()
+    if one_se_rule:
+        limit = path.loc[best, 'auc_mean'] - path.loc[best, 'auc_se']
+        best = path[path['auc_mean'] >= limit]['n_features'].idxmin()
+    selected = path.loc[best, 'features']
+
+    report['selected'] = report['feature'].isin(selected)
+    return selected, path, report
+
+
+def main():
+    """主程式"""
+    print("=" * 60)
+    print("自動特徵選取")
+    print("=" * 60)
+
+    analyzer = CyberbullyingMLAnalyzer('../data/processed_data_with_score.csv')
+    analyzer.prepare_features(use_selected_features=False)
+
+    selected, path, report = run_feature_selection(analyzer)
+
+    os.makedirs(SELECTION_DIR, exist_ok=True)
+    path.drop(columns='features').to_csv(os.path.join(SELECTION_DIR, 'rfe_path.csv'),
+                                         index=False, encoding='utf-8-sig')
+    report.to_csv(os.path.join(SELECTION_DIR, 'feature_report.csv'),
+                  index=False, encoding='utf-8-sig')
+
+    print("\n【遞迴消去路徑】")
+    print(path[['n_features', 'auc_mean', 'auc_se', 'removed']].round(4).to_string(index=False))
+
+    print(f"\n選出 {len(selected)} 個特徵:")
+    print("  " + ", ".join(analyzer.feature_names.get(col, col) for col in selected))
+
+    with open(SELECTED_FEATURES_PATH, 'w', encoding='utf-8') as f:
+        json.dump(selected, f, ensure_ascii=False, indent=2)
+    print(f"已儲存: {SELECTED_FEATURES_PATH}")
+
+    return selected
+
+
+if __name__ == "__main__":
+    selected = main()
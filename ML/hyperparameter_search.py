@@ -0,0 +1,354 @@
+"""
+超參數搜尋 - Hyperband / Successive Halving
+=====================================
+train_classification_models 中 Random Forest、Gradient Boosting、XGBoost、
+LightGBM 的參數皆為手動固定。本模組以 StratifiedKFold 交叉驗證為基礎，
+用 Hyperband (多組 successive halving) 在「樹的數量」與「訓練列數」上分配預算：
+先以少量樹與部分資料評估大量參數組合，只保留表現最好的 1/eta 進入下一輪。
+
+- 只使用分類模型的訓練集列 (_classification_split)，測試集不參與參數選擇，
+  train_classification_models 報告的測試集指標才不會偏樂觀
+- XGBoost / LightGBM 另使用原生 early stopping (以訓練 fold 內切出的驗證集)
+- 每次試驗結果寫入 output/tuning/trials.jsonl，中斷後重新執行會直接沿用；
+  試驗記錄資料、特徵與 fold 的識別碼 (context)，問卷資料、特徵選取或衍生特徵變更後
+  舊的試驗結果會被捨棄
+- 各模型最佳參數寫入 output/best_params.json，下次訓練時自動套用
+"""
+
+import hashlib
+import json
+import math
+import os
+import time
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.metrics import roc_auc_score, f1_score
+
+from ml_models import OUTPUT_DIR, BEST_PARAMS_PATH
+
+TUNING_DIR = os.path.join(OUTPUT_DIR, 'tuning')
+TRIALS_PATH = os.path.join(TUNING_DIR, 'trials.jsonl')
+
+# 各模型在最大預算下的樹數量
+MAX_TREES = {
+    'Random Forest': 400,
+    'Gradient Boosting': 400,
+    'XGBoost': 1000,
+    'LightGBM': 1000
+}
+EARLY_STOPPING_ROUNDS = 50
+
+SEARCH_SPACES = {
+    'Random Forest': {
+        'max_depth': [4, 6, 8, 10, 12, None],
+        'min_samples_split': [2, 5, 10, 20],
+        'min_samples_leaf': [1, 2, 4, 8],
+        'max_features': ['sqrt', 'log2', 0.5]
+    },
+    'Gradient Boosting': {
+        'learning_rate': [0.02, 0.05, 0.1, 0.2],
+        'max_depth': [2, 3, 4, 5],
+        'subsample': [0.6, 0.8, 1.0],
+        'min_samples_leaf': [1, 5, 10, 20]
+    },
+    'XGBoost': {
+        'learning_rate': [0.01, 0.03, 0.05, 0.1],
+        'max_depth': [2, 3, 4, 5, 6],
+        'subsample': [0.6, 0.8, 1.0],
+        'colsample_bytree': [0.5, 0.7, 1.0],
+        'min_child_weight': [1, 3, 5, 10],
+        'reg_lambda': [0.1, 1.0, 5.0, 10.0]
+    },
+    'LightGBM': {
+        'learning_rate': [0.01, 0.03, 0.05, 0.1],
+        'num_leaves': [7, 15, 31, 63],
+        'max_depth': [3, 5, 7, -1],
+        'min_child_samples': [5, 10, 20, 40],
+        'subsample': [0.6, 0.8, 1.0],
+        'colsample_bytree': [0.5, 0.7, 1.0],
+        'reg_lambda': [0.0, 1.0, 5.0]
+    }
+}
+
+
+def config_id(params):
+    """參數組合的穩定識別碼"""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+
+def sample_configs(space, n, rng):
+    """由搜尋空間隨機抽樣 n 組參數 (不重複)"""
+    configs = {}
+    max_configs = math.prod(len(v) for v in space.values())
+    while len(configs) < min(n, max_configs):
+        params = {name: values[rng.integers(len(values))] for name, values in space.items()}
+        params = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in params.items()}
+        configs[config_id(params)] = params
+    return list(configs.values())
+
+
+def trial_context(X, y, folds, feature_cols):
+    """資料、fold 與特徵欄位的識別碼 (與 feature_selection.py 的 SubsetScoreCache 相同做法)"""
+    return hashlib.sha256(
+        np.ascontiguousarray(X, dtype=float).tobytes() + np.ascontiguousarray(y).tobytes() +
+        np.concatenate([test_idx for _, test_idx in folds]).tobytes() +
+        '|'.join(feature_cols).encode('utf-8')
+    ).hexdigest()[:16]
+
+
+class TrialStore:
+    """以 JSON Lines 持久化的試驗結果，支援中斷後續跑"""
+
+    def __init__(self, path=TRIALS_PATH, context=''):
+        """
+        Parameters:
+        -----------
+        path : str
+            試驗記錄檔
+        context : str
+            資料、fold 與特徵的識別碼 (trial_context)；不同的試驗結果會被捨棄
+        """
+        self.path = path
+        self.context = context
+        self.trials = {}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            n_stale = 0
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        trial = json.loads(line)
+                        if trial.get('context') != context:
+                            n_stale += 1
+                            continue
+                        self.trials[self._key(trial['model'], trial['config_id'], trial['budget'])] = trial
+            if n_stale:
+                # 只保留目前資料的試驗結果
+                print(f"捨棄 {n_stale} 筆資料或特徵已變更的試驗結果")
+                with open(path, 'w', encoding='utf-8') as f:
+                    for trial in self.trials.values():
+                        f.write(json.dumps(trial, ensure_ascii=False, default=str) + '\n')
+
+    @staticmethod
+    def _key(model_name, cid, budget):
+        return (model_name, cid, round(float(budget), 6))
+
+    def get(self, model_name, cid, budget):
+        return self.trials.get(self._key(model_name, cid, budget))
+
+    def add(self, trial):
+        trial = {**trial, 'context': self.context}
+        self.trials[self._key(trial['model'], trial['config_id'], trial['budget'])] = trial
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(trial, ensure_ascii=False, default=str) + '\n')
+
+
+def _subsample_rows(train_idx, y, fraction, rng):
+    """分層抽取部分訓練列"""
+    if fraction >= 1.0:
+        return train_idx
+    keep = []
+    for label in np.unique(y[train_idx]):
+        idx = train_idx[y[train_idx] == label]
+        n_keep = max(2, int(round(len(idx) * fraction)))
+        keep.append(rng.choice(idx, size=min(n_keep, len(idx)), replace=False))
+    return np.sort(np.concatenate(keep))
+
+
+def _build_model(model_name, params, n_estimators, y_train, random_state, n_jobs):
+    """依參數建立模型，XGBoost / LightGBM 啟用 early stopping"""
+    if model_name == 'Random Forest':
+        return RandomForestClassifier(n_estimators=n_estimators, class_weight='balanced',
+                                      random_state=random_state, n_jobs=n_jobs, **params)
+    if model_name == 'Gradient Boosting':
+        return GradientBoostingClassifier(n_estimators=n_estimators,
+                                          random_state=random_state, **params)
+    if model_name == 'XGBoost':
+        import xgboost as xgb
+        return xgb.XGBClassifier(n_estimators=n_estimators,
+                                 scale_pos_weight=(len(y_train) - y_train.sum()) / y_train.sum(),
+                                 early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+                                 random_state=random_state, n_jobs=n_jobs,
+                                 eval_metric='logloss', **params)
+    if model_name == 'LightGBM':
+        import lightgbm as lgb
+        return lgb.LGBMClassifier(n_estimators=n_estimators, class_weight='balanced',
+                                  subsample_freq=1, random_state=random_state,
+                                  n_jobs=n_jobs, verbose=-1, **params)
+    raise ValueError(f"不支援的模型：{model_name}")
+
+
+def _fit_with_early_stopping(model_name, model, X, y, train_idx, random_state):
+    """XGBoost / LightGBM 由訓練 fold 切出驗證集做 early stopping，回傳實際使用的樹數"""
+    if model_name not in ('XGBoost', 'LightGBM'):
+        model.fit(X[train_idx], y[train_idx])
+        return model.n_estimators
+
+    fit_idx, es_idx = train_test_split(train_idx, test_size=0.15, stratify=y[train_idx],
+                                       random_state=random_state)
+    if model_name == 'XGBoost':
+        model.fit(X[fit_idx], y[fit_idx], eval_set=[(X[es_idx], y[es_idx])], verbose=False)
+        return int(model.best_iteration) + 1
+
+    import lightgbm as lgb
+    model.fit(X[fit_idx], y[fit_idx], eval_set=[(X[es_idx], y[es_idx])],
+              callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+    return int(model.best_iteration_ or model.n_estimators)
+
+
+def evaluate_config(model_name, params, budget, X, y, folds, random_state=42, n_jobs=-1):
+    """
+    在指定預算下以交叉驗證評估一組參數
+
+    預算 b (0 < b <= 1) 同時控制樹的數量 (b × 最大樹數) 與訓練列比例 (√b)。
+    """
+    n_estimators = max(10, int(round(MAX_TREES[model_name] * budget)))
+    row_fraction = math.sqrt(budget)
+    rng = np.random.default_rng(random_state)
+
+    aucs, f1s, used_trees = [], [], []
+    for train_idx, test_idx in folds:
+        sub_idx = _subsample_rows(train_idx, y, row_fraction, rng)
+        model = _build_model(model_name, params, n_estimators, y[sub_idx], random_state, n_jobs)
+        used_trees.append(_fit_with_early_stopping(model_name, model, X, y, sub_idx, random_state))
+
+        y_prob = model.predict_proba(X[test_idx])[:, 1]
+        aucs.append(roc_auc_score(y[test_idx], y_prob))
+        f1s.append(f1_score(y[test_idx], (y_prob >= 0.5).astype(int)))
+
+    return {
+        'score': float(np.mean(aucs)),
+        'score_std': float(np.std(aucs)),
+        'f1': float(np.mean(f1s)),
+        'n_estimators': int(np.median(used_trees))
+    }
+
+
+def hyperband(model_name, X, y, store, eta=3, max_configs=27, n_splits=5,
+              random_state=42, n_jobs=-1, folds=None):
+    """
+    以 Hyperband 搜尋單一模型的參數
+
+    每個 bracket 以不同的起始預算執行 successive halving：
+    起始預算越小，評估的參數組合越多。
+    """
+    if folds is None:
+        folds = list(StratifiedKFold(n_splits=n_splits, shuffle=True,
+                                     random_state=random_state).split(X, y))
+    s_max = int(round(math.log(max_configs, eta)))
+    rng = np.random.default_rng(random_state)
+    best = None
+
+    for s in range(s_max, -1, -1):
+        n_configs = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        configs = sample_configs(SEARCH_SPACES[model_name], n_configs, rng)
+        print(f"  Bracket s={s}: {len(configs)} 組參數，起始預算 {eta ** -s:.3f}")
+
+        for i in range(s + 1):
+            budget = eta ** (i - s)
+            results = []
+            for params in configs:
+                cid = config_id(params)
+                trial = store.get(model_name, cid, budget)
+                if trial is None:
+                    start = time.time()
+                    metrics = evaluate_config(model_name, params, budget, X, y, folds,
+                                              random_state, n_jobs)
+                    trial = {'model': model_name, 'config_id': cid, 'params': params,
+                             'budget': budget, 'seconds': time.time() - start, **metrics}
+                    store.add(trial)
+                results.append(trial)
+
+            results.sort(key=lambda t: t['score'], reverse=True)
+            if budget >= 1.0 and (best is None or results[0]['score'] > best['score']):
+                best = results[0]
+
+            # 保留表現最好的 1/eta
+            n_keep = max(1, len(configs) // eta)
+            configs = [t['params'] for t in results[:n_keep]]
+
+    return best
+
+
+def save_best_params(best_trials, path=BEST_PARAMS_PATH):
+    """寫出各模型最佳參數 (含 early stopping 得到的樹數)，供下次訓練使用"""
+    best_params = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            best_params = json.load(f)
+
+    for model_name, trial in best_trials.items():
+        best_params[model_name] = {**trial['params'], 'n_estimators': trial['n_estimators']}
+        if model_name == 'LightGBM':
+            # subsample 需搭配 subsample_freq 才會生效
+            best_params[model_name]['subsample_freq'] = 1
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(best_params, f, ensure_ascii=False, indent=2)
+    return best_params
+
+
+def tune_models(analyzer, model_names=None, eta=3, max_configs=27, trials_path=TRIALS_PATH):
+    """
+    對分析器的分類模型執行超參數搜尋
+
+    Parameters:
+    -----------
+    analyzer : CyberbullyingMLAnalyzer
+        已執行 prepare_features 的分析器
+    model_names : list or None
+        要搜尋的模型，None 表示全部 (未安裝的套件自動略過)
+    """
+    print("\n" + "=" * 60)
+    print("超參數搜尋 (Hyperband)")
+    print("=" * 60)
+
+    # 與 train_classification_models 相同的分割，只以訓練集列搜尋
+    analyzer.clf_train_idx, analyzer.clf_test_idx = analyzer._classification_split()
+    X = np.asarray(analyzer.X_scaled)[analyzer.clf_train_idx]
+    y = np.asarray(analyzer.y_binary)[analyzer.clf_train_idx]
+    print(f"搜尋使用訓練集 {len(y)} 筆 (保留測試集 {len(analyzer.clf_test_idx)} 筆)")
+    folds = list(StratifiedKFold(n_splits=5, shuffle=True,
+                                 random_state=analyzer.random_state).split(X, y))
+    store = TrialStore(trials_path, context=trial_context(X, y, folds, analyzer.feature_cols))
+    print(f"已載入 {len(store.trials)} 筆既有試驗結果")
+
+    best_trials = {}
+    for model_name in model_names or list(SEARCH_SPACES):
+        try:
+            if model_name == 'XGBoost':
+                import xgboost
+            elif model_name == 'LightGBM':
+                import lightgbm
+        except ImportError:
+            print(f"\n{model_name} 未安裝，跳過")
+            continue
+
+        print(f"\n【{model_name}】")
+        best = hyperband(model_name, X, y, store, eta=eta, max_configs=max_configs,
+                         random_state=analyzer.random_state, n_jobs=analyzer.n_jobs, folds=folds)
+        best_trials[model_name] = best
+        print(f"  最佳 CV AUC: {best['score']:.4f} (+/- {best['score_std']*2:.4f}), "
+              f"F1: {best['f1']:.4f}")
+        print(f"  參數: {best['params']}, 樹數: {best['n_estimators']}")
+
+    best_params = save_best_params(best_trials)
+    print(f"\n已儲存: {BEST_PARAMS_PATH}")
+    return best_params
+
+
+def main():
+    """主程式"""
+    from ml_models import CyberbullyingMLAnalyzer
+
+    data_path = '../data/processed_data_with_score.csv'
+    analyzer = CyberbullyingMLAnalyzer(data_path)
+    analyzer.prepare_features()
+    return tune_models(analyzer)
+
+
+if __name__ == "__main__":
+    best_params = main()
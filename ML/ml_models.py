@@ -7,12 +7,17 @@
 資料來源：台灣傳播調查資料庫 2021 年真實數據
 """
 
+import inspect
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
 from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.base import clone
+from sklearn.multiclass import OneVsRestClassifier
+from joblib import Parallel, delayed
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier, GradientBoostingClassifier
 from sklearn.linear_model import Ridge, Lasso, LogisticRegression
 from sklearn.metrics import (mean_squared_error, r2_score, mean_absolute_error,
@@ -29,15 +34,85 @@ plt.rcParams['axes.unicode_minus'] = False
 
 # 建立輸出資料夾
 import os
+import sys
 OUTPUT_DIR = 'output'
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# 共用模組位於專案根目錄
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from figure_cache import FigureCache, figure_key
+from shared_array import SharedArray, attach_shared_array, detach_shared_array
+
+# 分類模型預設參數 (若有 hyperparameter_search.py 產生的 best_params.json 則以其覆寫)
+import json
+BEST_PARAMS_PATH = f'{OUTPUT_DIR}/best_params.json'
+OOF_CACHE_PATH = f'{OUTPUT_DIR}/oof_probabilities.npz'
+SELECTED_FEATURES_PATH = f'{OUTPUT_DIR}/selected_features.json'
+DEFAULT_CLF_PARAMS = {
+    'Random Forest': {'n_estimators': 100, 'max_depth': 8, 'min_samples_split': 10},
+    'Gradient Boosting': {'n_estimators': 100, 'max_depth': 5, 'learning_rate': 0.1},
+    'XGBoost': {'n_estimators': 100, 'max_depth': 5, 'learning_rate': 0.1},
+    'LightGBM': {'n_estimators': 100, 'max_depth': 5, 'learning_rate': 0.1}
+}
+RISK_CLASS_NAMES = ['低風險', '中風險', '高風險']
+
+
+def _fit_predict_fold(model, X_spec, y, train_idx, test_idx, sample_weight=None):
+    """
+    排程任務：以單一 fold 訓練模型副本，回傳模型與測試 fold 的預測機率
+
+    X_spec 為 SharedArray 的規格，子程序以名稱掛載標準化矩陣 (不隨每個任務序列化)；
+    sample_weight 只傳給 fit 接受 sample_weight 的模型 (OneVsRestClassifier 不接受，維持不加權)
+    """
+    X = attach_shared_array(X_spec)
+    # 以列索引取出的是複本，取出後即可釋放掛載
+    X_train, X_test = X[train_idx], X[test_idx]
+    del X
+    detach_shared_array(X_spec)
+
+    model = clone(model)
+    # fold 之間已平行，模型內部只使用單一執行緒，避免執行緒超額配置
+    model.set_params(**{key: 1 for key in model.get_params() if key.endswith('n_jobs')})
+    fit_params = {}
+    if sample_weight is not None and 'sample_weight' in inspect.signature(model.fit).parameters:
+        fit_params['sample_weight'] = sample_weight[train_idx]
+    model.fit(X_train, y[train_idx], **fit_params)
+    return model, model.predict_proba(X_test)
+
+
+def _weighted_mean_std(values, weights):
+    """加權平均與標準差 (權數全為 1 時與 pandas 的 mean、std 相同)"""
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+    mean = np.sum(weights * values) / total
+    denom = total - np.sum(weights ** 2) / total
+    std = np.sqrt(np.sum(weights * (values - mean) ** 2) / denom) if denom > 0 else np.nan
+    return mean, std
+
 
 class CyberbullyingMLAnalyzer:
     """網路霸凌傾向 ML 分析器"""
 
-    def __init__(self, data_path):
-        """載入真實資料"""
+    def __init__(self, data_path, random_state=42, n_jobs=-1, margins_path=None):
+        """
+        載入真實資料
+
+        Parameters:
+        -----------
+        data_path : str
+            資料檔路徑
+        random_state : int
+            資料分割、所有模型與 K-Means 共用的亂數種子
+        n_jobs : int
+            模型訓練使用的執行緒數 (-1 為全部 CPU)
+        margins_path : str or None
+            母體邊際分布 JSON (survey_weights.py)；提供時以 raking 權數作為
+            模型訓練的 sample_weight，聚類摘要也以加權計算
+        """
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+
         print("=" * 60)
         print("載入真實資料集...")
         print("=" * 60)
@@ -50,8 +125,28 @@ class CyberbullyingMLAnalyzer:
         print(f"\n目標變數 (total_score) 統計:")
         print(self.df['total_score'].describe())
 
-    def prepare_features(self):
-        """準備特徵變數 - 只使用獨立於 total_score 計算的變數"""
+        # 調查權數 (None 表示不加權)
+        self.sample_weight = None
+        if margins_path is not None:
+            from survey_weights import load_survey_weights
+            self.sample_weight = load_survey_weights(df=self.df, margins_path=margins_path)
+
+        # 圖表快取：資料、繪圖程式與樣式都未變更時略過重繪
+        self.figure_cache = FigureCache(OUTPUT_DIR)
+
+    def prepare_features(self, engineered_features=True, use_selected_features=True, cache_features=True):
+        """
+        準備特徵變數 - 只使用獨立於 total_score 計算的變數
+
+        Parameters:
+        -----------
+        engineered_features : bool
+            是否加入 feature_engineering.py 的平台使用彙總特徵
+        use_selected_features : bool
+            若有 feature_selection.py 產生的 selected_features.json，只保留選出的特徵
+        cache_features : bool
+            是否讀寫 output/feature_cache 的衍生特徵快取 (平行子程序應設為 False)
+        """
         print("\n" + "=" * 60)
         print("準備特徵變數...")
         print("=" * 60)
@@ -119,10 +214,34 @@ class CyberbullyingMLAnalyzer:
         missing_before = self.X.isnull().sum().sum()
         for col in self.X.columns:
             if self.X[col].isnull().any():
-                self.X[col].fillna(self.X[col].median(), inplace=True)
+                self.X[col] = self.X[col].fillna(self.X[col].median())
 
         print(f"缺失值處理: {missing_before} → 0")
 
+        # 衍生特徵 (依輸入雜湊快取)，分類、回歸與聚類共用
+        # 特徵工程參數 (q7 填補中位數等) 只由訓練資料估計，隨堆疊模型、模型檔與漂移參考分布保存
+        self.feature_params = {}
+        if engineered_features:
+            from feature_engineering import build_engineered_features, fit_feature_params
+            self.feature_params = fit_feature_params(self.df)
+            engineered, engineered_names = build_engineered_features(
+                self.df, cache_dir=f'{OUTPUT_DIR}/feature_cache' if cache_features else None,
+                params=self.feature_params
+            )
+            self.X = pd.concat([self.X, engineered], axis=1)
+            self.feature_cols = self.feature_cols + list(engineered.columns)
+            self.feature_names.update(engineered_names)
+            print(f"加入衍生特徵後的特徵數量: {len(self.feature_cols)}")
+
+        # 特徵選取結果 (聚類摘要仍需完整的人口統計欄位，保留選取前的特徵矩陣)
+        self.X_full = self.X
+        if use_selected_features and os.path.exists(SELECTED_FEATURES_PATH):
+            with open(SELECTED_FEATURES_PATH, encoding='utf-8') as f:
+                selected = set(json.load(f))
+            self.feature_cols = [col for col in self.feature_cols if col in selected]
+            self.X = self.X[self.feature_cols]
+            print(f"套用特徵選取結果: {len(self.feature_cols)} 個特徵")
+
         # ============================================
         # 建立分類目標變數 (高風險 vs 低風險)
         # ============================================
@@ -154,18 +273,159 @@ class CyberbullyingMLAnalyzer:
         self.scaler = StandardScaler()
         self.X_scaled = self.scaler.fit_transform(self.X)
 
+        # 固定的交叉驗證分割 (與 cross_val_score(cv=5) 相同)；二分類模型以同一設定只在訓練集列內分割
+        self.cv_splitter = StratifiedKFold(n_splits=5)
+        self.cv_splits = list(self.cv_splitter.split(self.X_scaled, self.y_binary))
+        # 回歸模型的交叉驗證 (cross_val_score 的 cv 參數)
+        self.regression_cv = 5
+
+        return self
+
+    def save_drift_reference(self):
+        """
+        儲存訓練特徵的參考分布，供新一波資料評分前檢查漂移 (drift_monitor.py)
+
+        只由 main() 明確呼叫，參考分布與正式模型的特徵一致；
+        特徵選取、多種子實驗等其他呼叫 prepare_features 的程式不會覆寫。
+        儲存前以訓練資料的隨機子樣本做同分布檢查，誤判比例過高時拋出例外
+        """
+        from drift_monitor import MAX_FALSE_ALARM_RATE, DriftReference, false_alarm_rates
+        from feature_engineering import select_features
+        features = select_features(self.df, self.feature_cols, self.feature_params)
+        reference = DriftReference.from_frame(features, self.feature_params)
+
+        rates = false_alarm_rates(features, reference)
+        print("漂移檢查同分布誤判比例 (訓練資料隨機子樣本):")
+        print(rates.to_string(index=False))
+        if (rates['false_alarm_rate'] > MAX_FALSE_ALARM_RATE).any():
+            raise ValueError(f"同分布子樣本被判為漂移的比例超過 {MAX_FALSE_ALARM_RATE:.0%}，請檢查漂移門檻")
+
+        path = reference.save()
+        print(f"已儲存: {path}")
         return self
 
-    def train_classification_models(self):
+    def _classifier_params(self, model_name):
+        """取得模型參數：預設值，若有超參數搜尋結果則覆寫"""
+        params = dict(DEFAULT_CLF_PARAMS[model_name])
+        params.update(self.tuned_params.get(model_name, {}))
+        return params
+
+    def _run_fold_tasks(self, tasks):
+        """
+        共用的平行排程：一次送出多個 (模型, 目標, 訓練列, 測試列) 任務
+
+        標準化矩陣只發布一次到共享記憶體，各任務只傳送掛載用的規格 (shared_array.py)
+
+        Returns:
+        --------
+        list of (fitted_model, test_prob)，順序與 tasks 相同
+        """
+        with SharedArray(self.X_scaled) as shared:
+            return Parallel(n_jobs=self.n_jobs)(
+                delayed(_fit_predict_fold)(model, shared.spec, y, train_idx, test_idx, self.sample_weight)
+                for model, y, train_idx, test_idx in tasks
+            )
+
+    def _fit_weights(self, idx):
+        """訓練列的調查權數 (不加權時為 None，可直接傳給 fit 的 sample_weight)"""
+        return None if self.sample_weight is None else self.sample_weight[idx]
+
+    def _cv_weight_params(self):
+        """cross_val_score 的 sample_weight 參數 (不加權時為空)"""
+        return {} if self.sample_weight is None else {'params': {'sample_weight': self.sample_weight}}
+
+    def _classification_split(self):
+        """分類模型共用的訓練 / 測試分割 (依二分類分層)，回傳列索引"""
+        return train_test_split(
+            np.arange(len(self.y_binary)), test_size=0.2,
+            random_state=self.random_state, stratify=self.y_binary
+        )
+
+    def _classification_cv_splits(self):
+        """
+        分類訓練集列內的交叉驗證分割 (需先設定 clf_train_idx)，測試集列不參與
+
+        Returns:
+        --------
+        list of (train_idx, test_idx)，皆為原始資料的列位置
+        """
+        y = self.y_binary.to_numpy()
+        train_idx = self.clf_train_idx
+        return [(train_idx[tr], train_idx[te])
+                for tr, te in self.cv_splitter.split(train_idx, y[train_idx])]
+
+    def _cross_validate_binary(self, model):
+        """
+        訓練集內 5-fold 交叉驗證：回傳各 fold 的 F1 與 out-of-fold 預測機率
+
+        out-of-fold 機率與 clf_train_idx 同順序 (測試集列沒有 out-of-fold 機率)
+        """
+        y = self.y_binary.to_numpy()
+        position = np.empty(len(y), dtype=np.int64)
+        position[self.clf_train_idx] = np.arange(len(self.clf_train_idx))
+        oof_prob = np.zeros(len(self.clf_train_idx))
+        scores = []
+
+        fold_results = self._run_fold_tasks([(model, y, train_idx, test_idx)
+                                             for train_idx, test_idx in self.clf_cv_splits])
+        for (_, test_idx), (_, prob) in zip(self.clf_cv_splits, fold_results):
+            oof_prob[position[test_idx]] = prob[:, 1]
+            scores.append(f1_score(y[test_idx], (prob[:, 1] > 0.5).astype(int)))
+
+        return np.array(scores), oof_prob
+
+    def oof_arrays(self):
+        """
+        各分類模型在訓練集內的 out-of-fold 機率 (格式與 threshold_optimizer.load_oof_cache 相同)
+
+        只含訓練集列 (rows 為其原始列位置)，測試集保留作評估
+        """
+        rows = self.clf_train_idx
+        position = np.empty(len(self.y_binary), dtype=np.int64)
+        position[rows] = np.arange(len(rows))
+        folds = np.zeros(len(rows), dtype=np.int8)
+        for fold, (_, test_idx) in enumerate(self.clf_cv_splits):
+            folds[position[test_idx]] = fold
+
+        model_names = list(self.clf_results.keys())
+        return {
+            'model_names': model_names,
+            'rows': rows,
+            'y_binary': self.y_binary.to_numpy()[rows],
+            'total_score': self.y_continuous.to_numpy()[rows],
+            'folds': folds,
+            'oof_probs': np.column_stack([self.clf_results[m]['oof_prob'] for m in model_names])
+        }
+
+    def save_oof_probabilities(self, path=OOF_CACHE_PATH):
+        """
+        快取各分類模型在訓練集內的 out-of-fold 機率，供門檻最佳化、機率校準與堆疊模型使用 (不需重新訓練)
+
+        只由 main() 明確呼叫；其他程式 (多種子實驗、堆疊模型等) 訓練時不會覆寫快取
+        """
+        arrays = self.oof_arrays()
+        np.savez_compressed(path, **{**arrays, 'model_names': np.array(arrays['model_names'])})
+        print(f"已儲存: {path}")
+        return self
+
+    def train_classification_models(self, use_tuned_params=True):
         """訓練分類模型 - 預測高風險群"""
         print("\n" + "=" * 60)
         print("訓練分類模型 (預測高風險群)")
         print("=" * 60)
 
+        # 讀取超參數搜尋結果
+        self.tuned_params = {}
+        if use_tuned_params and os.path.exists(BEST_PARAMS_PATH):
+            with open(BEST_PARAMS_PATH, encoding='utf-8') as f:
+                self.tuned_params = json.load(f)
+            print(f"套用超參數搜尋結果: {', '.join(self.tuned_params)}")
+
         # 分割資料
-        X_train, X_test, y_train, y_test = train_test_split(
-            self.X_scaled, self.y_binary, test_size=0.2, random_state=42, stratify=self.y_binary
-        )
+        self.clf_train_idx, self.clf_test_idx = self._classification_split()
+        self.clf_cv_splits = self._classification_cv_splits()
+        X_train, X_test = self.X_scaled[self.clf_train_idx], self.X_scaled[self.clf_test_idx]
+        y_train, y_test = self.y_binary.iloc[self.clf_train_idx], self.y_binary.iloc[self.clf_test_idx]
 
         self.X_train_clf = X_train
         self.X_test_clf = X_test
@@ -186,8 +446,8 @@ class CyberbullyingMLAnalyzer:
         print("【Logistic Regression】")
         print("-" * 40)
 
-        self.lr_model = LogisticRegression(random_state=42, max_iter=1000, class_weight='balanced')
-        self.lr_model.fit(X_train, y_train)
+        self.lr_model = LogisticRegression(random_state=self.random_state, max_iter=1000, class_weight='balanced')
+        self.lr_model.fit(X_train, y_train, sample_weight=self._fit_weights(self.clf_train_idx))
 
         y_pred_lr = self.lr_model.predict(X_test)
         y_prob_lr = self.lr_model.predict_proba(X_test)[:, 1]
@@ -200,13 +460,13 @@ class CyberbullyingMLAnalyzer:
         print(f"F1 Score: {f1_lr:.4f}")
         print(f"AUC-ROC: {auc_lr:.4f}")
 
-        cv_lr = cross_val_score(self.lr_model, self.X_scaled, self.y_binary, cv=5, scoring='f1')
+        cv_lr, oof_lr = self._cross_validate_binary(self.lr_model)
         print(f"5-fold CV F1: {cv_lr.mean():.4f} (+/- {cv_lr.std()*2:.4f})")
 
         self.clf_results['Logistic Regression'] = {
             'accuracy': acc_lr, 'f1': f1_lr, 'auc': auc_lr,
             'cv_mean': cv_lr.mean(), 'cv_std': cv_lr.std(),
-            'y_pred': y_pred_lr, 'y_prob': y_prob_lr
+            'y_pred': y_pred_lr, 'y_prob': y_prob_lr, 'oof_prob': oof_lr
         }
 
         # ============================================
@@ -217,10 +477,10 @@ class CyberbullyingMLAnalyzer:
         print("-" * 40)
 
         self.rf_clf = RandomForestClassifier(
-            n_estimators=100, max_depth=8, min_samples_split=10,
-            class_weight='balanced', random_state=42, n_jobs=-1
+            **self._classifier_params('Random Forest'),
+            class_weight='balanced', random_state=self.random_state, n_jobs=self.n_jobs
         )
-        self.rf_clf.fit(X_train, y_train)
+        self.rf_clf.fit(X_train, y_train, sample_weight=self._fit_weights(self.clf_train_idx))
 
         y_pred_rf = self.rf_clf.predict(X_test)
         y_prob_rf = self.rf_clf.predict_proba(X_test)[:, 1]
@@ -233,13 +493,13 @@ class CyberbullyingMLAnalyzer:
         print(f"F1 Score: {f1_rf:.4f}")
         print(f"AUC-ROC: {auc_rf:.4f}")
 
-        cv_rf = cross_val_score(self.rf_clf, self.X_scaled, self.y_binary, cv=5, scoring='f1')
+        cv_rf, oof_rf = self._cross_validate_binary(self.rf_clf)
         print(f"5-fold CV F1: {cv_rf.mean():.4f} (+/- {cv_rf.std()*2:.4f})")
 
         self.clf_results['Random Forest'] = {
             'accuracy': acc_rf, 'f1': f1_rf, 'auc': auc_rf,
             'cv_mean': cv_rf.mean(), 'cv_std': cv_rf.std(),
-            'y_pred': y_pred_rf, 'y_prob': y_prob_rf
+            'y_pred': y_pred_rf, 'y_prob': y_prob_rf, 'oof_prob': oof_rf
         }
 
         # 特徵重要性
@@ -263,10 +523,10 @@ class CyberbullyingMLAnalyzer:
         print("-" * 40)
 
         self.gb_clf = GradientBoostingClassifier(
-            n_estimators=100, max_depth=5, learning_rate=0.1,
-            random_state=42
+            **self._classifier_params('Gradient Boosting'),
+            random_state=self.random_state
         )
-        self.gb_clf.fit(X_train, y_train)
+        self.gb_clf.fit(X_train, y_train, sample_weight=self._fit_weights(self.clf_train_idx))
 
         y_pred_gb = self.gb_clf.predict(X_test)
         y_prob_gb = self.gb_clf.predict_proba(X_test)[:, 1]
@@ -279,13 +539,13 @@ class CyberbullyingMLAnalyzer:
         print(f"F1 Score: {f1_gb:.4f}")
         print(f"AUC-ROC: {auc_gb:.4f}")
 
-        cv_gb = cross_val_score(self.gb_clf, self.X_scaled, self.y_binary, cv=5, scoring='f1')
+        cv_gb, oof_gb = self._cross_validate_binary(self.gb_clf)
         print(f"5-fold CV F1: {cv_gb.mean():.4f} (+/- {cv_gb.std()*2:.4f})")
 
         self.clf_results['Gradient Boosting'] = {
             'accuracy': acc_gb, 'f1': f1_gb, 'auc': auc_gb,
             'cv_mean': cv_gb.mean(), 'cv_std': cv_gb.std(),
-            'y_pred': y_pred_gb, 'y_prob': y_prob_gb
+            'y_pred': y_pred_gb, 'y_prob': y_prob_gb, 'oof_prob': oof_gb
         }
 
         # ============================================
@@ -298,11 +558,11 @@ class CyberbullyingMLAnalyzer:
             print("-" * 40)
 
             self.xgb_clf = xgb.XGBClassifier(
-                n_estimators=100, max_depth=5, learning_rate=0.1,
+                **self._classifier_params('XGBoost'),
                 scale_pos_weight=(len(y_train) - y_train.sum()) / y_train.sum(),
-                random_state=42, n_jobs=-1, eval_metric='logloss'
+                random_state=self.random_state, n_jobs=self.n_jobs, eval_metric='logloss'
             )
-            self.xgb_clf.fit(X_train, y_train)
+            self.xgb_clf.fit(X_train, y_train, sample_weight=self._fit_weights(self.clf_train_idx))
 
             y_pred_xgb = self.xgb_clf.predict(X_test)
             y_prob_xgb = self.xgb_clf.predict_proba(X_test)[:, 1]
@@ -315,13 +575,13 @@ class CyberbullyingMLAnalyzer:
             print(f"F1 Score: {f1_xgb:.4f}")
             print(f"AUC-ROC: {auc_xgb:.4f}")
 
-            cv_xgb = cross_val_score(self.xgb_clf, self.X_scaled, self.y_binary, cv=5, scoring='f1')
+            cv_xgb, oof_xgb = self._cross_validate_binary(self.xgb_clf)
             print(f"5-fold CV F1: {cv_xgb.mean():.4f} (+/- {cv_xgb.std()*2:.4f})")
 
             self.clf_results['XGBoost'] = {
                 'accuracy': acc_xgb, 'f1': f1_xgb, 'auc': auc_xgb,
                 'cv_mean': cv_xgb.mean(), 'cv_std': cv_xgb.std(),
-                'y_pred': y_pred_xgb, 'y_prob': y_prob_xgb
+                'y_pred': y_pred_xgb, 'y_prob': y_prob_xgb, 'oof_prob': oof_xgb
             }
 
         except ImportError:
@@ -337,10 +597,10 @@ class CyberbullyingMLAnalyzer:
             print("-" * 40)
 
             self.lgb_clf = lgb.LGBMClassifier(
-                n_estimators=100, max_depth=5, learning_rate=0.1,
-                class_weight='balanced', random_state=42, n_jobs=-1, verbose=-1
+                **self._classifier_params('LightGBM'),
+                class_weight='balanced', random_state=self.random_state, n_jobs=self.n_jobs, verbose=-1
             )
-            self.lgb_clf.fit(X_train, y_train)
+            self.lgb_clf.fit(X_train, y_train, sample_weight=self._fit_weights(self.clf_train_idx))
 
             y_pred_lgb = self.lgb_clf.predict(X_test)
             y_prob_lgb = self.lgb_clf.predict_proba(X_test)[:, 1]
@@ -353,13 +613,13 @@ class CyberbullyingMLAnalyzer:
             print(f"F1 Score: {f1_lgb:.4f}")
             print(f"AUC-ROC: {auc_lgb:.4f}")
 
-            cv_lgb = cross_val_score(self.lgb_clf, self.X_scaled, self.y_binary, cv=5, scoring='f1')
+            cv_lgb, oof_lgb = self._cross_validate_binary(self.lgb_clf)
             print(f"5-fold CV F1: {cv_lgb.mean():.4f} (+/- {cv_lgb.std()*2:.4f})")
 
             self.clf_results['LightGBM'] = {
                 'accuracy': acc_lgb, 'f1': f1_lgb, 'auc': auc_lgb,
                 'cv_mean': cv_lgb.mean(), 'cv_std': cv_lgb.std(),
-                'y_pred': y_pred_lgb, 'y_prob': y_prob_lgb
+                'y_pred': y_pred_lgb, 'y_prob': y_prob_lgb, 'oof_prob': oof_lgb
             }
 
         except ImportError:
@@ -367,6 +627,92 @@ class CyberbullyingMLAnalyzer:
 
         return self
 
+    def train_multiclass_models(self):
+        """訓練三分類模型 - 預測低/中/高風險 (y_multi)"""
+        print("\n" + "=" * 60)
+        print("訓練三分類模型 (低/中/高風險)")
+        print("=" * 60)
+
+        # 與二分類共用相同的訓練 / 測試分割與交叉驗證 fold
+        train_idx, test_idx = self._classification_split()
+        y = self.y_multi.to_numpy()
+        y_train, y_test = y[train_idx], y[test_idx]
+        n_classes = len(RISK_CLASS_NAMES)
+
+        print(f"\n資料分割:")
+        print(f"  訓練集: {len(train_idx)} 筆 (各類別: {np.bincount(y_train, minlength=n_classes).tolist()})")
+        print(f"  測試集: {len(test_idx)} 筆 (各類別: {np.bincount(y_test, minlength=n_classes).tolist()})")
+
+        # Logistic Regression 與 Random Forest 採 one-vs-rest；XGBoost / LightGBM 使用原生多類別目標
+        models = {
+            'Logistic Regression (OvR)': OneVsRestClassifier(
+                LogisticRegression(random_state=self.random_state, max_iter=1000, class_weight='balanced')
+            ),
+            'Random Forest (OvR)': OneVsRestClassifier(
+                RandomForestClassifier(**self._classifier_params('Random Forest'),
+                                       class_weight='balanced', random_state=self.random_state)
+            )
+        }
+        try:
+            import xgboost as xgb
+            models['XGBoost'] = xgb.XGBClassifier(
+                **self._classifier_params('XGBoost'), objective='multi:softprob',
+                random_state=self.random_state, eval_metric='mlogloss'
+            )
+        except ImportError:
+            print("\nXGBoost 未安裝，跳過")
+        try:
+            import lightgbm as lgb
+            models['LightGBM'] = lgb.LGBMClassifier(
+                **self._classifier_params('LightGBM'), objective='multiclass',
+                class_weight='balanced', random_state=self.random_state, verbose=-1
+            )
+        except ImportError:
+            print("\nLightGBM 未安裝，跳過")
+
+        # 每個模型 1 個保留測試集任務 + 5 個 CV fold 任務，全部一次送進共用排程
+        splits = [(train_idx, test_idx)] + self.cv_splits
+        tasks = [(model, y, tr, te) for model in models.values() for tr, te in splits]
+        fold_results = iter(self._run_fold_tasks(tasks))
+
+        self.multi_models = {}
+        self.multi_results = {}
+        for model_name in models:
+            fitted, y_prob = next(fold_results)
+            y_pred = y_prob.argmax(axis=1)
+
+            oof_prob = np.zeros((len(y), n_classes))
+            cv_scores = []
+            for tr, te in self.cv_splits:
+                _, prob = next(fold_results)
+                oof_prob[te] = prob
+                cv_scores.append(f1_score(y[te], prob.argmax(axis=1), average='macro'))
+            cv_scores = np.array(cv_scores)
+
+            class_auc = [roc_auc_score(y_test == k, y_prob[:, k]) for k in range(n_classes)]
+
+            print("\n" + "-" * 40)
+            print(f"【{model_name}】")
+            print("-" * 40)
+            print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+            print(f"Macro F1: {f1_score(y_test, y_pred, average='macro'):.4f}")
+            print("各類別 AUC (one-vs-rest): " +
+                  ", ".join(f"{name} {score:.4f}" for name, score in zip(RISK_CLASS_NAMES, class_auc)))
+            print(f"5-fold CV Macro F1: {cv_scores.mean():.4f} (+/- {cv_scores.std()*2:.4f})")
+
+            self.multi_models[model_name] = fitted
+            self.multi_results[model_name] = {
+                'accuracy': accuracy_score(y_test, y_pred),
+                'macro_f1': f1_score(y_test, y_pred, average='macro'),
+                'class_auc': class_auc, 'macro_auc': np.mean(class_auc),
+                'cv_mean': cv_scores.mean(), 'cv_std': cv_scores.std(),
+                'y_pred': y_pred, 'y_prob': y_prob, 'oof_prob': oof_prob
+            }
+
+        self.y_test_multi = y_test
+
+        return self
+
     def train_regression_models(self):
         """訓練回歸模型 - 預測連續分數"""
         print("\n" + "=" * 60)
@@ -374,9 +720,11 @@ class CyberbullyingMLAnalyzer:
         print("=" * 60)
 
         # 分割資料
-        X_train, X_test, y_train, y_test = train_test_split(
-            self.X_scaled, self.y_continuous, test_size=0.2, random_state=42
+        train_idx, test_idx = train_test_split(
+            np.arange(len(self.y_continuous)), test_size=0.2, random_state=self.random_state
         )
+        X_train, X_test = self.X_scaled[train_idx], self.X_scaled[test_idx]
+        y_train, y_test = self.y_continuous.iloc[train_idx], self.y_continuous.iloc[test_idx]
 
         self.X_train_reg = X_train
         self.X_test_reg = X_test
@@ -392,8 +740,8 @@ class CyberbullyingMLAnalyzer:
         print("【Ridge Regression】")
         print("-" * 40)
 
-        self.ridge_model = Ridge(alpha=1.0, random_state=42)
-        self.ridge_model.fit(X_train, y_train)
+        self.ridge_model = Ridge(alpha=1.0, random_state=self.random_state)
+        self.ridge_model.fit(X_train, y_train, sample_weight=self._fit_weights(train_idx))
 
         y_pred_ridge = self.ridge_model.predict(X_test)
         r2_ridge = r2_score(y_test, y_pred_ridge)
@@ -404,7 +752,8 @@ class CyberbullyingMLAnalyzer:
         print(f"RMSE: {rmse_ridge:.4f}")
         print(f"MAE: {mae_ridge:.4f}")
 
-        cv_ridge = cross_val_score(self.ridge_model, self.X_scaled, self.y_continuous, cv=5, scoring='r2')
+        cv_ridge = cross_val_score(self.ridge_model, self.X_scaled, self.y_continuous, cv=self.regression_cv, scoring='r2',
+                                   **self._cv_weight_params())
         print(f"5-fold CV R²: {cv_ridge.mean():.4f} (+/- {cv_ridge.std()*2:.4f})")
 
         self.reg_results['Ridge'] = {
@@ -422,9 +771,9 @@ class CyberbullyingMLAnalyzer:
 
         self.rf_reg = RandomForestRegressor(
             n_estimators=100, max_depth=8, min_samples_split=10,
-            random_state=42, n_jobs=-1
+            random_state=self.random_state, n_jobs=self.n_jobs
         )
-        self.rf_reg.fit(X_train, y_train)
+        self.rf_reg.fit(X_train, y_train, sample_weight=self._fit_weights(train_idx))
 
         y_pred_rf = self.rf_reg.predict(X_test)
         r2_rf = r2_score(y_test, y_pred_rf)
@@ -435,7 +784,8 @@ class CyberbullyingMLAnalyzer:
         print(f"RMSE: {rmse_rf:.4f}")
         print(f"MAE: {mae_rf:.4f}")
 
-        cv_rf = cross_val_score(self.rf_reg, self.X_scaled, self.y_continuous, cv=5, scoring='r2')
+        cv_rf = cross_val_score(self.rf_reg, self.X_scaled, self.y_continuous, cv=self.regression_cv, scoring='r2',
+                                **self._cv_weight_params())
         print(f"5-fold CV R²: {cv_rf.mean():.4f} (+/- {cv_rf.std()*2:.4f})")
 
         self.reg_results['Random Forest'] = {
@@ -452,26 +802,24 @@ class CyberbullyingMLAnalyzer:
 
         return self
 
-    def kmeans_clustering(self, n_clusters=5):
-        """K-Means 聚類分析"""
-        print("\n" + "=" * 60)
-        print("K-Means 聚類分析")
-        print("=" * 60)
-
-        # 使用肘部法則決定最佳群數
-        inertias = []
-        silhouettes = []
-        K_range = range(2, 11)
-
-        from sklearn.metrics import silhouette_score
-
-        for k in K_range:
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(self.X_scaled)
-            inertias.append(kmeans.inertia_)
-            silhouettes.append(silhouette_score(self.X_scaled, labels))
-
-        # 繪製肘部圖和輪廓係數圖
+    def _stale_figure_key(self, figure_paths, plot_func, data, dpi=150):
+        """
+        檢查圖表快取
+
+        Returns:
+        --------
+        str or None
+            需要重繪時回傳快取鍵 (繪製後以 figure_cache.record 記錄)；圖檔已是最新時回傳 None
+        """
+        key = figure_key(plot_func, data, dpi=dpi)
+        if self.figure_cache.is_current(figure_paths, key):
+            paths = [figure_paths] if isinstance(figure_paths, str) else figure_paths
+            print(f"圖表未變更，略過: {', '.join(paths)}")
+            return None
+        return key
+
+    def _plot_elbow_silhouette(self, K_range, inertias, silhouettes, figure_path):
+        """繪製肘部圖和輪廓係數圖"""
         fig, axes = plt.subplots(1, 2, figsize=(14, 5))
 
         ax = axes[0]
@@ -489,9 +837,36 @@ class CyberbullyingMLAnalyzer:
         ax.grid(True, alpha=0.3)
 
         plt.tight_layout()
-        plt.savefig(f'{OUTPUT_DIR}/kmeans_elbow_silhouette.png', dpi=150, bbox_inches='tight')
+        plt.savefig(figure_path, dpi=150, bbox_inches='tight')
         plt.close()
-        print(f"已儲存: {OUTPUT_DIR}/kmeans_elbow_silhouette.png")
+        print(f"已儲存: {figure_path}")
+
+    def kmeans_clustering(self, n_clusters=5):
+        """K-Means 聚類分析"""
+        print("\n" + "=" * 60)
+        print("K-Means 聚類分析")
+        print("=" * 60)
+
+        # 使用肘部法則決定最佳群數
+        inertias = []
+        silhouettes = []
+        K_range = range(2, 11)
+
+        from sklearn.metrics import silhouette_score
+
+        for k in K_range:
+            kmeans = KMeans(n_clusters=k, random_state=self.random_state, n_init=10)
+            labels = kmeans.fit_predict(self.X_scaled, sample_weight=self.sample_weight)
+            inertias.append(kmeans.inertia_)
+            silhouettes.append(silhouette_score(self.X_scaled, labels))
+
+        # 繪製肘部圖和輪廓係數圖 (數值未變更時沿用既有圖檔)
+        figure_path = f'{OUTPUT_DIR}/kmeans_elbow_silhouette.png'
+        key = self._stale_figure_key(figure_path, self._plot_elbow_silhouette,
+                                     [list(K_range), inertias, silhouettes])
+        if key is not None:
+            self._plot_elbow_silhouette(K_range, inertias, silhouettes, figure_path)
+            self.figure_cache.record(figure_path, key)
 
         # 找出最佳 K (輪廓係數最高)
         best_k = K_range[np.argmax(silhouettes)]
@@ -499,39 +874,65 @@ class CyberbullyingMLAnalyzer:
         print(f"使用者指定群數: K = {n_clusters}")
 
         # 使用指定群數進行聚類
-        self.kmeans_model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        self.cluster_labels = self.kmeans_model.fit_predict(self.X_scaled)
+        self.kmeans_model = KMeans(n_clusters=n_clusters, random_state=self.random_state, n_init=10)
+        self.cluster_labels = self.kmeans_model.fit_predict(self.X_scaled, sample_weight=self.sample_weight)
 
         # 將聚類結果加入資料
-        cluster_df = self.X.copy()
+        cluster_df = self.X_full.copy()
         cluster_df['cluster'] = self.cluster_labels
         cluster_df['total_score'] = self.y_continuous.values
 
-        # 計算各群描述統計
-        print(f"\n【{n_clusters} 群聚類結果】")
-
-        # 性別對照
-        gender_map = {1: '男性', 2: '女性'}
-
-        for i in range(n_clusters):
-            group = cluster_df[cluster_df['cluster'] == i]
-            print(f"\n群 {i} (n={len(group)}, {len(group)/len(cluster_df)*100:.1f}%):")
-            print(f"  霸凌傾向: mean={group['total_score'].mean():.2f}, std={group['total_score'].std():.2f}")
-            print(f"  平均出生年: {group['q2'].mean():.0f} (約{2024-1911-group['q2'].mean():.0f}歲)")
-            print(f"  性別比例: 女性 {(group['q1']==2).mean()*100:.1f}%")
-            print(f"  每日上網: {group['q7'].mean():.1f} 小時")
-
         self.cluster_df = cluster_df
         self.silhouette_scores = silhouettes
 
+        # 計算各群描述統計 (有調查權數時為加權結果)
+        print(f"\n【{n_clusters} 群聚類結果】")
+        for _, profile in self.cluster_profiles().iterrows():
+            print(f"\n群 {profile['cluster']:.0f} (n={profile['n']:.0f}, {profile['share']*100:.1f}%):")
+            print(f"  霸凌傾向: mean={profile['score_mean']:.2f}, std={profile['score_std']:.2f}")
+            print(f"  平均出生年: {profile['birth_year']:.0f} (約{2024-1911-profile['birth_year']:.0f}歲)")
+            print(f"  性別比例: 女性 {profile['female_ratio']*100:.1f}%")
+            print(f"  每日上網: {profile['internet_hours']:.1f} 小時")
+
         return self
 
+    def cluster_profiles(self):
+        """各群的描述統計 (比例、平均與標準差皆依調查權數加權；不加權時與一般統計量相同)"""
+        weights = np.ones(len(self.cluster_df)) if self.sample_weight is None else self.sample_weight
+        profiles = []
+        for i in range(len(np.unique(self.cluster_labels))):
+            in_group = (self.cluster_df['cluster'] == i).to_numpy()
+            group, w = self.cluster_df[in_group], weights[in_group]
+            score_mean, score_std = _weighted_mean_std(group['total_score'], w)
+            profiles.append({
+                'cluster': i,
+                'n': len(group),
+                'share': w.sum() / weights.sum(),
+                'score_mean': score_mean,
+                'score_std': score_std,
+                'birth_year': np.average(group['q2'], weights=w),
+                'female_ratio': np.average(group['q1'] == 2, weights=w),
+                'internet_hours': np.average(group['q7'], weights=w)
+            })
+        return pd.DataFrame(profiles)
+
     def plot_classification_results(self):
         """繪製分類結果視覺化"""
         print("\n" + "=" * 60)
         print("繪製分類模型視覺化")
         print("=" * 60)
 
+        figure_path = f'{OUTPUT_DIR}/classification_results.png'
+        key = self._stale_figure_key(figure_path, self.plot_classification_results, [
+            self.y_test_clf,
+            {name: [r['y_prob'], r['y_pred'], r['accuracy'], r['f1'], r['auc']]
+             for name, r in self.clf_results.items()},
+            self.rf_clf_importance.head(12),
+            self.feature_names
+        ])
+        if key is None:
+            return self
+
         from sklearn.metrics import roc_curve, auc, precision_recall_curve
 
         fig, axes = plt.subplots(2, 2, figsize=(14, 12))
@@ -592,7 +993,7 @@ class CyberbullyingMLAnalyzer:
         # 4. 特徵重要性
         # ============================================
         ax = axes[1, 1]
-        top_n = 12
+        top_n = min(12, len(self.rf_clf_importance))
         top_features = self.rf_clf_importance.head(top_n).copy()
         top_features['feature_name'] = top_features['feature'].map(
             lambda x: self.feature_names.get(x, x)
@@ -608,9 +1009,10 @@ class CyberbullyingMLAnalyzer:
         ax.grid(True, alpha=0.3, axis='x')
 
         plt.tight_layout()
-        plt.savefig(f'{OUTPUT_DIR}/classification_results.png', dpi=150, bbox_inches='tight')
+        plt.savefig(figure_path, dpi=150, bbox_inches='tight')
         plt.close()
-        print(f"已儲存: {OUTPUT_DIR}/classification_results.png")
+        self.figure_cache.record(figure_path, key)
+        print(f"已儲存: {figure_path}")
 
         return self
 
@@ -618,6 +1020,16 @@ class CyberbullyingMLAnalyzer:
         """繪製聚類結果視覺化"""
         print("\n繪製聚類結果...")
 
+        figure_path = f'{OUTPUT_DIR}/clustering_visualization.png'
+        key = self._stale_figure_key(figure_path, self.plot_clustering_results, [
+            self.X_scaled,
+            self.cluster_labels,
+            self.kmeans_model.cluster_centers_,
+            self.cluster_df[['cluster', 'total_score', 'q2', 'q7', 'q27_1']]
+        ])
+        if key is None:
+            return self
+
         # PCA 降維到 2D
         pca = PCA(n_components=2)
         X_pca = pca.fit_transform(self.X_scaled)
@@ -721,9 +1133,10 @@ class CyberbullyingMLAnalyzer:
         ax.grid(True, alpha=0.3)
 
         plt.tight_layout()
-        plt.savefig(f'{OUTPUT_DIR}/clustering_visualization.png', dpi=150, bbox_inches='tight')
+        plt.savefig(figure_path, dpi=150, bbox_inches='tight')
         plt.close()
-        print(f"已儲存: {OUTPUT_DIR}/clustering_visualization.png")
+        self.figure_cache.record(figure_path, key)
+        print(f"已儲存: {figure_path}")
 
         return self
 
@@ -736,12 +1149,20 @@ class CyberbullyingMLAnalyzer:
         try:
             import shap
 
-            # 使用 Random Forest 分類器
-            explainer = shap.TreeExplainer(self.rf_clf)
-
             # 取樣本
             sample_size = min(200, len(self.X_test_clf))
             X_sample = self.X_test_clf[:sample_size]
+            display_names = [self.feature_names.get(f, f) for f in self.feature_cols]
+
+            # 模型、樣本與繪圖程式都未變更時，連同 SHAP 值的計算一併略過
+            figure_paths = [f'{OUTPUT_DIR}/shap_summary.png', f'{OUTPUT_DIR}/shap_bar.png']
+            key = self._stale_figure_key(figure_paths, self.generate_shap_analysis,
+                                         [self.rf_clf, X_sample, display_names, shap.__version__])
+            if key is None:
+                return self
+
+            # 使用 Random Forest 分類器
+            explainer = shap.TreeExplainer(self.rf_clf)
 
             shap_values = explainer.shap_values(X_sample)
 
@@ -749,8 +1170,6 @@ class CyberbullyingMLAnalyzer:
             if isinstance(shap_values, list):
                 shap_values = shap_values[1]
 
-            display_names = [self.feature_names.get(f, f) for f in self.feature_cols]
-
             # SHAP Summary Plot
             fig, ax = plt.subplots(figsize=(12, 10))
             shap.summary_plot(shap_values, X_sample,
@@ -772,6 +1191,7 @@ class CyberbullyingMLAnalyzer:
             plt.savefig(f'{OUTPUT_DIR}/shap_bar.png', dpi=150, bbox_inches='tight')
             plt.close()
             print(f"已儲存: {OUTPUT_DIR}/shap_bar.png")
+            self.figure_cache.record(figure_paths, key)
 
             print("SHAP 分析完成!")
 
@@ -802,6 +1222,23 @@ class CyberbullyingMLAnalyzer:
         clf_summary.to_csv(f'{OUTPUT_DIR}/classification_comparison.csv', index=False, encoding='utf-8-sig')
         print(f"已儲存: {OUTPUT_DIR}/classification_comparison.csv")
 
+        # 三分類模型比較
+        if getattr(self, 'multi_results', None):
+            multi_summary = pd.DataFrame([
+                {
+                    'Model': name,
+                    'Accuracy': results['accuracy'],
+                    'Macro F1': results['macro_f1'],
+                    'Macro AUC': results['macro_auc'],
+                    **{f'AUC {cls}': score for cls, score in zip(RISK_CLASS_NAMES, results['class_auc'])},
+                    'CV Macro F1 Mean': results['cv_mean'],
+                    'CV Macro F1 Std': results['cv_std']
+                }
+                for name, results in self.multi_results.items()
+            ])
+            multi_summary.to_csv(f'{OUTPUT_DIR}/multiclass_comparison.csv', index=False, encoding='utf-8-sig')
+            print(f"已儲存: {OUTPUT_DIR}/multiclass_comparison.csv")
+
         # 回歸模型比較
         reg_summary = pd.DataFrame([
             {
@@ -826,23 +1263,27 @@ class CyberbullyingMLAnalyzer:
         print(f"已儲存: {OUTPUT_DIR}/clustering_results.csv")
 
         # 聚類摘要
-        cluster_summary = []
-        for i in range(len(np.unique(self.cluster_labels))):
-            group = self.cluster_df[self.cluster_df['cluster'] == i]
-            cluster_summary.append({
-                'Cluster': i,
-                'Size': len(group),
-                'Percentage': f"{len(group)/len(self.cluster_df)*100:.1f}%",
-                'Mean Score': group['total_score'].mean(),
-                'Std Score': group['total_score'].std(),
-                'Mean Age': 2024 - 1911 - group['q2'].mean(),
-                'Female Ratio': f"{(group['q1']==2).mean()*100:.1f}%",
-                'Mean Internet Hours': group['q7'].mean()
-            })
+        cluster_summary = [
+            {
+                'Cluster': int(profile['cluster']),
+                'Size': int(profile['n']),
+                'Percentage': f"{profile['share']*100:.1f}%",
+                'Mean Score': profile['score_mean'],
+                'Std Score': profile['score_std'],
+                'Mean Age': 2024 - 1911 - profile['birth_year'],
+                'Female Ratio': f"{profile['female_ratio']*100:.1f}%",
+                'Mean Internet Hours': profile['internet_hours']
+            }
+            for _, profile in self.cluster_profiles().iterrows()
+        ]
 
         pd.DataFrame(cluster_summary).to_csv(f'{OUTPUT_DIR}/cluster_summary.csv', index=False, encoding='utf-8-sig')
         print(f"已儲存: {OUTPUT_DIR}/cluster_summary.csv")
 
+        # 儀表板資料 (dashboard 於執行期載入，不需手動更新 analysisData.js)
+        from dashboard_export import export_dashboard_data
+        print(f"已儲存: {export_dashboard_data(self)} (提交此檔後 GitHub Pages 才會更新)")
+
         print("\n" + "=" * 60)
         print("所有結果已儲存!")
         print("=" * 60)
@@ -859,11 +1300,17 @@ def main():
 
     # 初始化分析器
     data_path = '../data/processed_data_with_score.csv'
-    analyzer = CyberbullyingMLAnalyzer(data_path)
+    margins_path = '../data/population_margins.json'
+    analyzer = CyberbullyingMLAnalyzer(data_path,
+                                       margins_path=margins_path if os.path.exists(margins_path) else None)
 
     # 執行分析流程
     analyzer.prepare_features()
+    analyzer.save_drift_reference()
     analyzer.train_classification_models()
+    # 訓練集的 out-of-fold 機率快取 (threshold_optimizer.py、calibration.py、stacking_ensemble.py 使用)
+    analyzer.save_oof_probabilities()
+    analyzer.train_multiclass_models()
     analyzer.train_regression_models()
     analyzer.kmeans_clustering(n_clusters=5)
 
@@ -0,0 +1,310 @@
+"""
+精簡模型檔格式
+=====================================
+以 pickle 儲存 200 棵樹的 Random Forest 與 scaler 動輒數 MB，評分程序冷啟動時載入很慢。
+
+本模組把 tree_compiler.py 編譯後的樹模型、標準化參數與缺失值中位數寫成單一二進位檔：
+
+    [magic 'CBMA'][版本 uint32][標頭長度 uint64][JSON 標頭][對齊填充][陣列區塊 ...]
+
+- 標頭記錄 feature_cols、特徵工程參數、模型中繼資料、各陣列的位移 / dtype / shape 與陣列區塊的 SHA-256
+- 節點索引依節點數選用 uint16 或 uint32，葉節點以 0 標記；葉值存為 float32
+- 分割門檻在不改變分割結果時存為 float32 (sklearn / XGBoost 的特徵本就以 float32 比較，
+  門檻向下取整到 float32 即完全等價)；LightGBM 以 float64 比較，門檻維持 float64
+- 載入時以 np.memmap 映射整個檔案，陣列皆為檔案上的視圖，
+  多個評分程序共用同一份作業系統頁面快取
+- 可附帶 calibration.py 的校準查表 (格式版本 2)，predict_proba 預設輸出校準後機率；
+  predict 仍以未校準分數比較門檻
+"""
+
+import hashlib
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+from drift_monitor import check_scoring_batch
+from feature_engineering import select_features
+from calibration import fit_calibration_maps
+from ml_models import CyberbullyingMLAnalyzer, OUTPUT_DIR
+from tree_compiler import CompiledTreeModel, TREE_MODEL_ATTRS, compile_model
+
+ARTIFACT_DIR = os.path.join(OUTPUT_DIR, 'artifacts')
+MAGIC = b'CBMA'
+FORMAT_VERSION = 2
+# 版本 1 沒有校準查表，仍可讀取
+SUPPORTED_VERSIONS = (1, 2)
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<4sIQ')  # magic, 版本, 標頭長度
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _float32_floor(threshold):
+    """不大於原門檻的最大 float32：對 float32 特徵 x，x <= t 與 x <= floor32(t) 等價"""
+    t32 = threshold.astype(np.float32)
+    too_big = t32.astype(np.float64) > threshold
+    t32[too_big] = np.nextafter(t32[too_big], np.float32(-np.inf))
+    return t32
+
+
+def quantize_compiled_model(model):
+    """將編譯後的樹模型陣列轉為精簡的 dtype，回傳 (陣列 dict, 中繼資料)"""
+    index_dtype = np.uint16 if model.n_nodes <= np.iinfo(np.uint16).max else np.uint32
+    # 葉節點的子節點以 0 標記 (節點 0 是第一棵樹的根，不會是子節點)
+    left = np.where(model.left > 0, model.left, 0).astype(index_dtype)
+    right = np.where(model.left > 0, model.right, 0).astype(index_dtype)
+
+    if model.input_dtype == 'float32':
+        threshold = _float32_floor(model.threshold.astype(np.float64))
+    else:
+        threshold = model.threshold.astype(np.float64)
+
+    feature_dtype = np.uint8 if model.n_features <= np.iinfo(np.uint8).max else np.uint16
+    arrays = {
+        'feature': model.feature.astype(feature_dtype),
+        'threshold': threshold,
+        'left': left,
+        'right': right,
+        'value': model.value.astype(np.float32),
+        'default_left': model.default_left.astype(bool),
+        'missing_mode': model.missing_mode.astype(np.int8),
+        'roots': model.roots.astype(index_dtype)
+    }
+    meta = {
+        'aggregation': model.aggregation, 'base_score': model.base_score,
+        'sigmoid_scale': model.sigmoid_scale, 'strict': model.strict,
+        'input_dtype': model.input_dtype, 'max_depth': model.max_depth,
+        'n_features': model.n_features
+    }
+    return arrays, meta
+
+
+def write_artifact(path, model, feature_cols, scaler_mean, scaler_scale, medians, feature_params=None,
+                   calibration=None):
+    """
+    寫入精簡模型檔
+
+    Parameters:
+    -----------
+    path : str
+        輸出路徑
+    model : CompiledTreeModel
+        編譯後的樹模型
+    feature_cols : list of str
+        特徵欄位 (評分時依此順序取欄位)
+    scaler_mean, scaler_scale : array
+        StandardScaler 的 mean_ 與 scale_
+    medians : array
+        缺失值填補用的中位數 (與 feature_cols 同順序)
+    feature_params : dict or None
+        訓練時的特徵工程參數 (評分時補算衍生特徵沿用)
+    calibration : CalibrationMap or None
+        機率校準查表 (calibration.py)
+
+    Returns:
+    --------
+    int
+        檔案大小 (bytes)
+    """
+    arrays, model_meta = quantize_compiled_model(model)
+    arrays['scaler_mean'] = np.asarray(scaler_mean, dtype=np.float64)
+    arrays['scaler_scale'] = np.asarray(scaler_scale, dtype=np.float64)
+    arrays['medians'] = np.asarray(medians, dtype=np.float64)
+    if calibration is not None:
+        arrays['calibration_x'] = calibration.x.astype(np.float64)
+        arrays['calibration_y'] = calibration.y.astype(np.float64)
+
+    # 陣列區塊的位移以資料區起點為 0，每個陣列都對齊 ALIGNMENT
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += array.nbytes
+    payload = bytearray(offset)
+    for name, array in arrays.items():
+        start = layout[name]['offset']
+        payload[start:start + array.nbytes] = np.ascontiguousarray(array).tobytes()
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'feature_cols': list(feature_cols),
+        'feature_params': feature_params or {},
+        'calibration_method': None if calibration is None else calibration.method,
+        'model': model_meta,
+        'arrays': layout,
+        'payload_bytes': len(payload),
+        'sha256': hashlib.sha256(payload).hexdigest()
+    }, ensure_ascii=False).encode('utf-8')
+
+    data_start = _align(PREAMBLE.size + len(header))
+    with open(path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(b'\0' * (data_start - PREAMBLE.size - len(header)))
+        f.write(payload)
+
+    return data_start + len(payload)
+
+
+class ModelArtifact:
+    """記憶體映射的精簡模型檔：原始特徵 → 填補缺失值 → 標準化 → 樹模型評分"""
+
+    def __init__(self, path, verify=True):
+        """
+        Parameters:
+        -----------
+        path : str
+            模型檔路徑
+        verify : bool
+            是否以 SHA-256 驗證陣列區塊 (需讀取整個檔案)
+        """
+        with open(path, 'rb') as f:
+            magic, version, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f"不是模型檔: {path}")
+            if version not in SUPPORTED_VERSIONS:
+                raise ValueError(f"不支援的模型檔版本: {version}")
+            self.header = json.loads(f.read(header_len).decode('utf-8'))
+
+        data_start = _align(PREAMBLE.size + header_len)
+        self._mmap = np.memmap(path, dtype=np.uint8, mode='r', offset=data_start,
+                               shape=(self.header['payload_bytes'],))
+        if verify and hashlib.sha256(self._mmap).hexdigest() != self.header['sha256']:
+            raise ValueError(f"模型檔校驗失敗: {path}")
+
+        arrays = {}
+        for name, spec in self.header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            start = spec['offset']
+            arrays[name] = (self._mmap[start:start + count * dtype.itemsize]
+                            .view(dtype).reshape(spec['shape']))
+
+        self.feature_cols = self.header['feature_cols']
+        self.feature_params = self.header.get('feature_params', {})
+        self.scaler_mean = arrays.pop('scaler_mean')
+        self.scaler_scale = arrays.pop('scaler_scale')
+        self.medians = arrays.pop('medians')
+        self.calibration_x = arrays.pop('calibration_x', None)
+        self.calibration_y = arrays.pop('calibration_y', None)
+        self.calibration_method = self.header.get('calibration_method')
+        self.model = CompiledTreeModel(**arrays, **self.header['model'])
+
+    def transform(self, X):
+        """原始問卷欄位 (DataFrame，會補算衍生特徵) 或已排好欄位的陣列 → 標準化特徵"""
+        if isinstance(X, pd.DataFrame):
+            X = select_features(X, self.feature_cols, self.feature_params).to_numpy(dtype=float)
+        X = np.array(X, dtype=float, ndmin=2)
+        X = np.where(np.isnan(X), self.medians, X)
+        return (X - self.scaler_mean) / self.scaler_scale
+
+    def predict_proba(self, X, check_drift=True, calibrated=True):
+        """
+        評分；DataFrame 輸入時先檢查與訓練資料的分布漂移 (drift_monitor.py)，有漂移則拋出例外
+
+        calibrated 為 True 且模型檔附帶校準查表時，輸出校準後的機率
+        """
+        if check_drift and isinstance(X, pd.DataFrame):
+            check_scoring_batch(X, self.feature_cols, self.feature_params)
+        prob = self.model.predict_proba(self.transform(X))
+        if not calibrated or self.calibration_x is None:
+            return prob
+        positive = np.interp(prob[:, 1], self.calibration_x, self.calibration_y)
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X, threshold=0.5, check_drift=True):
+        """以未校準分數比較門檻 (與訓練時及 threshold_optimizer.py 的門檻一致)"""
+        return (self.predict_proba(X, check_drift, calibrated=False)[:, 1] > threshold).astype(int)
+
+
+def export_model_artifacts(analyzer, output_dir=ARTIFACT_DIR, atol=1e-6):
+    """
+    將分析器中已訓練的樹模型輸出為精簡模型檔，並驗證與原模型預測一致
+
+    Returns:
+    --------
+    dict
+        模型名稱 -> 模型檔路徑
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    medians = analyzer.X[analyzer.feature_cols].median().to_numpy()
+    raw = analyzer.df
+    # 以訓練集內的 out-of-fold 機率擬合，對應此分析器的正式模型
+    calibration_maps = fit_calibration_maps(analyzer)
+
+    paths = {}
+    for model_name, attr in TREE_MODEL_ATTRS.items():
+        model = getattr(analyzer, attr, None)
+        if model is None:
+            continue
+
+        path = os.path.join(output_dir, f'{attr}.cbma')
+        calibration = calibration_maps.get(model_name)
+        size = write_artifact(path, compile_model(model), analyzer.feature_cols,
+                              analyzer.scaler.mean_, analyzer.scaler.scale_, medians,
+                              analyzer.feature_params, calibration)
+
+        expected = model.predict_proba(analyzer.X_scaled)[:, 1]
+        # 驗證對象即訓練資料，不需漂移檢查；比較未校準分數與校準後機率
+        artifact = ModelArtifact(path)
+        actual = artifact.predict_proba(raw, check_drift=False, calibrated=False)[:, 1]
+        max_error = np.max(np.abs(expected - actual))
+        if calibration is not None:
+            calibrated = artifact.predict_proba(raw, check_drift=False)[:, 1]
+            max_error = max(max_error, np.max(np.abs(calibration(expected) - calibrated)))
+        del artifact
+        if max_error > atol:
+            os.remove(path)
+            raise ValueError(f"{model_name} 模型檔預測不一致 (最大誤差 {max_error:.2e})")
+
+        paths[model_name] = path
+        method = calibration.method if calibration is not None else '無'
+        print(f"  {model_name:<18} {size / 1024:>8.1f} KB，校準 {method}，最大誤差 {max_error:.2e} → {path}")
+
+    return paths
+
+
+def main():
+    """主程式"""
+    import pickle
+
+    print("=" * 60)
+    print("精簡模型檔輸出")
+    print("=" * 60)
+
+    analyzer = CyberbullyingMLAnalyzer('../data/processed_data_with_score.csv')
+    analyzer.prepare_features()
+    analyzer.train_classification_models()
+
+    print("\n【輸出並驗證】")
+    paths = export_model_artifacts(analyzer)
+
+    # 與 pickle (模型 + scaler) 比較檔案大小與冷啟動載入時間
+    print("\n【與 pickle 比較】")
+    for model_name, path in paths.items():
+        model = getattr(analyzer, TREE_MODEL_ATTRS[model_name])
+        pickled = pickle.dumps((model, analyzer.scaler))
+
+        start = time.perf_counter()
+        pickle.loads(pickled)
+        pickle_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        ModelArtifact(path)
+        artifact_ms = (time.perf_counter() - start) * 1000
+
+        print(f"  {model_name:<18} pickle {len(pickled) / 1024:>8.1f} KB / {pickle_ms:.2f} ms，"
+              f"模型檔 {os.path.getsize(path) / 1024:>8.1f} KB / {artifact_ms:.2f} ms")
+
+    return paths
+
+
+if __name__ == "__main__":
+    paths = main()
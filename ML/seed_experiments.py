@@ -0,0 +1,220 @@
+"""
+多亂數種子實驗
+=====================================
+ml_models.py 的資料分割、各模型與 K-Means 都固定 random_state=42，
+報告的 F1 / AUC 只代表單一次抽樣的結果。
+
+本模組以多個亂數種子重複整個訓練 / 評估流程 (程序池平行執行)，
+每個種子的指標以長表格式快取於 output/seed_experiments/seed_metrics.csv，
+已快取的種子會直接略過，重新執行時只計算新增的種子；
+最後彙整各指標的平均、標準差與 95% 信賴區間。
+
+- 快取的每列記錄實驗情境的識別碼 (資料檔、母體邊際分布、selected_features.json、
+  best_params.json 的雜湊)，任一項變更時舊的種子指標會被捨棄並重新計算
+
+- 每個種子重新產生訓練 / 測試分割與洗牌後的 5-fold 分割，CV 指標才會隨種子變動
+- 子程序不寫入任何共用輸出 (out-of-fold 快取、漂移參考分布、衍生特徵快取)，
+  只回傳指標，由主程序寫入種子快取
+- 有母體邊際分布時與 ml_models.py 相同以調查權數訓練與聚類
+"""
+
+import contextlib
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+from sklearn.model_selection import KFold, StratifiedKFold
+
+from ml_models import BEST_PARAMS_PATH, CyberbullyingMLAnalyzer, OUTPUT_DIR, SELECTED_FEATURES_PATH
+
+SEED_DIR = os.path.join(OUTPUT_DIR, 'seed_experiments')
+# 種子流程變更時遞增，使舊的種子快取失效 (v2：每個種子重新洗牌 CV 分割；v3：分類 CV 只在訓練集內)
+SEED_METRICS_VERSION = 3
+METRICS_PATH = os.path.join(SEED_DIR, f'seed_metrics_v{SEED_METRICS_VERSION}.csv')
+WEIGHTED_METRICS_PATH = os.path.join(SEED_DIR, f'seed_metrics_v{SEED_METRICS_VERSION}_weighted.csv')
+SUMMARY_PATH = os.path.join(SEED_DIR, 'seed_summary.csv')
+METRIC_COLUMNS = ['seed', 'task', 'model', 'metric', 'value', 'context']
+
+
+# ============================================
+# 子程序工作函數
+# ============================================
+_worker_analyzer = None
+
+
+def _init_worker(data_path, margins_path=None):
+    """子程序初始化：每個子程序只載入與前處理一次資料 (不讀寫衍生特徵快取)"""
+    global _worker_analyzer
+    with contextlib.redirect_stdout(io.StringIO()):
+        # 子程序之間已平行，模型內部只使用單一執行緒
+        _worker_analyzer = CyberbullyingMLAnalyzer(data_path, n_jobs=1, margins_path=margins_path)
+        _worker_analyzer.prepare_features(cache_features=False)
+
+
+def experiment_context(data_path, margins_path=None):
+    """
+    種子實驗情境的識別碼：資料、權數、特徵選取與超參數結果的內容雜湊
+
+    不存在的檔案以空內容計算，因此產生或刪除 selected_features.json 等也會使快取失效
+    """
+    digest = hashlib.sha256(f'v{SEED_METRICS_VERSION}'.encode('utf-8'))
+    for path in [data_path, margins_path, SELECTED_FEATURES_PATH, BEST_PARAMS_PATH]:
+        digest.update(b'|')
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def run_seed(seed, context='', n_clusters=5):
+    """以指定種子執行一次完整的訓練 / 評估流程，回傳長表格式的指標"""
+    analyzer = _worker_analyzer
+    # 訓練 / 測試分割 (_classification_split、回歸的 train_test_split) 依 random_state 產生；
+    # CV 分割在 prepare_features 只建立一次且未洗牌，每個種子重新產生
+    analyzer.random_state = seed
+    analyzer.cv_splitter = StratifiedKFold(n_splits=5, shuffle=True, random_state=seed)
+    analyzer.cv_splits = list(analyzer.cv_splitter.split(analyzer.X_scaled, analyzer.y_binary))
+    analyzer.regression_cv = KFold(n_splits=5, shuffle=True, random_state=seed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer.train_classification_models()
+        analyzer.train_regression_models()
+
+        kmeans = KMeans(n_clusters=n_clusters, random_state=seed, n_init=10)
+        labels = kmeans.fit_predict(analyzer.X_scaled, sample_weight=analyzer.sample_weight)
+
+    rows = []
+    for model_name, results in analyzer.clf_results.items():
+        for metric in ['accuracy', 'f1', 'auc', 'cv_mean']:
+            rows.append((seed, 'classification', model_name, metric, results[metric], context))
+    for model_name, results in analyzer.reg_results.items():
+        for metric in ['r2', 'rmse', 'mae', 'cv_mean']:
+            rows.append((seed, 'regression', model_name, metric, results[metric], context))
+    rows.append((seed, 'clustering', f'KMeans (K={n_clusters})', 'silhouette',
+                 silhouette_score(analyzer.X_scaled, labels), context))
+    rows.append((seed, 'clustering', f'KMeans (K={n_clusters})', 'inertia', kmeans.inertia_, context))
+
+    return pd.DataFrame(rows, columns=METRIC_COLUMNS)
+
+
+def load_cached_metrics(path=METRICS_PATH, context=None):
+    """
+    讀取已快取的種子指標
+
+    提供 context 時捨棄其他情境的指標 (並改寫快取檔)，這些種子會重新計算
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+    metrics = pd.read_csv(path, dtype={'context': str})
+    if context is None:
+        return metrics
+
+    if 'context' not in metrics.columns:
+        metrics['context'] = ''
+    stale = metrics['context'] != context
+    if stale.any():
+        print(f"捨棄 {metrics.loc[stale, 'seed'].nunique()} 個資料或設定已變更的種子快取")
+        metrics = metrics[~stale]
+        metrics.to_csv(path, index=False)
+    return metrics
+
+
+def summarize_metrics(metrics, confidence=0.95):
+    """彙整各指標跨種子的平均、標準差與信賴區間"""
+    grouped = metrics.groupby(['task', 'model', 'metric'])['value']
+    summary = grouped.agg(['mean', 'std', 'count']).reset_index()
+
+    # t 分配信賴區間 (單一種子時無法估計)
+    t_crit = stats.t.ppf((1 + confidence) / 2, np.maximum(summary['count'] - 1, 1))
+    half_width = t_crit * summary['std'] / np.sqrt(summary['count'])
+    summary['ci_low'] = summary['mean'] - half_width
+    summary['ci_high'] = summary['mean'] + half_width
+    return summary
+
+
+def run_seed_experiments(data_path, seeds=range(30), n_jobs=None,
+                         metrics_path=None, margins_path=None):
+    """
+    以多個種子平行執行訓練流程，已快取的種子會略過
+
+    Parameters:
+    -----------
+    data_path : str
+        資料檔路徑
+    seeds : iterable of int
+        要執行的亂數種子
+    n_jobs : int or None
+        子程序數量，None 表示使用全部 CPU
+    metrics_path : str or None
+        種子指標快取檔；None 時依是否加權選用 METRICS_PATH 或 WEIGHTED_METRICS_PATH
+    margins_path : str or None
+        母體邊際分布 JSON (survey_weights.py)；提供時以調查權數訓練與聚類
+
+    Returns:
+    --------
+    metrics : DataFrame
+        所有指定種子的長表格式指標
+    summary : DataFrame
+        各指標的平均、標準差與信賴區間
+    """
+    if metrics_path is None:
+        metrics_path = METRICS_PATH if margins_path is None else WEIGHTED_METRICS_PATH
+    os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+    seeds = list(seeds)
+    context = experiment_context(data_path, margins_path)
+    cached = load_cached_metrics(metrics_path, context)
+    done = set(cached['seed'].astype(int))
+    pending = [seed for seed in seeds if seed not in done]
+
+    print(f"種子總數: {len(seeds)} (已快取 {len(seeds) - len(pending)}，待執行 {len(pending)})")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 initializer=_init_worker,
+                                 initargs=(data_path, margins_path)) as executor:
+            futures = {executor.submit(run_seed, seed, context): seed for seed in pending}
+            for future in as_completed(futures):
+                result = future.result()
+                # 每完成一個種子就寫入快取，中斷後可從此處接續
+                result.to_csv(metrics_path, mode='a', index=False,
+                              header=not os.path.exists(metrics_path))
+                print(f"  完成種子 {futures[future]}")
+
+    metrics = load_cached_metrics(metrics_path, context)
+    metrics = metrics[metrics['seed'].isin(seeds)]
+    return metrics, summarize_metrics(metrics)
+
+
+def main():
+    """主程式"""
+    print("=" * 60)
+    print("多亂數種子實驗")
+    print("=" * 60)
+
+    data_path = '../data/processed_data_with_score.csv'
+    margins_path = '../data/population_margins.json'
+    metrics, summary = run_seed_experiments(
+        data_path, seeds=range(30),
+        margins_path=margins_path if os.path.exists(margins_path) else None
+    )
+
+    summary.to_csv(SUMMARY_PATH, index=False, encoding='utf-8-sig')
+    print(f"已儲存: {SUMMARY_PATH}")
+
+    print("\n【分類模型 (平均 ± 95% CI)】")
+    clf = summary[summary['task'] == 'classification']
+    for _, row in clf.iterrows():
+        print(f"  {row['model']:<20} {row['metric']:<9} {row['mean']:.4f} "
+              f"[{row['ci_low']:.4f}, {row['ci_high']:.4f}]")
+
+    return summary
+
+
+if __name__ == "__main__":
+    summary = main()
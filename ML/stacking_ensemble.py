@@ -0,0 +1,237 @@
+"""
+堆疊 (Stacking) 集成模型
+=====================================
+各分類器互有長短 (LR 的 CV F1 最高、RF 的 Accuracy 最高)，本模組以
+ml_models.py 快取的 out-of-fold 機率 (output/oof_probabilities.npz) 訓練 meta 學習器，
+基底模型直接沿用 train_classification_models 已訓練好的模型，不重新訓練。
+
+- 快取的 out-of-fold 機率只在訓練集列內做交叉驗證產生 (fold 模型從未看過測試集)，
+  測試集保留作評估
+- meta 學習器以 class_weight='balanced' 訓練，輸出並非校準後的機率；依快取的 fold
+  交叉擬合 meta 學習器取得堆疊的 out-of-fold 機率，再以 calibration.py 擬合校準查表，
+  predict_proba 預設輸出校準後機率，predict 仍以未校準分數比較門檻
+- 整個堆疊模型 (缺失值中位數、標準化、基底模型、meta 學習器) 存成單一檔案
+- 預測時基底模型以執行緒平行計算，一次向量化呼叫即可對多筆資料評分
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+
+from calibration import select_calibration
+from drift_monitor import check_scoring_batch
+from feature_engineering import select_features
+from ml_models import CyberbullyingMLAnalyzer, OUTPUT_DIR, OOF_CACHE_PATH
+from threshold_optimizer import load_oof_cache
+
+STACKING_MODEL_PATH = os.path.join(OUTPUT_DIR, 'stacking_ensemble.joblib')
+
+# clf_results 的模型名稱與分析器上已訓練模型屬性的對照
+BASE_MODEL_ATTRS = {
+    'Logistic Regression': 'lr_model',
+    'Random Forest': 'rf_clf',
+    'Gradient Boosting': 'gb_clf',
+    'XGBoost': 'xgb_clf',
+    'LightGBM': 'lgb_clf'
+}
+
+
+class StackingEnsemble:
+    """以基底模型預測機率為輸入的堆疊集成模型"""
+
+    def __init__(self, feature_cols, medians, scaler, base_models, meta_model, threshold=0.5,
+                 feature_params=None, calibration=None):
+        """
+        Parameters:
+        -----------
+        feature_cols : list of str
+            原始特徵欄位 (與 prepare_features 相同順序)
+        medians : Series
+            缺失值填補用的中位數
+        scaler : StandardScaler
+            已擬合的標準化器
+        base_models : dict
+            模型名稱 -> 已訓練的基底模型 (順序即 meta 特徵順序)
+        meta_model : LogisticRegression
+            以基底模型機率訓練的 meta 學習器
+        threshold : float
+            判為高風險的機率門檻
+        feature_params : dict or None
+            訓練時的特徵工程參數 (補算衍生特徵時沿用，不以評分批次重新估計)
+        calibration : CalibrationMap or None
+            meta 學習器輸出的校準查表 (calibration.py)
+        """
+        self.feature_cols = list(feature_cols)
+        self.feature_params = feature_params or {}
+        self.medians = medians
+        self.scaler = scaler
+        self.base_models = base_models
+        self.meta_model = meta_model
+        self.threshold = threshold
+        self.calibration = calibration
+
+    def _scale(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = select_features(X, self.feature_cols, self.feature_params).fillna(self.medians)
+        return self.scaler.transform(np.asarray(X, dtype=float))
+
+    def base_probabilities(self, X_scaled, n_threads=None):
+        """以執行緒平行計算各基底模型的高風險機率 (n × 模型數)"""
+        models = list(self.base_models.values())
+        n_threads = n_threads or len(models)
+        # 樹模型的預測多在 C 端執行並釋放 GIL，執行緒即可平行
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            probs = list(executor.map(lambda m: m.predict_proba(X_scaled)[:, 1], models))
+        return np.column_stack(probs)
+
+    def predict_proba(self, X, n_threads=None, check_drift=True, calibrated=True):
+        """
+        對多筆資料評分
+
+        Parameters:
+        -----------
+        X : DataFrame or array
+            DataFrame 時為原始問卷欄位 (會補算衍生特徵、填補缺失值並標準化)；
+            array 時視為已依 feature_cols 排列的特徵矩陣
+        check_drift : bool
+            DataFrame 輸入時先與訓練資料比較分布，有漂移則拋出例外 (drift_monitor.py)
+        calibrated : bool
+            有校準查表時輸出校準後的機率
+
+        Returns:
+        --------
+        array (n × 2)
+        """
+        if check_drift and isinstance(X, pd.DataFrame):
+            check_scoring_batch(X, self.feature_cols, self.feature_params)
+        prob = self.meta_model.predict_proba(self.base_probabilities(self._scale(X), n_threads))
+        if not calibrated or self.calibration is None:
+            return prob
+        positive = self.calibration(prob[:, 1])
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X, n_threads=None, check_drift=True):
+        """以未校準的 meta 分數比較門檻"""
+        prob = self.predict_proba(X, n_threads, check_drift, calibrated=False)
+        return (prob[:, 1] >= self.threshold).astype(int)
+
+    def save(self, path=STACKING_MODEL_PATH):
+        joblib.dump(self, path, compress=3)
+        print(f"已儲存: {path}")
+        return path
+
+    @staticmethod
+    def load(path=STACKING_MODEL_PATH):
+        return joblib.load(path)
+
+
+def build_stacking_ensemble(analyzer, cache_path=OOF_CACHE_PATH, C=1.0):
+    """
+    以快取的訓練集 out-of-fold 機率訓練 meta 學習器，組成堆疊模型
+
+    Parameters:
+    -----------
+    analyzer : CyberbullyingMLAnalyzer
+        已執行 prepare_features 與 train_classification_models
+    cache_path : str
+        out-of-fold 機率快取 (ml_models.py 的 save_oof_probabilities)
+    C : float
+        meta 邏輯迴歸的正則化強度倒數
+
+    Returns:
+    --------
+    ensemble : StackingEnsemble
+    comparison : DataFrame
+        測試集上基底模型與堆疊模型的比較
+    """
+    cache = load_oof_cache(cache_path)
+    model_names = cache['model_names']
+
+    # 快取須來自同一份資料與同一個訓練 / 測試分割
+    y = analyzer.y_binary.to_numpy()
+    train_idx, test_idx = analyzer.clf_train_idx, analyzer.clf_test_idx
+    if (not np.array_equal(cache['rows'], train_idx) or
+            not np.array_equal(cache['y_binary'], y[train_idx])):
+        raise ValueError("out-of-fold 機率快取與目前資料或分割不一致，請重新執行 ml_models.py")
+
+    base_models = {name: getattr(analyzer, BASE_MODEL_ATTRS[name]) for name in model_names}
+
+    # meta 學習器只看訓練集列的 out-of-fold 機率，避免測試集資訊進入堆疊
+    y_train = y[train_idx]
+    weights = analyzer._fit_weights(train_idx)
+    meta_model = LogisticRegression(C=C, class_weight='balanced', max_iter=1000)
+    meta_model.fit(cache['oof_probs'], y_train, sample_weight=weights)
+
+    # 依快取的 fold 交叉擬合 meta 學習器，取得堆疊的 out-of-fold 機率以擬合校準查表
+    folds = cache['folds']
+    stack_oof = np.empty(len(y_train))
+    for fold in np.unique(folds):
+        test = folds == fold
+        fold_model = clone(meta_model).fit(cache['oof_probs'][~test], y_train[~test],
+                                           sample_weight=None if weights is None else weights[~test])
+        stack_oof[test] = fold_model.predict_proba(cache['oof_probs'][test])[:, 1]
+    _, calibration, _ = select_calibration(stack_oof, y_train, folds)
+
+    ensemble = StackingEnsemble(
+        feature_cols=analyzer.feature_cols,
+        medians=analyzer.X[analyzer.feature_cols].median(),
+        scaler=analyzer.scaler,
+        base_models=base_models,
+        meta_model=meta_model,
+        feature_params=analyzer.feature_params,
+        calibration=calibration
+    )
+
+    # 測試集：基底模型機率已在 clf_results 中，直接沿用
+    test_base = np.column_stack([analyzer.clf_results[name]['y_prob'] for name in model_names])
+    y_test = y[test_idx]
+    stack_prob = meta_model.predict_proba(test_base)[:, 1]
+
+    rows = [{'Model': name,
+             'Accuracy': analyzer.clf_results[name]['accuracy'],
+             'F1 Score': analyzer.clf_results[name]['f1'],
+             'AUC-ROC': analyzer.clf_results[name]['auc']} for name in model_names]
+    stack_pred = (stack_prob >= ensemble.threshold).astype(int)
+    rows.append({'Model': 'Stacking (LR meta)',
+                 'Accuracy': accuracy_score(y_test, stack_pred),
+                 'F1 Score': f1_score(y_test, stack_pred),
+                 'AUC-ROC': roc_auc_score(y_test, stack_prob)})
+
+    return ensemble, pd.DataFrame(rows)
+
+
+def main():
+    """主程式"""
+    print("=" * 60)
+    print("堆疊集成模型")
+    print("=" * 60)
+
+    analyzer = CyberbullyingMLAnalyzer('../data/processed_data_with_score.csv')
+    analyzer.prepare_features()
+    analyzer.train_classification_models()
+
+    ensemble, comparison = build_stacking_ensemble(analyzer)
+
+    print("\n【meta 學習器權重】")
+    for name, coef in zip(ensemble.base_models, ensemble.meta_model.coef_[0]):
+        print(f"  {name:<20} {coef:+.4f}")
+    print(f"機率校準: {ensemble.calibration.method} (查表 {len(ensemble.calibration.x)} 點)")
+
+    print("\n【測試集比較】")
+    print(comparison.round(4).to_string(index=False))
+    comparison.to_csv(os.path.join(OUTPUT_DIR, 'stacking_comparison.csv'),
+                      index=False, encoding='utf-8-sig')
+
+    ensemble.save()
+
+    return ensemble, comparison
+
+
+if __name__ == "__main__":
+    ensemble, comparison = main()
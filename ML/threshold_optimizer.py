@@ -0,0 +1,216 @@
+"""
+決策門檻與高風險定義最佳化
+=====================================
+各分類器目前以 0.5 作為預測門檻，高風險標籤固定為 total_score 第 75 百分位數。
+本模組只讀取 ml_models.py 快取的 out-of-fold 機率 (output/oof_probabilities.npz，
+只含分類訓練集列，測試集不參與門檻選擇)，不重新訓練任何模型：
+
+- 每個模型只排序一次機率，以累積和一次算出所有門檻下的 precision / recall / F1
+- 依誤判成本 (偽陽性 / 偽陰性) 選出成本最低的操作點
+- 以同一組機率排序評估其他百分位數的「高風險」定義 (AUC 與最佳 F1)
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from ml_models import OUTPUT_DIR, OOF_CACHE_PATH
+
+THRESHOLDS_PATH = os.path.join(OUTPUT_DIR, 'decision_thresholds.json')
+
+# 誤判成本：漏掉一位高風險者 (偽陰性) 的代價設為誤報 (偽陽性) 的 3 倍
+COST_FP = 1.0
+COST_FN = 3.0
+
+
+def load_oof_cache(path=OOF_CACHE_PATH):
+    """讀取 out-of-fold 機率快取"""
+    with np.load(path) as cache:
+        if 'rows' not in cache.files:
+            raise ValueError(f"{path} 為舊格式 (含測試集列)，請重新執行 ml_models.py")
+        return {
+            'model_names': [str(name) for name in cache['model_names']],
+            'rows': cache['rows'],
+            'y_binary': cache['y_binary'],
+            'total_score': cache['total_score'],
+            'folds': cache['folds'],
+            'oof_probs': cache['oof_probs']
+        }
+
+
+def sort_probabilities(y_prob):
+    """
+    排序一次機率，供同一模型在多組標籤下重複使用
+
+    Returns:
+    --------
+    dict
+        order (由高到低的排序索引)、last_of_tie (每組同分值的最後一個位置)、
+        thresholds (候選門檻，由高到低)、ranks (由低到高的排名，同分取平均)
+    """
+    y_prob = np.asarray(y_prob, dtype=float)
+    order = np.argsort(-y_prob, kind='mergesort')
+    prob_sorted = y_prob[order]
+
+    # 同分的機率只能一起判斷，取每組同分值的最後一個位置
+    last_of_tie = np.r_[prob_sorted[1:] != prob_sorted[:-1], True]
+
+    # 由高到低第 p 個位置 (0 起算) 的由低到高排名為 n - p，同分組取平均
+    n = len(y_prob)
+    ends = np.flatnonzero(last_of_tie) + 1
+    starts = np.r_[0, ends[:-1]]
+    ranks = np.empty(n)
+    ranks[order] = np.repeat(n - (starts + ends - 1) / 2.0, ends - starts)
+
+    return {'order': order, 'last_of_tie': last_of_tie,
+            'thresholds': prob_sorted[last_of_tie], 'ranks': ranks}
+
+
+def threshold_curve(y_true, y_prob, ranking=None):
+    """
+    一次排序計算所有候選門檻的混淆矩陣與指標
+
+    以「機率 >= 門檻 判為高風險」為準，候選門檻為每個不重複的機率值。
+
+    Parameters:
+    -----------
+    ranking : dict or None
+        sort_probabilities(y_prob) 的結果；提供時不再排序
+
+    Returns:
+    --------
+    DataFrame
+        threshold, tp, fp, fn, tn, precision, recall, f1
+    """
+    y_true = np.asarray(y_true).astype(np.int64)
+    ranking = ranking or sort_probabilities(y_prob)
+
+    last_of_tie = ranking['last_of_tie']
+    tp = np.cumsum(y_true[ranking['order']])[last_of_tie]
+    n_pred = np.arange(1, len(y_true) + 1)[last_of_tie]
+
+    n_pos = y_true.sum()
+    fp = n_pred - tp
+    fn = n_pos - tp
+    tn = len(y_true) - n_pos - fp
+
+    precision = tp / n_pred
+    recall = tp / n_pos if n_pos > 0 else np.zeros_like(tp, dtype=float)
+    f1 = 2 * tp / (n_pred + n_pos)
+
+    return pd.DataFrame({
+        'threshold': ranking['thresholds'], 'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+        'precision': precision, 'recall': recall, 'f1': f1
+    })
+
+
+def rank_auc(y_true, y_prob, ranking=None):
+    """以排名 (Mann-Whitney U) 計算 AUC，同分取平均排名"""
+    y_true = np.asarray(y_true).astype(bool)
+    ranks = (ranking or sort_probabilities(y_prob))['ranks']
+
+    n_pos = y_true.sum()
+    n_neg = len(y_true) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return np.nan
+    return (ranks[y_true].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+
+
+def select_operating_points(curve, cost_fp=COST_FP, cost_fn=COST_FN):
+    """由門檻曲線選出 F1 最大與誤判成本最低的操作點"""
+    cost = cost_fp * curve['fp'] + cost_fn * curve['fn']
+    best_f1 = curve.iloc[int(np.argmax(curve['f1'].to_numpy()))]
+    best_cost = curve.iloc[int(np.argmin(cost.to_numpy()))]
+    return {
+        'f1_threshold': float(best_f1['threshold']),
+        'f1_at_best': float(best_f1['f1']),
+        'f1_precision': float(best_f1['precision']),
+        'f1_recall': float(best_f1['recall']),
+        'cost_threshold': float(best_cost['threshold']),
+        'cost_at_best': float(cost.min()),
+        'cost_precision': float(best_cost['precision']),
+        'cost_recall': float(best_cost['recall'])
+    }
+
+
+def optimize_thresholds(cache, cost_fp=COST_FP, cost_fn=COST_FN):
+    """對每個模型計算 0.5 門檻與最佳操作點的比較"""
+    y_true = cache['y_binary']
+    rows = []
+    for j, model_name in enumerate(cache['model_names']):
+        prob = cache['oof_probs'][:, j]
+        ranking = sort_probabilities(prob)
+        curve = threshold_curve(y_true, prob, ranking)
+
+        pred_default = prob >= 0.5
+        tp = int(np.sum(pred_default & (y_true == 1)))
+        f1_default = 2 * tp / (pred_default.sum() + y_true.sum())
+
+        rows.append({'Model': model_name, 'AUC': rank_auc(y_true, prob, ranking),
+                     'F1 @0.5': f1_default,
+                     **select_operating_points(curve, cost_fp, cost_fn)})
+    return pd.DataFrame(rows)
+
+
+def evaluate_label_quantiles(cache, quantiles=(0.70, 0.75, 0.80, 0.85, 0.90)):
+    """
+    以其他百分位數重新定義高風險，評估既有機率的排序能力
+
+    機率是以第 75 百分位數標籤訓練的，因此結果反映的是「同一個風險分數」
+    在不同定義下的鑑別力；若要針對新定義最佳化仍需重新訓練。
+    """
+    total_score = cache['total_score']
+    # 每個模型只排序一次，所有百分位數定義共用
+    rankings = [sort_probabilities(cache['oof_probs'][:, j]) for j in range(len(cache['model_names']))]
+    rows = []
+    for q in quantiles:
+        y_q = (total_score >= np.quantile(total_score, q)).astype(int)
+        for j, model_name in enumerate(cache['model_names']):
+            prob = cache['oof_probs'][:, j]
+            curve = threshold_curve(y_q, prob, rankings[j])
+            best = curve.iloc[int(np.argmax(curve['f1'].to_numpy()))]
+            rows.append({
+                'Quantile': q, 'Model': model_name, 'Positive Rate': y_q.mean(),
+                'AUC': rank_auc(y_q, prob, rankings[j]), 'Best F1': best['f1'],
+                'Best Threshold': best['threshold']
+            })
+    return pd.DataFrame(rows)
+
+
+def main():
+    """主程式"""
+    print("=" * 60)
+    print("決策門檻最佳化 (使用快取的 out-of-fold 機率)")
+    print("=" * 60)
+
+    cache = load_oof_cache()
+    print(f"樣本數: {len(cache['y_binary'])}，模型: {', '.join(cache['model_names'])}")
+
+    thresholds = optimize_thresholds(cache)
+    print(f"\n【操作點 (成本 FP={COST_FP}, FN={COST_FN})】")
+    print(thresholds.round(4).to_string(index=False))
+    thresholds.to_csv(os.path.join(OUTPUT_DIR, 'threshold_optimization.csv'),
+                      index=False, encoding='utf-8-sig')
+
+    quantile_results = evaluate_label_quantiles(cache)
+    print("\n【不同高風險定義】")
+    print(quantile_results.round(4).to_string(index=False))
+    quantile_results.to_csv(os.path.join(OUTPUT_DIR, 'risk_quantile_evaluation.csv'),
+                            index=False, encoding='utf-8-sig')
+
+    # 各模型的決策門檻，供評分時取代 0.5
+    decision_thresholds = {
+        row['Model']: {'f1': row['f1_threshold'], 'cost': row['cost_threshold']}
+        for _, row in thresholds.iterrows()
+    }
+    with open(THRESHOLDS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(decision_thresholds, f, ensure_ascii=False, indent=2)
+    print(f"\n已儲存: {THRESHOLDS_PATH}")
+
+    return thresholds, quantile_results
+
+
+if __name__ == "__main__":
+    main()
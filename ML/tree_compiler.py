@@ -0,0 +1,404 @@
+"""
+樹模型編譯 - 扁平陣列評分器
+=====================================
+rf_clf、gb_clf、xgb_clf、lgb_clf 單筆評分時，大部分時間花在
+sklearn / xgboost / lightgbm 的 Python API 開銷上。
+
+本模組將已訓練的樹展開為連續的 NumPy 陣列：
+    feature, threshold, left, right, value, default_left, missing_mode
+所有樹的節點串接在同一組陣列中 (roots 記錄每棵樹的根節點)，
+評分時對一整批資料、所有樹同時逐層 (level-wise) 前進，迴圈次數只等於最大深度。
+評分端只需要 NumPy。
+
+各套件的分割規則不同，編譯時保留原本的語意：
+- sklearn：特徵先轉為 float32，x <= threshold 往左
+- XGBoost：特徵為 float32，x < threshold 往左 (strict)
+- LightGBM：特徵為 float64，x <= threshold 往左，缺失值依 missing_type 處理
+"""
+
+import json
+import os
+
+import numpy as np
+
+from ml_models import CyberbullyingMLAnalyzer, OUTPUT_DIR
+
+COMPILED_DIR = os.path.join(OUTPUT_DIR, 'compiled_models')
+
+# missing_mode：缺失值的判定方式
+MISSING_NAN = 0        # NaN 視為缺失，走 default_left 方向
+MISSING_ZERO = 1       # NaN 與 0 皆視為缺失 (LightGBM missing_type='Zero')
+MISSING_AS_ZERO = 2    # NaN 當作 0 比較 (LightGBM missing_type='None')
+K_ZERO_THRESHOLD = 1e-35
+
+# 模型名稱與分析器上已訓練模型屬性的對照
+TREE_MODEL_ATTRS = {
+    'Random Forest': 'rf_clf',
+    'Gradient Boosting': 'gb_clf',
+    'XGBoost': 'xgb_clf',
+    'LightGBM': 'lgb_clf'
+}
+
+
+def _as_kind(array, kinds, default_dtype):
+    """dtype 屬於 kinds 時直接沿用，否則轉為 default_dtype"""
+    array = np.asarray(array)
+    return array if array.dtype.kind in kinds else np.ascontiguousarray(array, dtype=default_dtype)
+
+
+class CompiledTreeModel:
+    """以扁平陣列表示的樹集成模型 (二分類)"""
+
+    ARRAY_FIELDS = ['feature', 'threshold', 'left', 'right', 'value',
+                    'default_left', 'missing_mode', 'roots']
+
+    def __init__(self, feature, threshold, left, right, value, default_left,
+                 missing_mode, roots, aggregation, base_score=0.0, sigmoid_scale=1.0,
+                 strict=False, input_dtype='float64', max_depth=None, n_features=None):
+        """
+        Parameters:
+        -----------
+        feature, threshold, left, right, value : array
+            節點陣列；葉節點的 left = right = -1 (或 0：節點 0 是第一棵樹的根，
+            不會是任何節點的子節點，無號整數格式以 0 標記葉節點)，value 為葉值
+        default_left : array of bool
+            缺失值是否往左
+        missing_mode : array of int8
+            缺失值判定方式 (MISSING_NAN / MISSING_ZERO / MISSING_AS_ZERO)
+        roots : array of int
+            每棵樹根節點的位置
+        aggregation : {'mean_proba', 'logit'}
+            mean_proba：葉值為機率，取平均 (Random Forest)；
+            logit：葉值相加後加上 base_score，經 sigmoid 轉為機率 (梯度提升)
+        strict : bool
+            True 表示 x < threshold 往左 (XGBoost)，否則 x <= threshold
+        input_dtype : str
+            比較前特徵轉換的精度，與原套件一致
+        """
+        # 已是整數 / 浮點數的陣列保留原本的精度 (例如記憶體映射的壓縮格式)，不複製
+        self.feature = _as_kind(feature, 'iu', np.int32)
+        self.threshold = _as_kind(threshold, 'f', np.float64)
+        self.left = _as_kind(left, 'iu', np.int32)
+        self.right = _as_kind(right, 'iu', np.int32)
+        self.value = _as_kind(value, 'f', np.float64)
+        self.default_left = _as_kind(default_left, 'b', bool)
+        self.missing_mode = _as_kind(missing_mode, 'iu', np.int8)
+        self.roots = _as_kind(roots, 'iu', np.int32)
+        self.aggregation = aggregation
+        self.base_score = float(base_score)
+        self.sigmoid_scale = float(sigmoid_scale)
+        self.strict = bool(strict)
+        self.input_dtype = str(input_dtype)
+        self.max_depth = int(max_depth) if max_depth is not None else self._depth()
+        self.n_features = int(n_features) if n_features is not None else int(self.feature.max()) + 1
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def _depth(self):
+        """由根節點逐層展開，計算最大深度"""
+        depth = 0
+        frontier = self.roots
+        while True:
+            frontier = frontier[self.left[frontier] > 0]
+            if frontier.size == 0:
+                return depth
+            frontier = np.concatenate([self.left[frontier], self.right[frontier]])
+            depth += 1
+
+    def leaf_indices(self, X):
+        """逐層走訪所有樹，回傳每筆資料在每棵樹落入的葉節點 (n × 樹數)"""
+        X = np.asarray(X).astype(self.input_dtype, copy=False).astype(np.float64, copy=False)
+        if X.ndim == 1:
+            X = X[None, :]
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees)).copy()
+
+        for _ in range(self.max_depth):
+            internal = self.left[node] > 0
+            if not internal.any():
+                break
+            x = X[rows, self.feature[node]]
+            mode = self.missing_mode[node]
+
+            nan = np.isnan(x)
+            x = np.where(nan & (mode == MISSING_AS_ZERO), 0.0, x)
+            missing = np.where(mode == MISSING_ZERO, nan | (np.abs(x) <= K_ZERO_THRESHOLD),
+                               nan & (mode == MISSING_NAN))
+
+            t = self.threshold[node]
+            go_left = (x < t) if self.strict else (x <= t)
+            go_left = np.where(missing, self.default_left[node], go_left)
+
+            child = np.where(go_left, self.left[node], self.right[node])
+            node = np.where(internal, child, node)
+
+        return node
+
+    def decision_function(self, X):
+        """原始分數：mean_proba 為平均機率，logit 為未經 sigmoid 的 margin"""
+        leaf_values = self.value[self.leaf_indices(X)]
+        if self.aggregation == 'mean_proba':
+            return leaf_values.mean(axis=1, dtype=np.float64)
+        return self.base_score + leaf_values.sum(axis=1, dtype=np.float64)
+
+    def predict_proba(self, X):
+        """回傳 (n × 2) 的類別機率，與 sklearn 介面一致"""
+        score = self.decision_function(X)
+        if self.aggregation == 'logit':
+            score = 1.0 / (1.0 + np.exp(-self.sigmoid_scale * score))
+        return np.column_stack([1.0 - score, score])
+
+    def predict(self, X, threshold=0.5):
+        return (self.predict_proba(X)[:, 1] > threshold).astype(int)
+
+    def save(self, path):
+        """儲存為 .npz (只含 NumPy 陣列與少量中繼資料)"""
+        meta = {
+            'aggregation': self.aggregation, 'base_score': self.base_score,
+            'sigmoid_scale': self.sigmoid_scale, 'strict': self.strict,
+            'input_dtype': self.input_dtype, 'max_depth': self.max_depth,
+            'n_features': self.n_features
+        }
+        np.savez(path, meta=np.array(json.dumps(meta)),
+                 **{field: getattr(self, field) for field in self.ARRAY_FIELDS})
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {field: data[field] for field in cls.ARRAY_FIELDS}
+        return cls(**arrays, **meta)
+
+
+# ============================================
+# 各套件的樹結構轉換
+# ============================================
+def _concatenate_trees(trees):
+    """
+    串接多棵樹的節點陣列，子節點索引加上位移量
+
+    trees 中每個元素為 dict：feature, threshold, left, right, value, default_left, missing_mode
+    (索引為樹內相對位置，葉節點 left = right = -1)
+    """
+    offsets = np.cumsum([0] + [len(tree['left']) for tree in trees[:-1]])
+    merged = {}
+    for field in ['feature', 'threshold', 'value', 'default_left', 'missing_mode']:
+        merged[field] = np.concatenate([np.asarray(tree[field]) for tree in trees])
+    for field in ['left', 'right']:
+        merged[field] = np.concatenate([
+            np.where(np.asarray(tree[field]) >= 0, np.asarray(tree[field]) + offset, -1)
+            for tree, offset in zip(trees, offsets)
+        ])
+    # 葉節點的 feature 設為 0，走訪時可安全索引
+    merged['feature'] = np.where(merged['left'] >= 0, merged['feature'], 0)
+    merged['roots'] = offsets
+    return merged
+
+
+def _sklearn_tree(tree, leaf_value):
+    """sklearn Tree 物件 → 節點 dict (NaN 依 missing_go_to_left 處理)"""
+    n = tree.node_count
+    default_left = getattr(tree, 'missing_go_to_left', np.zeros(n, dtype=np.uint8))
+    return {
+        'feature': tree.feature, 'threshold': tree.threshold,
+        'left': tree.children_left, 'right': tree.children_right,
+        'value': leaf_value, 'default_left': np.asarray(default_left, dtype=bool),
+        'missing_mode': np.full(n, MISSING_NAN, dtype=np.int8)
+    }
+
+
+def compile_random_forest(model):
+    """RandomForestClassifier：葉值為正類別機率，取平均"""
+    trees = []
+    for estimator in model.estimators_:
+        counts = estimator.tree_.value[:, 0, :]
+        proba = counts[:, 1] / counts.sum(axis=1)
+        trees.append(_sklearn_tree(estimator.tree_, proba))
+    return CompiledTreeModel(**_concatenate_trees(trees), aggregation='mean_proba',
+                             input_dtype='float32', n_features=model.n_features_in_)
+
+
+def compile_gradient_boosting(model):
+    """GradientBoostingClassifier (二分類)：葉值乘上學習率後相加"""
+    trees = [_sklearn_tree(estimator.tree_, estimator.tree_.value[:, 0, 0] * model.learning_rate)
+             for estimator in model.estimators_[:, 0]]
+    base_score = model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0, 0]
+    return CompiledTreeModel(**_concatenate_trees(trees), aggregation='logit',
+                             base_score=base_score, input_dtype='float32',
+                             n_features=model.n_features_in_)
+
+
+def compile_xgboost(model):
+    """XGBClassifier (binary:logistic)：由 JSON 模型讀取節點，分割為 x < threshold"""
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+    if learner['objective']['name'] != 'binary:logistic':
+        raise ValueError(f"不支援的 XGBoost 目標函數: {learner['objective']['name']}")
+
+    gbm = learner['gradient_booster']['model']
+    trees_json = gbm['trees']
+    best_iteration = getattr(model, 'best_iteration', None)
+    if best_iteration is not None:
+        trees_json = trees_json[:gbm['iteration_indptr'][best_iteration + 1]]
+
+    trees = []
+    for tree in trees_json:
+        if any(tree['split_type']):
+            raise ValueError("不支援 XGBoost 類別型分割")
+        n = len(tree['left_children'])
+        trees.append({
+            'feature': tree['split_indices'],
+            'threshold': np.asarray(tree['split_conditions'], dtype=np.float32),
+            'left': tree['left_children'], 'right': tree['right_children'],
+            'value': np.asarray(tree['split_conditions'], dtype=np.float32),
+            'default_left': np.asarray(tree['default_left'], dtype=bool),
+            'missing_mode': np.full(n, MISSING_NAN, dtype=np.int8)
+        })
+
+    # base_score 以機率儲存 (例如 '[5.4E-1]')，轉為 margin
+    base_prob = float(np.float32(learner['learner_model_param']['base_score'].strip('[]')))
+    return CompiledTreeModel(**_concatenate_trees(trees), aggregation='logit',
+                             base_score=np.log(base_prob / (1.0 - base_prob)),
+                             strict=True, input_dtype='float32',
+                             n_features=int(learner['learner_model_param']['num_feature']))
+
+
+def _lightgbm_tree(structure):
+    """LightGBM 巢狀樹結構 → 節點 dict (前序編號)"""
+    nodes = {field: [] for field in ['feature', 'threshold', 'left', 'right', 'value',
+                                     'default_left', 'missing_mode']}
+    missing_modes = {'None': MISSING_AS_ZERO, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+    def visit(node):
+        index = len(nodes['left'])
+        for field in nodes:
+            nodes[field].append(0)
+        if 'leaf_value' in node:
+            nodes['left'][index] = nodes['right'][index] = -1
+            nodes['value'][index] = node['leaf_value']
+            nodes['missing_mode'][index] = MISSING_NAN
+            return index
+        if node['decision_type'] != '<=':
+            raise ValueError("不支援 LightGBM 類別型分割")
+        nodes['feature'][index] = node['split_feature']
+        nodes['threshold'][index] = node['threshold']
+        nodes['default_left'][index] = node['default_left']
+        nodes['missing_mode'][index] = missing_modes[node['missing_type']]
+        nodes['left'][index] = visit(node['left_child'])
+        nodes['right'][index] = visit(node['right_child'])
+        return index
+
+    visit(structure)
+    return nodes
+
+
+def compile_lightgbm(model):
+    """LGBMClassifier (binary)：葉值已含學習率與初始分數，直接相加"""
+    dump = model.booster_.dump_model()
+    objective = dump['objective'].split()
+    if objective[0] != 'binary':
+        raise ValueError(f"不支援的 LightGBM 目標函數: {dump['objective']}")
+    sigmoid_scale = float(dict(item.split(':') for item in objective[1:]).get('sigmoid', 1.0))
+
+    trees = [_lightgbm_tree(info['tree_structure']) for info in dump['tree_info']]
+    return CompiledTreeModel(**_concatenate_trees(trees), aggregation='logit',
+                             sigmoid_scale=sigmoid_scale, input_dtype='float64',
+                             n_features=dump['max_feature_idx'] + 1)
+
+
+def compile_model(model):
+    """依模型型別選擇對應的編譯函數"""
+    name = type(model).__name__
+    compilers = {
+        'RandomForestClassifier': compile_random_forest,
+        'GradientBoostingClassifier': compile_gradient_boosting,
+        'XGBClassifier': compile_xgboost,
+        'LGBMClassifier': compile_lightgbm
+    }
+    if name not in compilers:
+        raise ValueError(f"不支援的模型型別: {name}")
+    return compilers[name](model)
+
+
+def export_compiled_models(analyzer, output_dir=COMPILED_DIR, atol=1e-6):
+    """
+    編譯分析器中已訓練的樹模型，驗證預測一致後輸出為 .npz
+
+    Parameters:
+    -----------
+    analyzer : CyberbullyingMLAnalyzer
+        已執行 train_classification_models
+    output_dir : str
+        輸出資料夾
+    atol : float
+        與原模型預測機率的容許誤差
+
+    Returns:
+    --------
+    dict
+        模型名稱 -> CompiledTreeModel
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    compiled = {}
+    for model_name, attr in TREE_MODEL_ATTRS.items():
+        model = getattr(analyzer, attr, None)
+        if model is None:
+            continue
+
+        compiled_model = compile_model(model)
+        expected = model.predict_proba(analyzer.X_scaled)[:, 1]
+        actual = compiled_model.predict_proba(analyzer.X_scaled)[:, 1]
+        max_error = np.max(np.abs(expected - actual))
+        if not np.allclose(expected, actual, rtol=0, atol=atol):
+            raise ValueError(f"{model_name} 編譯後預測不一致 (最大誤差 {max_error:.2e})")
+
+        path = os.path.join(output_dir, f"{attr}.npz")
+        compiled_model.save(path)
+        compiled[model_name] = compiled_model
+        print(f"  {model_name:<18} 樹數 {compiled_model.n_trees:>4}，節點 {compiled_model.n_nodes:>6}，"
+              f"深度 {compiled_model.max_depth:>2}，最大誤差 {max_error:.2e} → {path}")
+
+    return compiled
+
+
+def main():
+    """主程式"""
+    import time
+
+    print("=" * 60)
+    print("樹模型編譯")
+    print("=" * 60)
+
+    analyzer = CyberbullyingMLAnalyzer('../data/processed_data_with_score.csv')
+    analyzer.prepare_features()
+    analyzer.train_classification_models()
+
+    print("\n【編譯並驗證】")
+    compiled = export_compiled_models(analyzer)
+
+    # 單筆評分延遲比較
+    print("\n【單筆評分延遲 (ms)】")
+    row = analyzer.X_scaled[:1]
+    for model_name, compiled_model in compiled.items():
+        original = getattr(analyzer, TREE_MODEL_ATTRS[model_name])
+        timings = []
+        for predict in (original.predict_proba, compiled_model.predict_proba):
+            start = time.perf_counter()
+            for _ in range(100):
+                predict(row)
+            timings.append((time.perf_counter() - start) * 10)
+        print(f"  {model_name:<18} 原模型 {timings[0]:.3f}，編譯後 {timings[1]:.3f}")
+
+    return compiled
+
+
+if __name__ == "__main__":
+    compiled = main()
@@ -4,6 +4,12 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import seaborn as sns
+import os
+import sys
+
+# 共用模組位於專案根目錄
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from figure_renderer import FigureSpec, render_figures
 
 # 設置中文字型
 plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'Microsoft JhengHei', 'Apple LiGothic Medium']
@@ -44,7 +50,7 @@ def plot_pc_scores_unified(pc_scores, by='age'):
         axes[i].legend(title='性別')
     
     plt.tight_layout()
-    plt.show()
+    return fig
 
 # 主程式
 def main():
@@ -93,11 +99,11 @@ def main():
     pc_scores['gender_label'] = df['q1'].map({1.0: '男性', 2.0: '女性'})
     pc_scores['region'] = df['region']
     
-    # 繪製圖表
-    print("依年齡組別分析：")
-    plot_pc_scores_unified(pc_scores, by='age')
-    print("\n依地區分析：")
-    plot_pc_scores_unified(pc_scores, by='region')
+    # 繪製圖表：依年齡組別、依地區 (程序池平行繪製並存檔)
+    render_figures([
+        FigureSpec(plot_pc_scores_unified, f'pc_scores_by_{by}', {'pc_scores': pc_scores, 'by': by})
+        for by in ['age', 'region']
+    ])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
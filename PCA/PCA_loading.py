@@ -5,11 +5,56 @@ from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.patches import Circle
+import os
+import sys
+
+# 共用模組位於專案根目錄
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from figure_renderer import FigureSpec, render_figures
 
 # 設置中文字型
 plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'Microsoft JhengHei', 'Apple LiGothic Medium']
 plt.rcParams['axes.unicode_minus'] = False
 
+def draw_scree(variance_ratio):
+    """繪製改進的碎石圖與累積解釋變異量圖"""
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+    
+    cumulative_ratio = np.cumsum(variance_ratio)
+    
+    # 碎石圖
+    ax1.plot(range(1, len(variance_ratio) + 1), variance_ratio, 'bo-')
+    ax1.plot(range(1, len(variance_ratio) + 1), variance_ratio, 'r--', alpha=0.5)
+    ax1.set_title('碎石圖與Kaiser準則', fontsize=12)
+    ax1.axhline(y=1/len(variance_ratio), color='g', linestyle='--', 
+                label='Average criterion (1/p)')
+    ax1.set_xlabel('主成分數')
+    ax1.set_ylabel('解釋變異量')
+    ax1.legend()
+    
+    # 累積解釋變異量圖
+    ax2.plot(range(1, len(cumulative_ratio) + 1), cumulative_ratio, 'ro-')
+    ax2.axhline(y=0.8, color='g', linestyle='--', label='80% threshold')
+    ax2.set_title('累積解釋變異量', fontsize=12)
+    ax2.set_xlabel('主成分數')
+    ax2.set_ylabel('累積解釋變異量比例')
+    ax2.legend()
+    
+    plt.tight_layout()
+    return fig
+
+def draw_loadings_heatmap(loadings_display):
+    """繪製主成分負荷量熱力圖"""
+    fig = plt.figure(figsize=(15, 10))
+    
+    sns.heatmap(loadings_display, annot=True, cmap='coolwarm', center=0,
+                fmt='.3f', annot_kws={'size': 8})
+    plt.title('主成分負荷量熱力圖 (前4個主成分)', fontsize=12, pad=20)
+    plt.xlabel('主成分', fontsize=10)
+    plt.ylabel('變數', fontsize=10)
+    plt.tight_layout()
+    return fig
+
 class PCAAnalyzer:
     def __init__(self, data_path):
         """初始化 PCA 分析器"""
@@ -62,45 +107,14 @@ class PCAAnalyzer:
         )
         
     def plot_scree(self):
-        """繪製改進的碎石圖與累積解釋變異量圖"""
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
-        
-        variance_ratio = self.pca.explained_variance_ratio_
-        cumulative_ratio = np.cumsum(variance_ratio)
-        
-        # 碎石圖
-        ax1.plot(range(1, len(variance_ratio) + 1), variance_ratio, 'bo-')
-        ax1.plot(range(1, len(variance_ratio) + 1), variance_ratio, 'r--', alpha=0.5)
-        ax1.set_title('碎石圖與Kaiser準則', fontsize=12)
-        ax1.axhline(y=1/len(variance_ratio), color='g', linestyle='--', 
-                    label='Average criterion (1/p)')
-        ax1.set_xlabel('主成分數')
-        ax1.set_ylabel('解釋變異量')
-        ax1.legend()
-        
-        # 累積解釋變異量圖
-        ax2.plot(range(1, len(cumulative_ratio) + 1), cumulative_ratio, 'ro-')
-        ax2.axhline(y=0.8, color='g', linestyle='--', label='80% threshold')
-        ax2.set_title('累積解釋變異量', fontsize=12)
-        ax2.set_xlabel('主成分數')
-        ax2.set_ylabel('累積解釋變異量比例')
-        ax2.legend()
-        
-        plt.tight_layout()
-        plt.show()
+        """碎石圖與累積解釋變異量圖的繪圖規格"""
+        return FigureSpec(draw_scree, 'pca_scree',
+                          {'variance_ratio': self.pca.explained_variance_ratio_})
         
     def plot_loadings_heatmap(self):
-        """繪製主成分負荷量熱力圖"""
-        plt.figure(figsize=(15, 10))
-        loadings_display = self.loadings.iloc[:, :4]  # 只顯示前4個主成分
-        
-        sns.heatmap(loadings_display, annot=True, cmap='coolwarm', center=0,
-                    fmt='.3f', annot_kws={'size': 8})
-        plt.title('主成分負荷量熱力圖 (前4個主成分)', fontsize=12, pad=20)
-        plt.xlabel('主成分', fontsize=10)
-        plt.ylabel('變數', fontsize=10)
-        plt.tight_layout()
-        plt.show()
+        """主成分負荷量熱力圖的繪圖規格 (只顯示前4個主成分)"""
+        return FigureSpec(draw_loadings_heatmap, 'pca_loadings_heatmap',
+                          {'loadings_display': self.loadings.iloc[:, :4]})
         
     def analyze_components(self):
         """分析主成分結果"""
@@ -139,9 +153,8 @@ def main():
     analyzer.prepare_data()
     analyzer.do_pca()
     
-    # 生成視覺化
-    analyzer.plot_scree()
-    analyzer.plot_loadings_heatmap()
+    # 生成視覺化 (程序池平行繪製並存檔)
+    render_figures([analyzer.plot_scree(), analyzer.plot_loadings_heatmap()])
     
     # 分析結果
     analyzer.analyze_components()
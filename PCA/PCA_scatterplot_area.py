@@ -4,6 +4,12 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import seaborn as sns
+import os
+import sys
+
+# 共用模組位於專案根目錄
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from figure_renderer import FigureSpec, render_figures
 
 def plot_pc_scores_scatter(pc_scores, pc_x=1, pc_y=2):
     """
@@ -24,7 +30,7 @@ def plot_pc_scores_scatter(pc_scores, pc_x=1, pc_y=2):
     plt.rcParams['axes.unicode_minus'] = False
     
     # 創建圖形
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     
     # 定義地區對應的標記
     markers = {
@@ -81,9 +87,9 @@ def plot_pc_scores_scatter(pc_scores, pc_x=1, pc_y=2):
     # 調整布局
     plt.tight_layout()
     
-    return plt
+    return fig
 
-def create_separate_legends(fig):
+def create_separate_legends():
     """創建獨立的圖例說明"""
     # 創建新的圖形用於圖例
     legend_fig = plt.figure(figsize=(10, 2))
@@ -163,13 +169,12 @@ def main():
     pc_scores['gender_label'] = df['gender_label']
     pc_scores['region'] = df['region']
     
-    # 繪製 PC1 vs PC2 散點圖
-    scatter_plot = plot_pc_scores_scatter(pc_scores, pc_x=3, pc_y=2)
-    scatter_plot.show()
-    
-    # 創建獨立的圖例說明
-    legend_plot = create_separate_legends(scatter_plot)
-    legend_plot.show()
+    # 繪製 PC3 vs PC2 散點圖與獨立的圖例說明 (程序池平行繪製並存檔)
+    render_figures([
+        FigureSpec(plot_pc_scores_scatter, 'pc_scores_scatter_pc3_pc2',
+                   {'pc_scores': pc_scores, 'pc_x': 3, 'pc_y': 2}),
+        FigureSpec(create_separate_legends, 'pc_scores_scatter_legend')
+    ])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+交叉表立方體 (crosstab cube)
+=====================================
+final_report.py 原本對 地區 × 性別、地區 × 出生年、地區 × 上網時間 各跑一次
+pd.crosstab，圓餅圖再各自 value_counts，每多一種拆解就要再掃描一次資料。
+
+本模組只掃描資料一次：
+
+- 每個維度轉為整數代碼 (缺失值放在該維度最後一格)
+- 以 np.ravel_multi_index 合併為單一索引，np.bincount 一次算出所有格子的 (加權) 人數
+- 任意一維或二維的邊際分布都由立方體加總取得，不需回到原始資料
+
+邊際分布只排除「被保留維度」的缺失值，與 pd.crosstab / value_counts 的結果相同。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class CrosstabCube:
+    """多維交叉表 (各維度最後一格為缺失值)"""
+
+    def __init__(self, dimensions, labels, counts):
+        """
+        Parameters:
+        -----------
+        dimensions : list of str
+            維度名稱 (欄位名稱)
+        labels : dict
+            維度名稱 -> 類別標籤 (不含缺失值格)
+        counts : array
+            各格的 (加權) 人數，形狀為 各維度類別數 + 1
+        """
+        self.dimensions = list(dimensions)
+        self.labels = {dim: list(labels[dim]) for dim in self.dimensions}
+        self.counts = np.asarray(counts)
+
+    @classmethod
+    def from_frame(cls, df, dimensions, categories=None, weights=None):
+        """
+        由資料建立立方體 (只掃描一次)
+
+        Parameters:
+        -----------
+        df : DataFrame
+            原始資料
+        dimensions : list of str
+            作為維度的欄位
+        categories : dict or None
+            維度名稱 -> 類別順序；未指定的維度依取值排序
+        weights : array or None
+            各列的權數；None 表示計算人數
+
+        Returns:
+        --------
+        CrosstabCube
+        """
+        categories = categories or {}
+        codes, labels = [], {}
+        for dim in dimensions:
+            values = pd.Categorical(df[dim], categories=categories.get(dim))
+            labels[dim] = list(values.categories)
+            # 缺失值 (代碼 -1) 放在最後一格
+            codes.append(np.where(values.codes < 0, len(labels[dim]), values.codes))
+
+        shape = tuple(len(labels[dim]) + 1 for dim in dimensions)
+        flat = np.ravel_multi_index(codes, shape)
+        counts = np.bincount(flat, weights=None if weights is None else np.asarray(weights, dtype=float),
+                             minlength=int(np.prod(shape)))
+        return cls(dimensions, labels, counts.reshape(shape))
+
+    def marginal(self, *dimensions):
+        """
+        一維或多維的邊際分布 (排除所保留維度的缺失值)
+
+        Returns:
+        --------
+        Series (一個維度) 或 DataFrame (兩個維度：列為第一個維度、欄為第二個維度)
+        """
+        axes = [self.dimensions.index(dim) for dim in dimensions]
+        other = tuple(axis for axis in range(len(self.dimensions)) if axis not in axes)
+        table = self.counts.sum(axis=other)
+        # sum 後的維度依原順序排列，轉為呼叫者指定的順序後去除缺失值格
+        table = np.moveaxis(table, np.argsort(np.argsort(axes)), range(len(axes)))
+        table = table[tuple(slice(0, -1) for _ in axes)]
+
+        if len(dimensions) == 1:
+            return pd.Series(table, index=pd.Index(self.labels[dimensions[0]], name=dimensions[0]))
+        if len(dimensions) == 2:
+            return pd.DataFrame(table,
+                                index=pd.Index(self.labels[dimensions[0]], name=dimensions[0]),
+                                columns=pd.Index(self.labels[dimensions[1]], name=dimensions[1]))
+        raise ValueError("邊際分布只支援一或兩個維度")
+
+    def value_counts(self, dimension, normalize=False):
+        """與 Series.value_counts 相同：依人數由多到少排列 (不含人數為 0 的類別)"""
+        counts = self.marginal(dimension)
+        counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+        return counts / counts.sum() if normalize else counts
+
+    def crosstab(self, index, columns, normalize=False):
+        """
+        與 pd.crosstab 相同的二維交叉表
+
+        Parameters:
+        -----------
+        index, columns : str
+            列與欄的維度
+        normalize : bool or {'all', 'index', 'columns'}
+            正規化方式 (同 pd.crosstab)
+        """
+        table = self.marginal(index, columns)
+        # 與 pd.crosstab 相同，去除全為 0 的列與欄
+        table = table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+        if normalize is True or normalize == 'all':
+            return table / table.to_numpy().sum()
+        if normalize == 'index':
+            return table.div(table.sum(axis=1), axis=0)
+        if normalize == 'columns':
+            return table / table.sum(axis=0)
+        return table
@@ -261,3 +261,57 @@ export const methodologies = [
     status: 'completed'
   }
 ]
+
+// ============================================
+// 執行期載入最新分析結果
+// ============================================
+// ML/ml_models.py 的 save_results 會輸出 public/data/analysis_results.json，
+// 掛載前載入並覆寫上方的數值；檔案不存在或版本不符時保留上方的預設值。
+// K-Means 群編號每次執行都可能不同，聚類名稱、說明、風險等級與顏色由匯出端依輪廓推導，直接採用。
+// GitHub Pages 從 git 建置，重新分析後需提交 public/data/analysis_results.json。
+export const ANALYSIS_DATA_VERSION = 2
+const ANALYSIS_DATA_URL = `${import.meta.env.BASE_URL}data/analysis_results.json`
+const DEFAULT_COLOR = '#64748b'
+
+// 就地替換陣列內容 (各元件匯入的是同一個陣列)
+const replaceItems = (target, items) => {
+  target.splice(0, target.length, ...items)
+}
+
+export async function loadAnalysisData() {
+  try {
+    const response = await fetch(ANALYSIS_DATA_URL, { cache: 'no-cache' })
+    if (!response.ok) return false
+    const data = await response.json()
+    if (data.version !== ANALYSIS_DATA_VERSION) {
+      console.warn(`analysis_results.json 版本 ${data.version} 與儀表板版本 ${ANALYSIS_DATA_VERSION} 不符，使用內建資料`)
+      return false
+    }
+
+    Object.assign(projectInfo, data.projectInfo)
+    Object.assign(datasetStats, data.datasetStats)
+
+    const modelColors = Object.fromEntries(classificationResults.map(r => [r.model, r.color]))
+    replaceItems(classificationResults, data.classificationResults.map(r => ({
+      ...r,
+      color: modelColors[r.model] ?? DEFAULT_COLOR
+    })))
+
+    replaceItems(featureImportance, data.featureImportance)
+
+    replaceItems(clusterResults, data.clusterResults.map(c => ({
+      label: `群 ${c.cluster}`,
+      description: '',
+      riskLevel: 'medium',
+      color: DEFAULT_COLOR,
+      ...c
+    })))
+
+    Object.assign(rocCurveData, data.rocCurveData)
+    Object.assign(confusionMatrix, data.confusionMatrix)
+    return true
+  } catch (error) {
+    console.warn('無法載入 analysis_results.json，使用內建資料', error)
+    return false
+  }
+}
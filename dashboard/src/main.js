@@ -1,6 +1,8 @@
 import { createApp } from 'vue'
 import './style.css'
 import App from './App.vue'
+import { loadAnalysisData } from './data/analysisData'
 
 const app = createApp(App)
-app.mount('#app')
+// 先載入最新的分析結果 (ML/ml_models.py 匯出)，失敗時使用內建資料
+loadAnalysisData().finally(() => app.mount('#app'))
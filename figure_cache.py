@@ -0,0 +1,98 @@
+"""
+圖表快取
+=====================================
+ML/ml_models.py 每次執行都以 dpi=150 重繪分群、分類與 SHAP 圖，即使底層數值完全沒變。
+
+快取鍵 = 繪圖資料 + 繪圖函式原始碼 + 樣式參數 (dpi、字型等 rcParams) 的雜湊：
+
+- 輸出檔存在且清單 (manifest) 中記錄的鍵相同時，略過繪圖與 savefig
+- 任一項改變 (資料、程式碼或樣式) 即重新繪製並更新清單
+- 雜湊使用 joblib.hash，numpy 陣列、DataFrame 與已訓練模型都能直接雜湊
+
+清單為輸出目錄下的 figure_cache.json (輸出路徑 -> 快取鍵)。
+"""
+
+import inspect
+import json
+import os
+
+import joblib
+
+from figure_renderer import current_style, render_figure
+
+MANIFEST_NAME = 'figure_cache.json'
+
+
+def figure_key(func, data, **style):
+    """
+    計算圖表的快取鍵
+
+    Parameters:
+    -----------
+    func : callable
+        繪圖函式 (或方法)，以其原始碼參與雜湊
+    data : object
+        繪圖資料 (dict、陣列、DataFrame、模型等可被 pickle 的物件)
+    **style
+        其他樣式參數 (dpi、格式等)；目前的字型 rcParams 會自動加入
+    """
+    return joblib.hash([inspect.getsource(func), data, current_style(), style])
+
+
+class FigureCache:
+    """以快取鍵判斷圖檔是否需要重繪"""
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def is_current(self, paths, key):
+        """所有輸出檔都存在且快取鍵相同時回傳 True"""
+        if isinstance(paths, str):
+            paths = [paths]
+        return all(os.path.exists(path) and self.entries.get(path) == key for path in paths)
+
+    def record(self, paths, key):
+        """記錄輸出檔的快取鍵"""
+        if isinstance(paths, str):
+            paths = [paths]
+        for path in paths:
+            self.entries[path] = key
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+
+    def spec_key(self, spec):
+        """FigureSpec 的快取鍵"""
+        return figure_key(spec.func, spec.data, style=spec.style, dpi=spec.dpi, formats=spec.formats)
+
+    def pending(self, specs):
+        """
+        篩選需要重繪的 FigureSpec
+
+        Returns:
+        --------
+        list of (FigureSpec, str)
+            需要重繪的規格與其快取鍵
+        """
+        pending = []
+        for spec in specs:
+            key = self.spec_key(spec)
+            if self.is_current(spec.paths, key):
+                print(f"圖表未變更，略過: {', '.join(spec.paths)}")
+            else:
+                pending.append((spec, key))
+        return pending
+
+    def render(self, spec):
+        """繪製單一 FigureSpec (未變更時略過)，回傳是否重新繪製"""
+        pending = self.pending([spec])
+        if not pending:
+            return False
+        self.record(render_figure(spec), pending[0][1])
+        for path in spec.paths:
+            print(f"已儲存: {path}")
+        return True
@@ -0,0 +1,130 @@
+"""
+無頭 (headless) 平行繪圖
+=====================================
+各分析腳本原本以 plt.show() 逐張顯示圖表，批次執行時會卡住，圖表也不會關閉。
+
+本模組統一以 Agg 後端輸出圖檔：
+
+- 分析程式只負責計算結果並建立繪圖規格 (FigureSpec)：繪圖函式 + 繪圖資料 + 輸出設定
+- render_figures 將規格送進程序池，各子程序平行繪製並寫出 PNG / SVG
+- 繪圖函式須回傳 Figure；存檔後立即 plt.close，每張圖的記憶體用完即釋放
+
+繪圖函式必須是模組層級函式 (可被 pickle)，繪圖資料只放計算好的小型結果。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+FIGURE_DIR = 'output_figures'
+DEFAULT_FORMATS = ('png', 'svg')
+DEFAULT_DPI = 150
+
+# 隨規格一起送進子程序的 rcParams (中文字型、字體大小等)
+STYLE_KEYS = [
+    'font.family', 'font.sans-serif', 'font.size', 'axes.unicode_minus',
+    'axes.titlesize', 'axes.labelsize', 'xtick.labelsize', 'ytick.labelsize',
+    'legend.fontsize'
+]
+
+
+def current_style():
+    """擷取目前的字型相關 rcParams"""
+    return {key: plt.rcParams[key] for key in STYLE_KEYS}
+
+
+class FigureSpec:
+    """單張圖表的繪圖規格"""
+
+    def __init__(self, func, name, data=None, output_dir=FIGURE_DIR,
+                 formats=DEFAULT_FORMATS, dpi=DEFAULT_DPI, style=None):
+        """
+        Parameters:
+        -----------
+        func : callable
+            模組層級的繪圖函式，以 data 為關鍵字參數呼叫，回傳 Figure
+        name : str
+            輸出檔名 (不含副檔名)
+        data : dict or None
+            繪圖函式的參數 (計算好的結果)
+        output_dir : str
+            輸出目錄
+        formats : tuple of str
+            輸出格式，例如 ('png', 'svg')
+        dpi : int
+            點陣圖解析度
+        style : dict or None
+            套用的 rcParams；None 時擷取建立規格當下的字型設定
+        """
+        self.func = func
+        self.name = name
+        self.data = data or {}
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        self.dpi = dpi
+        self.style = current_style() if style is None else dict(style)
+
+    @property
+    def paths(self):
+        return [os.path.join(self.output_dir, f'{self.name}.{fmt}') for fmt in self.formats]
+
+
+def render_figure(spec):
+    """繪製單張圖表並寫檔，回傳輸出路徑 (於子程序中執行)"""
+    os.makedirs(spec.output_dir, exist_ok=True)
+    with plt.rc_context(spec.style):
+        fig = spec.func(**spec.data)
+        try:
+            for path in spec.paths:
+                fig.savefig(path, dpi=spec.dpi, bbox_inches='tight')
+        finally:
+            plt.close(fig)
+            # 繪圖函式中途產生的其他圖表一併關閉
+            plt.close('all')
+    return spec.paths
+
+
+def render_figures(specs, n_jobs=None, cache=None):
+    """
+    以程序池平行繪製多張圖表
+
+    Parameters:
+    -----------
+    specs : list of FigureSpec
+        繪圖規格
+    n_jobs : int or None
+        子程序數；None 為 CPU 核心數，1 表示在目前程序中依序繪製
+    cache : FigureCache or None
+        圖表快取 (figure_cache.py)；資料、繪圖函式與樣式都未變更的圖表略過不畫
+
+    Returns:
+    --------
+    list of str
+        所有輸出檔路徑
+    """
+    specs = list(specs)
+    if cache is not None:
+        pending = cache.pending(specs)
+        specs = [spec for spec, _ in pending]
+        keys = [key for _, key in pending]
+    if not specs:
+        return []
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(specs))
+    if n_jobs == 1:
+        results = [render_figure(spec) for spec in specs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(render_figure, specs))
+
+    if cache is not None:
+        for spec_paths, key in zip(results, keys):
+            cache.record(spec_paths, key)
+
+    paths = [path for spec_paths in results for path in spec_paths]
+    for path in paths:
+        print(f"已儲存: {path}")
+    return paths
@@ -1,17 +1,20 @@
+import os
+
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from crosstab_cube import CrosstabCube
+from figure_renderer import FigureSpec, render_figures
+from survey_weights import load_margins, rake_weights, weight_summary
+
 # 設置字體大小
 plt.rcParams.update({'font.size': 14, 'axes.titlesize': 18, 'axes.labelsize': 16, 'xtick.labelsize': 14, 'ytick.labelsize': 14, 'legend.fontsize': 14})
 
-# 讀取CSV檔案到DataFrame
-df = pd.read_csv('/Users/lishengfeng/Desktop/多變量分析/newselect_onehot(1).csv')
-
-# 替換欄位值
-df['q1'] = df['q1'].replace({0: 'female', 1: 'man'})
-df['q3'] = df['q3'].replace({1: 'North', 2: 'Central', 3: 'South', 4: 'East', 5: 'Islands', 6: 'Others'})
-df['q7'] = df['q7'].replace({1: '0-3 hrs', 2: '3-6 hrs', 3: 'over 6 hrs'})
+REPORT_DIR = 'plot_output'
+# 報表資料的母體邊際分布 (鍵為 Gender、Birth_Category、Area，類別標籤與 load_report_data 相同)
+REPORT_MARGINS_PATH = os.path.join('data', 'report_population_margins.json')
 
 def categorize_birth_year(year):
     if year <= 60:
@@ -25,143 +28,117 @@ def categorize_birth_year(year):
     else:
         return 'After 90'
 
-df['Birth_Category'] = df['q2'].apply(categorize_birth_year)
-
-# 重命名欄位
-df.rename(columns={
-    'q1': 'Gender',
-    'q3': 'Area',
-    'q2': 'Birth_Year',
-    'q7': 'Net_Time'
-}, inplace=True)
+def load_report_data(path):
+    """讀取問卷資料並轉換為報表用的欄位與標籤"""
+    # 讀取CSV檔案到DataFrame
+    df = pd.read_csv(path)
+    
+    # 替換欄位值
+    df['q1'] = df['q1'].replace({0: 'female', 1: 'man'})
+    df['q3'] = df['q3'].replace({1: 'North', 2: 'Central', 3: 'South', 4: 'East', 5: 'Islands', 6: 'Others'})
+    df['q7'] = df['q7'].replace({1: '0-3 hrs', 2: '3-6 hrs', 3: 'over 6 hrs'})
+    
+    df['Birth_Category'] = df['q2'].apply(categorize_birth_year)
+    
+    # 重命名欄位
+    df.rename(columns={
+        'q1': 'Gender',
+        'q3': 'Area',
+        'q2': 'Birth_Year',
+        'q7': 'Net_Time'
+    }, inplace=True)
+    return df
 
 # 定義調色盤
 light_to_dark_palette = ['#FFC0CB', '#FF99CC', '#FF69B4', '#FF1493', '#DB7093', '#C71585', '#8B0000']
 
-# 創建性別分布圓餅圖
-plt.figure(figsize=(8, 8))
-gender_counts = df['Gender'].value_counts()
-plt.pie(gender_counts, labels=gender_counts.index, autopct='%1.1f%%', startangle=140, colors=light_to_dark_palette[:2])
-plt.title('Gender Distribution')
-plt.axis('equal')
-plt.legend(gender_counts.index, title="Gender", bbox_to_anchor=(1.3, 1))
-plt.tight_layout()
-plt.show()
-
-# 創建出生年份區間分布圓餅圖
-plt.figure(figsize=(8, 8))
-birth_counts = df['Birth_Category'].value_counts().reindex(['Before 60', '61-70', '71-80', '81-90', 'After 90'])
-plt.pie(birth_counts, labels=birth_counts.index, autopct='%1.1f%%', startangle=140, colors=light_to_dark_palette[:5])
-plt.title('Birth Year Distribution')
-plt.axis('equal')
-plt.legend(birth_counts.index, title="Birth Year Range\n(Minguo Calendar)", bbox_to_anchor=(1.3, 1))
-plt.tight_layout()
-plt.show()
-
-# 創建地區分布圓餅圖
-plt.figure(figsize=(8, 8))
-area_counts = df['Area'].value_counts()
-plt.pie(area_counts, labels=area_counts.index, autopct='%1.1f%%', startangle=140, colors=light_to_dark_palette)
-plt.title('Area Distribution')
-plt.axis('equal')
-plt.legend(area_counts.index, title="Area", bbox_to_anchor=(1.3, 1))
-plt.tight_layout()
-plt.show()
-
-# 創建網路使用時間分布圓餅圖
-plt.figure(figsize=(8, 8))
-net_time_counts = df['Net_Time'].value_counts()
-plt.pie(net_time_counts, labels=net_time_counts.index, autopct='%1.1f%%', startangle=140, colors=light_to_dark_palette[:3])
-plt.title('Net Time Distribution')
-plt.axis('equal')
-plt.legend(net_time_counts.index, title="Net Time", bbox_to_anchor=(1.3, 1))
-plt.tight_layout()
-plt.show()
-
-import pandas as pd
-import matplotlib.pyplot as plt
-
-def plot_gender_distribution():
-    plt.figure(figsize=(12, 6))
-    
-    # 計算百分比
-    gender_area = pd.crosstab(df['Area'], df['Gender'], normalize='index') * 100
-    
-    # 繪製堆疊條形圖
-    ax = gender_area.plot(kind='bar', stacked=True, color=['#FFC0CB', '#FF69B4'])
-    
-    # 添加百分比標籤
-    for i in range(len(gender_area.index)):
-        female_pct = gender_area.iloc[i, 0]
-        male_pct = gender_area.iloc[i, 1]
-        
-        ax.text(i, female_pct/2, f'{female_pct:.1f}%', ha='center', va='center')
-        ax.text(i, female_pct + male_pct/2, f'{male_pct:.1f}%', ha='center', va='center')
-    
-    plt.title('Gender Distribution by Area')
-    plt.xlabel('Area')
-    plt.ylabel('Percentage (%)')
-    plt.legend(title='Gender', bbox_to_anchor=(1.02, 1), loc='upper left')
+def plot_distribution_pie(cube, dimension, title, legend_title, colors, order=None):
+    """繪製分布圓餅圖 (由交叉表立方體取一維邊際分布)"""
+    counts = cube.value_counts(dimension) if order is None else cube.marginal(dimension).reindex(order)
+    fig = plt.figure(figsize=(8, 8))
+    plt.pie(counts, labels=counts.index, autopct='%1.1f%%', startangle=140, colors=colors)
+    plt.title(title)
+    plt.axis('equal')
+    plt.legend(counts.index, title=legend_title, bbox_to_anchor=(1.3, 1))
     plt.tight_layout()
-    plt.show()
-    plt.close()
-
-def plot_birth_distribution():
-    plt.figure(figsize=(12, 6))
-    
-    # 計算百分比
-    birth_area = pd.crosstab(df['Area'], df['Birth_Category'], normalize='index') * 100
-    birth_area = birth_area[['Before 60', '61-70', '71-80', '81-90', 'After 90']]
+    return fig
+
+def plot_area_breakdown(cube, dimension, title, legend_title, colors, order=None):
+    """繪製各地區組成的百分比堆疊條形圖 (由交叉表立方體取 地區 × dimension)"""
+    table = cube.crosstab('Area', dimension, normalize='index') * 100
+    if order is not None:
+        table = table.reindex(columns=order, fill_value=0)
+    fig, ax = plt.subplots(figsize=(12, 6))
     
     # 繪製堆疊條形圖
-    ax = birth_area.plot(kind='bar', stacked=True,
-                    color=['#FFC0CB', '#FFB6C1', '#FF69B4', '#FF1493', '#C71585'])
+    table.plot(kind='bar', stacked=True, color=colors, ax=ax)
     
-    # 添加百分比標籤
-    yoff = 0
-    for i in range(len(birth_area.index)):
-        yoff = 0
-        for j in range(len(birth_area.columns)):
-            value = birth_area.iloc[i, j]
-            ax.text(i, yoff + value/2, f'{value:.1f}%', ha='center', va='center')
-            yoff += value
+    # 添加百分比標籤：各段中心 = 累積高度 - 該段高度 / 2
+    values = table.to_numpy()
+    centers = values.cumsum(axis=1) - values / 2
+    rows = np.repeat(np.arange(values.shape[0]), values.shape[1])
+    for x, y, value in zip(rows, centers.ravel(), values.ravel()):
+        ax.text(x, y, f'{value:.1f}%', ha='center', va='center')
     
-    plt.title('Birth Year Distribution by Area')
+    plt.title(title)
     plt.xlabel('Area')
     plt.ylabel('Percentage (%)')
-    plt.legend(title='Birth Year Range', bbox_to_anchor=(1.02, 1), loc='upper left')
+    plt.legend(title=legend_title, bbox_to_anchor=(1.02, 1), loc='upper left')
     plt.tight_layout()
-    plt.show()
-    plt.close()
-
-def plot_nettime_distribution():
-    plt.figure(figsize=(12, 6))
+    return fig
+
+def report_weights(df, margins_path=REPORT_MARGINS_PATH):
+    """有母體邊際分布時以 raking 計算調查權數，否則回傳 None (不加權)"""
+    if not os.path.exists(margins_path):
+        print(f"找不到母體邊際分布 ({margins_path})，不加權")
+        return None
+    margins = load_margins(margins_path)
+    weights = rake_weights(df[list(margins)], margins)
+    print(f"調查權數: 有效樣本數 {weight_summary(weights)['effective_n']:.0f} / {len(weights)}")
+    return weights
+
+def main():
+    df = load_report_data('/Users/lishengfeng/Desktop/多變量分析/newselect_onehot(1).csv')
     
-    # 計算百分比
-    net_area = pd.crosstab(df['Area'], df['Net_Time'], normalize='index') * 100
+    # 所有拆解共用同一個交叉表立方體 (只掃描資料一次)
+    birth_order = ['Before 60', '61-70', '71-80', '81-90', 'After 90']
+    cube = CrosstabCube.from_frame(df, ['Area', 'Gender', 'Birth_Category', 'Net_Time'],
+                                   categories={'Birth_Category': birth_order},
+                                   weights=report_weights(df))
     
-    # 繪製堆疊條形圖
-    ax = net_area.plot(kind='bar', stacked=True, 
-                  color=['#FFC0CB', '#FF69B4', '#C71585'])
+    # 各變數的分布 (圓餅圖)
+    figures = [
+        FigureSpec(plot_distribution_pie, 'gender_distribution', {
+            'cube': cube, 'dimension': 'Gender', 'title': 'Gender Distribution',
+            'legend_title': "Gender", 'colors': light_to_dark_palette[:2]}, output_dir=REPORT_DIR),
+        FigureSpec(plot_distribution_pie, 'birth_year_distribution', {
+            'cube': cube, 'dimension': 'Birth_Category', 'order': birth_order,
+            'title': 'Birth Year Distribution',
+            'legend_title': "Birth Year Range\n(Minguo Calendar)", 'colors': light_to_dark_palette[:5]}, output_dir=REPORT_DIR),
+        FigureSpec(plot_distribution_pie, 'area_distribution', {
+            'cube': cube, 'dimension': 'Area', 'title': 'Area Distribution',
+            'legend_title': "Area", 'colors': light_to_dark_palette}, output_dir=REPORT_DIR),
+        FigureSpec(plot_distribution_pie, 'net_time_distribution', {
+            'cube': cube, 'dimension': 'Net_Time', 'title': 'Net Time Distribution',
+            'legend_title': "Net Time", 'colors': light_to_dark_palette[:3]}, output_dir=REPORT_DIR)
+    ]
     
-    # 添加百分比標籤
-    yoff = 0
-    for i in range(len(net_area.index)):
-        yoff = 0
-        for j in range(len(net_area.columns)):
-            value = net_area.iloc[i, j]
-            ax.text(i, yoff + value/2, f'{value:.1f}%', ha='center', va='center')
-            yoff += value
+    # 各地區的組成 (百分比堆疊條形圖)
+    figures += [
+        FigureSpec(plot_area_breakdown, 'gender_by_area', {
+            'cube': cube, 'dimension': 'Gender', 'title': 'Gender Distribution by Area',
+            'legend_title': 'Gender', 'colors': ['#FFC0CB', '#FF69B4']}, output_dir=REPORT_DIR),
+        FigureSpec(plot_area_breakdown, 'birth_year_by_area', {
+            'cube': cube, 'dimension': 'Birth_Category', 'order': birth_order,
+            'title': 'Birth Year Distribution by Area', 'legend_title': 'Birth Year Range',
+            'colors': ['#FFC0CB', '#FFB6C1', '#FF69B4', '#FF1493', '#C71585']}, output_dir=REPORT_DIR),
+        FigureSpec(plot_area_breakdown, 'net_time_by_area', {
+            'cube': cube, 'dimension': 'Net_Time', 'title': 'Internet Usage Time Distribution by Area',
+            'legend_title': 'Net Time', 'colors': ['#FFC0CB', '#FF69B4', '#C71585']}, output_dir=REPORT_DIR)
+    ]
     
-    plt.title('Internet Usage Time Distribution by Area')
-    plt.xlabel('Area')
-    plt.ylabel('Percentage (%)')
-    plt.legend(title='Net Time', bbox_to_anchor=(1.02, 1), loc='upper left')
-    plt.tight_layout()
-    plt.show()
-    plt.close()
+    # 所有圖表於程序池平行繪製並存檔
+    render_figures(figures)
 
-# 依序執行三個圖表
-plot_gender_distribution()
-plot_birth_distribution()
-plot_nettime_distribution()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
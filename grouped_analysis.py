@@ -0,0 +1,231 @@
+"""
+分組多變量分析
+=====================================
+依 地區 × 性別 × 年齡組別 將受訪者分層，對每一層分別執行 PCA、因素分析與 CCA，
+並以程序池平行處理，所有結果彙整成一張表。
+
+資料只寫入一次記憶體映射 (memory-mapped) 的 .npy 檔，並事先依分層排序，
+因此每一層都是連續的列區段；子程序以切片取得唯讀視圖 (view)，不會複製資料。
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+
+from CCA.cca_permutation import whiten_block, canonical_correlations
+from shared_array import publish_memmap, attach_shared_array
+
+# 地區對照 (q3)，與 PCA/PCA_boxplot.py、PCA/PCA_scatterplot_area.py 相同
+REGION_MAP = {
+    1: '北部', 2: '北部', 3: '北部', 4: '北部', 5: '北部',  # 基隆、台北、新北、桃園、新竹縣
+    6: '北部',  # 新竹市
+    7: '中部', 8: '中部', 9: '中部', 10: '中部',  # 苗栗、南投、台中、彰化
+    11: '中部', 12: '中部', 13: '中部',  # 雲林、嘉義縣、嘉義市
+    14: '南部', 15: '南部', 16: '南部',  # 台南、高雄、屏東
+    17: '東部', 18: '東部', 19: '東部',  # 宜蘭、花蓮、台東
+    20: '其他', 21: '其他', 22: '其他', 23: '其他', 24: '其他'  # 澎湖、金門、連江、外島
+}
+GENDER_MAP = {1.0: '男性', 2.0: '女性'}
+AGE_BINS = [33, 63, 73, 83, 91]
+AGE_LABELS = ['33-63', '63-73', '73-83', '83-91']
+
+# 分析變數
+ATTITUDE_COLS = ([f'q22_0{i}_1' for i in range(1, 6)] +
+                 [f'q23_0{i}_1' for i in range(1, 6)] +
+                 [f'q25_0{i}_1' for i in range(1, 5)] +
+                 [f'q26_0{i}_1' for i in range(1, 4)])
+CCA_X_COLS = ['q5', 'q6', 'q7']
+CCA_Y_COLS = ATTITUDE_COLS[:14]  # q22、q23、q25 系列
+ANALYSIS_COLS = CCA_X_COLS + ATTITUDE_COLS
+
+N_COMPONENTS = 4
+MIN_GROUP_SIZE = 30
+
+
+def build_strata(df):
+    """建立分層變數 (地區、性別、年齡組別)"""
+    strata = pd.DataFrame({
+        'region': df['q3'].map(REGION_MAP),
+        'gender': df['q1'].map(GENDER_MAP),
+        'age_group': pd.cut(df['q2'], bins=AGE_BINS, labels=AGE_LABELS,
+                            include_lowest=True).astype(object)
+    }, index=df.index)
+    return strata.dropna()
+
+
+def write_sorted_memmap(df, strata, directory):
+    """
+    依分層排序後寫入 .npy，回傳檔案路徑與各層的列區段
+
+    Returns:
+    --------
+    spec : dict
+        供 attach_shared_array 掛載的規格
+    groups : list of (key, start, stop)
+    """
+    data = df.loc[strata.index, ANALYSIS_COLS].apply(pd.to_numeric, errors='coerce')
+    data = data.fillna(data.mean())
+
+    order = strata.sort_values(['region', 'gender', 'age_group'], kind='stable').index
+    sorted_strata = strata.loc[order]
+    matrix = np.ascontiguousarray(data.loc[order].to_numpy(dtype=np.float64))
+
+    spec = publish_memmap(matrix, os.path.join(directory, 'grouped_analysis_data.npy'))
+
+    # 連續的分層區段
+    keys = list(sorted_strata.itertuples(index=False, name=None))
+    groups = []
+    start = 0
+    for i in range(1, len(keys) + 1):
+        if i == len(keys) or keys[i] != keys[start]:
+            groups.append((keys[start], start, i))
+            start = i
+
+    return spec, groups
+
+
+# ============================================
+# 子程序工作函數
+# ============================================
+_worker_data = None
+
+
+def _init_worker(spec):
+    """子程序初始化：以記憶體映射開啟資料，不讀入整份檔案"""
+    global _worker_data
+    _worker_data = attach_shared_array(spec)
+
+
+def _standardize(block):
+    """標準化並移除組內變異為 0 的欄位"""
+    std = block.std(axis=0, ddof=1)
+    keep = std > 0
+    return (block[:, keep] - block[:, keep].mean(axis=0)) / std[keep], keep
+
+
+def _fit_pca(block):
+    scaled, _ = _standardize(block)
+    pca = PCA().fit(scaled)
+    ratios = pca.explained_variance_ratio_
+    result = {f'pca_var_pc{i+1}': (ratios[i] if i < len(ratios) else np.nan)
+              for i in range(N_COMPONENTS)}
+    result['pca_cum_var'] = ratios[:N_COMPONENTS].sum()
+    result['pca_kaiser'] = int(np.sum(pca.explained_variance_ > 1))
+    return result
+
+
+def _fit_fa(block):
+    try:
+        from factor_analyzer import FactorAnalyzer
+    except ImportError:
+        return {}
+
+    scaled, _ = _standardize(block)
+    n_factors = min(N_COMPONENTS, scaled.shape[1] - 1)
+    try:
+        fa = FactorAnalyzer(n_factors=n_factors, rotation='varimax')
+        fa.fit(scaled)
+    except Exception as e:
+        print(f"因素分析失敗：{str(e)}")
+        return {}
+
+    _, proportion, _ = fa.get_factor_variance()
+    result = {f'fa_var_f{i+1}': (proportion[i] if i < len(proportion) else np.nan)
+              for i in range(N_COMPONENTS)}
+    result['fa_mean_communality'] = float(np.mean(fa.get_communalities()))
+    return result
+
+
+def _fit_cca(x_block, y_block):
+    x_scaled, _ = _standardize(x_block)
+    y_scaled, _ = _standardize(y_block)
+    corrs = canonical_correlations(whiten_block(x_scaled), whiten_block(y_scaled))
+    return {f'cca_r{i+1}': (corrs[i] if i < len(corrs) else np.nan) for i in range(2)}
+
+
+def _analyze_group(task):
+    """對單一分層執行 PCA / FA / CCA"""
+    key, start, stop = task
+    view = _worker_data[start:stop]  # 記憶體映射的視圖，不複製
+
+    n_x = len(CCA_X_COLS)
+    attitudes = view[:, n_x:]
+
+    result = {'region': key[0], 'gender': key[1], 'age_group': key[2], 'n': stop - start}
+    result.update(_fit_pca(attitudes))
+    result.update(_fit_fa(attitudes))
+    result.update(_fit_cca(view[:, :n_x], view[:, n_x:n_x + len(CCA_Y_COLS)]))
+    return result
+
+
+def run_grouped_analysis(df, min_group_size=MIN_GROUP_SIZE, n_jobs=None):
+    """
+    依分層平行執行 PCA / FA / CCA
+
+    Parameters:
+    -----------
+    df : DataFrame
+        原始問卷資料
+    min_group_size : int
+        樣本數低於此值的分層不做分析
+    n_jobs : int or None
+        子程序數量，None 表示使用全部 CPU
+
+    Returns:
+    --------
+    DataFrame
+        每一列為一個分層的分析結果
+    """
+    strata = build_strata(df)
+    workdir = tempfile.mkdtemp(prefix='grouped_analysis_')
+
+    try:
+        spec, groups = write_sorted_memmap(df, strata, workdir)
+        tasks = [g for g in groups if g[2] - g[1] >= min_group_size]
+        skipped = [g for g in groups if g[2] - g[1] < min_group_size]
+
+        print(f"分層數: {len(groups)} (分析 {len(tasks)} 層，"
+              f"樣本數不足 {min_group_size} 略過 {len(skipped)} 層)")
+
+        if n_jobs == 1:
+            _init_worker(spec)
+            results = [_analyze_group(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs,
+                                     initializer=_init_worker,
+                                     initargs=(spec,)) as executor:
+                results = list(executor.map(_analyze_group, tasks))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results += [{'region': key[0], 'gender': key[1], 'age_group': key[2], 'n': stop - start}
+                for key, start, stop in skipped]
+    return (pd.DataFrame(results)
+            .sort_values(['region', 'gender', 'age_group'])
+            .reset_index(drop=True))
+
+
+def main():
+    output_dir = 'output_figures'
+    os.makedirs(output_dir, exist_ok=True)
+
+    df = pd.read_csv('processed_data_with_score.csv')
+    print(f"資料維度：{df.shape}")
+
+    results = run_grouped_analysis(df)
+
+    output_path = os.path.join(output_dir, 'grouped_analysis_results.csv')
+    results.to_csv(output_path, index=False, encoding='utf-8-sig')
+    print(results.round(3).to_string(index=False))
+    print(f"\n分組分析結果已儲存至 {output_path}")
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,72 @@
 import plotly.graph_objects as go
-import geopandas as gpd
 import numpy as np
 from plotly.subplots import make_subplots
 
-# 讀取台灣地圖 shapefile
-taiwan_map = gpd.read_file('taiwan_map/COUNTY_MOI_1130718.shp')
+from regional_aggregates import load_regional_aggregates, regional_shares
+from survey_weights import load_survey_weights
+from taiwan_geometry import load_county_geometry
 
-# 確保座標系統為 WGS84
-taiwan_map = taiwan_map.to_crs('EPSG:4326')
+# 讀取台灣地圖 (快取圖資已轉換為 WGS84 並預先簡化)
+taiwan_map = load_county_geometry('medium')
+
+# 長方體的 8 個頂點 (第 k 個頂點的 x、y、z 分別取 k 的第 0、1、2 位元) 與 12 個三角面
+BOX_CORNERS = np.array([[k & 1, (k >> 1) & 1, (k >> 2) & 1] for k in range(8)], dtype=float)
+BOX_TRIANGLES = np.array([
+    [0, 1, 3], [0, 3, 2],  # 底面
+    [4, 5, 7], [4, 7, 6],  # 頂面
+    [0, 1, 5], [0, 5, 4],  # 前面 (y = 0)
+    [2, 3, 7], [2, 7, 6],  # 後面 (y = 1)
+    [0, 2, 6], [0, 6, 4],  # 左面 (x = 0)
+    [1, 3, 7], [1, 7, 5]   # 右面 (x = 1)
+])
+
+
+def outline_trace(geometry, color='gray', width=2):
+    """所有縣市邊界合併為單一 Scatter3d，各環之間以 NaN (輸出為 null) 斷開"""
+    coords = geometry.coords.astype(float)
+    # 在每個環 (第一個除外) 的起點前插入一個斷點
+    xy = np.insert(coords, geometry.ring_offsets[1:-1], np.nan, axis=0)
+    return go.Scatter3d(
+        x=xy[:, 0],
+        y=xy[:, 1],
+        z=np.where(np.isnan(xy[:, 0]), np.nan, 0.0),
+        mode='lines',
+        line=dict(color=color, width=width),
+        hoverinfo='skip',
+        showlegend=False
+    )
+
+
+def bar_mesh(x, y, heights, colors, labels, size=0.05, name='數據柱'):
+    """
+    所有數據柱合併為單一 Mesh3d
+
+    Parameters:
+    -----------
+    x, y : array
+        各柱底面中心的經度、緯度
+    heights : array
+        各柱高度
+    colors : list of str
+        各柱顏色
+    labels : list of str
+        各柱的滑鼠提示文字
+    size : float
+        柱底邊長 (度)
+    """
+    base = np.column_stack([np.asarray(x) - size / 2, np.asarray(y) - size / 2, np.zeros(len(x))])
+    scale = np.column_stack([np.full(len(x), size), np.full(len(x), size), heights])
+    vertices = (base[:, None, :] + BOX_CORNERS[None, :, :] * scale[:, None, :]).reshape(-1, 3)
+    faces = (BOX_TRIANGLES[None, :, :] + 8 * np.arange(len(x))[:, None, None]).reshape(-1, 3)
+    return go.Mesh3d(
+        x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+        i=faces[:, 0], j=faces[:, 1], k=faces[:, 2],
+        facecolor=np.repeat(colors, len(BOX_TRIANGLES)),
+        text=np.repeat(labels, len(BOX_CORNERS)),
+        hoverinfo='text',
+        flatshading=True,
+        name=name
+    )
 
 # 定義台灣各區域的中心點座標
 regions = ['北部', '中部', '南部', '東部']
@@ -18,77 +77,48 @@ region_coords = {
     '東部': {'lat': 23.9871589, 'lon': 121.6015714}
 }
 
-# 準備資料 - 將數值縮小為原來的1/3
+# 準備資料 (由問卷資料加權彙總，regional_aggregates.py、survey_weights.py) - 將數值縮小為原來的1/3
+aggregates = load_regional_aggregates(weights=load_survey_weights())
+gender_shares = regional_shares(aggregates, 'gender')
+usage_shares = regional_shares(aggregates, 'usage')
+
 gender_data = {
-    '北部': {'男': 64.7/3, '女': 35.3/3},
-    '中部': {'男': 55.9/3, '女': 44.1/3},
-    '南部': {'男': 61.4/3, '女': 38.6/3},
-    '東部': {'男': 68.6/3, '女': 31.4/3}
+    region: {'男': gender_shares.loc[region, '男性'] / 3, '女': gender_shares.loc[region, '女性'] / 3}
+    for region in regions
 }
 
+usage_keys = {'0-3h': '0-3小時', '3-6h': '3-6小時', '6h+': '6小時以上'}
 internet_usage = {
-    '北部': {'0-3h': 41.1/3, '3-6h': 40.7/3, '6h+': 18.2/3},
-    '中部': {'0-3h': 45.3/3, '3-6h': 38.4/3, '6h+': 16.3/3},
-    '南部': {'0-3h': 39.2/3, '3-6h': 42.1/3, '6h+': 18.7/3},
-    '東部': {'0-3h': 54.3/3, '3-6h': 34.3/3, '6h+': 11.4/3}
+    region: {key: usage_shares.loc[region, category] / 3 for key, category in usage_keys.items()}
+    for region in regions
 }
 
 # 創建主圖表
 fig = go.Figure()
 
-# 添加台灣地圖底圖
-for idx, row in taiwan_map.iterrows():
-    if row.geometry.geom_type == 'MultiPolygon':
-        for geom in row.geometry.geoms:
-            x, y = geom.exterior.xy
-            fig.add_trace(go.Scatter3d(
-                x=list(x),
-                y=list(y),
-                z=[0]*len(x),
-                mode='lines',
-                line=dict(color='gray', width=2),  # 增加線條寬度
-                showlegend=False
-            ))
-    else:
-        x, y = row.geometry.exterior.xy
-        fig.add_trace(go.Scatter3d(
-            x=list(x),
-            y=list(y),
-            z=[0]*len(x),
-            mode='lines',
-            line=dict(color='gray', width=2),  # 增加線條寬度
-            showlegend=False
-        ))
-
-# 為每個區域添加數據柱
+# 添加台灣地圖底圖 (單一 trace)
+fig.add_trace(outline_trace(taiwan_map))
+
+# 為每個區域添加數據柱：性別分布 (男性比例) 與網路使用時間 (單一 Mesh3d)
+usage_labels = ['0-3h', '3-6h', '6h+']
+usage_colors = ['lightgreen', 'green', 'darkgreen']
+bar_x, bar_y, bar_heights, bar_colors, bar_labels = [], [], [], [], []
 for region in regions:
-    # 性別分布
-    fig.add_trace(go.Scatter3d(
-        x=[region_coords[region]['lon'], region_coords[region]['lon']],
-        y=[region_coords[region]['lat'], region_coords[region]['lat']],
-        z=[0, gender_data[region]['男']],
-        mode='lines',
-        line=dict(color='blue', width=8),  # 增加柱狀圖寬度
-        name=f'{region}-男性比例'
-    ))
-    
-    # 網路使用時間
-    z_values = [internet_usage[region]['0-3h'],
-                internet_usage[region]['3-6h'],
-                internet_usage[region]['6h+']]
-    
-    for i, z in enumerate(z_values):
-        fig.add_trace(go.Scatter3d(
-            x=[region_coords[region]['lon'] + 0.15],  # 增加間距
-            y=[region_coords[region]['lat'] + 0.15 * i],
-            z=[0, z],
-            mode='lines',
-            line=dict(
-                color=['lightgreen', 'green', 'darkgreen'][i],
-                width=8  # 增加柱狀圖寬度
-            ),
-            name=f'{region}-網路使用{["0-3h", "3-6h", "6h+"][i]}'
-        ))
+    lon, lat = region_coords[region]['lon'], region_coords[region]['lat']
+    bar_x.append(lon)
+    bar_y.append(lat)
+    bar_heights.append(gender_data[region]['男'])
+    bar_colors.append('blue')
+    bar_labels.append(f'{region}-男性比例: {gender_data[region]["男"] * 3:.1f}%')
+
+    for i, usage in enumerate(usage_labels):
+        bar_x.append(lon + 0.15)  # 增加間距
+        bar_y.append(lat + 0.15 * i)
+        bar_heights.append(internet_usage[region][usage])
+        bar_colors.append(usage_colors[i])
+        bar_labels.append(f'{region}-網路使用{usage}: {internet_usage[region][usage] * 3:.1f}%')
+
+fig.add_trace(bar_mesh(bar_x, bar_y, bar_heights, bar_colors, bar_labels, name='各區域數據柱'))
 
 # 更新布局
 fig.update_layout(
@@ -1,9 +1,13 @@
 import matplotlib.pyplot as plt
-import geopandas as gpd
 import numpy as np
 from mpl_toolkits.mplot3d import Axes3D
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import os
 
+from regional_aggregates import BIRTH_LABELS, USAGE_LABELS, load_regional_aggregates, regional_shares
+from survey_weights import load_survey_weights
+from taiwan_geometry import load_county_triangles
+
 # 設定輸出資料夾和字體 
 output_folder = 'plot_output'
 os.makedirs(output_folder, exist_ok=True)
@@ -14,8 +18,8 @@ plt.rcParams['axes.unicode_minus'] = False
 fig = plt.figure(figsize=(15, 20))
 ax = fig.add_subplot(111, projection='3d')
 
-# 讀取台灣地圖
-taiwan_map = gpd.read_file("taiwan_map/COUNTY_MOI_1130718.shp")
+# 讀取台灣地圖的三角剖分 (所有縣市與離島只剖分一次並快取)
+taiwan_map, triangles, triangle_county = load_county_triangles('high')
 
 # 定義區域顏色
 region_colors = {
@@ -26,12 +30,12 @@ region_colors = {
     '其他': '#CCCCCC'   # 灰色
 }
 
-# 定義縣市所屬區域
+# 定義縣市所屬區域 (與問卷 q3 的地區對照 grouped_analysis.REGION_MAP 相同)
 county_regions = {
     '臺北市': '北部', '新北市': '北部', '基隆市': '北部', '桃園市': '北部', 
     '新竹市': '北部', '新竹縣': '北部', '臺中市': '中部', '苗栗縣': '中部', 
     '彰化縣': '中部', '南投縣': '中部', '雲林縣': '中部', '高雄市': '南部', 
-    '臺南市': '南部', '嘉義市': '南部', '嘉義縣': '南部', '屏東縣': '南部',
+    '臺南市': '南部', '嘉義市': '中部', '嘉義縣': '中部', '屏東縣': '南部',
     '宜蘭縣': '東部', '花蓮縣': '東部', '臺東縣': '東部', '澎湖縣': '其他', 
     '金門縣': '其他', '連江縣': '其他'
 }
@@ -40,56 +44,42 @@ county_regions = {
 ax.view_init(elev=20, azim=45)
 ax.set_box_aspect([2, 3, 1])
 
-# 繪製基礎地圖
-for idx, row in taiwan_map.iterrows():
-    poly = row.geometry
-    if poly.geom_type == 'Polygon':
-        x, y = poly.exterior.xy
-        ax.plot_trisurf(x, y, np.zeros_like(x), 
-                       color=region_colors.get(county_regions.get(row['COUNTYNAME'], '其他')),
-                       alpha=0.8)
-
-# 定義各區域的數據
+# 繪製基礎地圖：所有三角形合併為單一 Poly3DCollection (z = 0)
+county_colors = np.array([region_colors[county_regions.get(name, '其他')] for name in taiwan_map.names])
+vertices = np.concatenate([triangles, np.zeros(triangles.shape[:2] + (1,), dtype=triangles.dtype)], axis=2)
+ax.add_collection3d(Poly3DCollection(vertices, facecolors=county_colors[triangle_county],
+                                     edgecolors='none', alpha=0.8))
+min_x, min_y, max_x, max_y = taiwan_map.bounds
+ax.set_xlim(min_x, max_x)
+ax.set_ylim(min_y, max_y)
+
+# 各區域的數據由問卷資料彙總 (regional_aggregates.py，有母體邊際分布時以 raking 權數加權)，
+# 長條依序為 性別、上網時間、出生年組別
+aggregates = load_regional_aggregates(weights=load_survey_weights())
+region_shares = {
+    '性別': regional_shares(aggregates, 'gender').round(1),
+    '網路': regional_shares(aggregates, 'usage').round(1),
+    '出生年': regional_shares(aggregates, 'birth').round(1)
+}
+region_coords = {
+    '北部': (121.5, 24.9),
+    '中部': (120.7, 24.1),
+    '南部': (120.3, 22.6),
+    '東部': (121.4, 23.5)
+}
 locations = {
-    '北部': {
-        'coords': (121.5, 24.9),
-        'values': {
-            '性別': [64.7, 35.3],
-            '網路': [39.2, 42.2, 18.6],
-            '年齡': [20.7, 21.5, 27.6, 29.7, 0.6]
-        }
-    },
-    '中部': {
-        'coords': (120.7, 24.1),
-        'values': {
-            '性別': [55.9, 44.1],
-            '網路': [45.3, 38.4, 16.3],
-            '年齡': [21.2, 22.4, 24.6, 31.2, 0.6]
-        }
-    },
-    '南部': {
-        'coords': (120.3, 22.6),
-        'values': {
-            '性別': [61.4, 38.6],
-            '網路': [41.2, 40.5, 18.3],
-            '年齡': [20.8, 21.8, 24.2, 32.2, 1.0]
-        }
-    },
-    '東部': {
-        'coords': (121.4, 23.5),
-        'values': {
-            '性別': [68.6, 31.4],
-            '網路': [54.3, 31.4, 14.3],
-            '年齡': [22.9, 20.0, 28.6, 28.6, 0.0]
-        }
+    region: {
+        'coords': coords,
+        'values': {category: shares.loc[region].tolist() for category, shares in region_shares.items()}
     }
+    for region, coords in region_coords.items()
 }
 
 # 設定長條圖參數
 bar_colors = {
     '性別': ['#1f77b4', '#aec7e8'],
     '網路': ['#2ecc71', '#e67e22', '#2c3e50'],
-    '年齡': ['#ff9999', '#ff7f7f', '#ff6666', '#ff4d4d', '#ff3333']
+    '出生年': ['#ff9999', '#ff7f7f', '#ff6666', '#ff4d4d', '#ff3333']
 }
 
 # 定義長條圖尺寸參數
@@ -98,48 +88,32 @@ bar_depth = 0.04
 z_scale = 0.01
 spacing = 0.15
 
-# 繪製3D長條圖
+# 繪製3D長條圖：各類別的長條依序排在區域座標右側 (性別 0-1、網路 3-5、出生年 7-11)
+category_slots = {'性別': 0, '網路': 3, '出生年': 7}
+bar_x, bar_y, bar_values, bar_color_list = [], [], [], []
 for region, data in locations.items():
     x, y = data['coords']
-    
-    # 繪製性別數據
-    values_gender = data['values']['性別']
-    for i, (value, color) in enumerate(zip(values_gender, bar_colors['性別'])):
-        x_pos = x + i * bar_width * 3
-        ax.bar3d(x_pos, y, 0,
-                bar_width, bar_depth, value * z_scale,
-                color=color, alpha=0.8)
-        ax.text(x_pos, y, value * z_scale + 0.02,
-                f'{value}%',
-                ha='center', va='bottom', fontsize=8)
-    
-    # 繪製網路使用時間
-    values_internet = data['values']['網路']
-    for i, (value, color) in enumerate(zip(values_internet, bar_colors['網路'])):
-        x_pos = x + (i + 3) * bar_width * 3
-        ax.bar3d(x_pos, y, 0,
-                bar_width, bar_depth, value * z_scale,
-                color=color, alpha=0.8)
-        ax.text(x_pos, y, value * z_scale + 0.02,
-                f'{value}%',
-                ha='center', va='bottom', fontsize=8)
-    
-    # 繪製年齡分布
-    values_age = data['values']['年齡']
-    for i, (value, color) in enumerate(zip(values_age, bar_colors['年齡'])):
-        x_pos = x + (i + 7) * bar_width * 3
-        ax.bar3d(x_pos, y, 0,
-                bar_width, bar_depth, value * z_scale,
-                color=color, alpha=0.8)
-        ax.text(x_pos, y, value * z_scale + 0.02,
-                f'{value}%',
-                ha='center', va='bottom', fontsize=8)
-
-# 設定圖例標籤
+    for category, start in category_slots.items():
+        for i, (value, color) in enumerate(zip(data['values'][category], bar_colors[category])):
+            bar_x.append(x + (i + start) * bar_width * 3)
+            bar_y.append(y)
+            bar_values.append(value)
+            bar_color_list.append(color)
+
+bar_x, bar_y, bar_values = np.array(bar_x), np.array(bar_y), np.array(bar_values)
+ax.bar3d(bar_x, bar_y, np.zeros_like(bar_x),
+         bar_width, bar_depth, bar_values * z_scale,
+         color=bar_color_list, alpha=0.8)
+for x_pos, y_pos, value in zip(bar_x, bar_y, bar_values):
+    ax.text(x_pos, y_pos, value * z_scale + 0.02,
+            f'{value}%',
+            ha='center', va='bottom', fontsize=8)
+
+# 設定圖例標籤 (與彙總的組別相同順序；出生年為民國年組別)
 legend_labels = {
     '性別': ['男性', '女性'],
-    '網路': ['0-3小時', '3-6小時', '6小時以上'],
-    '年齡': ['60歲以上', '51-60歲', '41-50歲', '31-40歲', '21-30歲']
+    '網路': USAGE_LABELS,
+    '出生年': BIRTH_LABELS
 }
 
 # 添加圖例
@@ -0,0 +1,200 @@
+"""
+區域彙總
+=====================================
+plot_3Dmap.py、plot_map.py、plot_generator.py 的各區域百分比原本都是手動輸入的常數，
+資料更新時必須逐一重算。
+
+本模組直接由問卷資料計算：
+
+- 地區 (q3，對照 grouped_analysis.REGION_MAP) × 性別 (q1) / 出生年組別 (q2) /
+  每日上網時間 (q7) 的比例
+- 只以一次 groupby 彙總 地區 × 性別 × 出生年組別 × 上網時間 的 (加權) 人數，
+  各邊際分布再由這張小表加總，不需重複掃描資料
+- 可傳入調查權數；未提供時每位受訪者權數為 1
+- 結果存成小型 CSV (長表)，以問卷檔內容與權數的 SHA-256 為快取鍵；
+  新一波資料進來時，所有地圖程式讀取同一份彙總即一起更新
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from grouped_analysis import REGION_MAP, GENDER_MAP
+
+SURVEY_PATH = os.path.join('data', 'processed_data_with_score.csv')
+AGGREGATE_CACHE_DIR = os.path.join('data', 'cache')
+AGGREGATE_VERSION = 1
+
+REGION_ORDER = ['北部', '中部', '南部', '東部', '其他']
+NATIONAL = '全台'
+
+# 出生年 (民國) 組別，與 final_report.py 的 Birth_Category 相同
+BIRTH_BINS = [-np.inf, 60, 70, 80, 90, np.inf]
+BIRTH_LABELS = ['60年以前', '61-70年', '71-80年', '81-90年', '91年以後']
+
+# 民國年 + 1911 = 西元年 (民國 60 年為 1971 年)
+ROC_YEAR_OFFSET = 1911
+
+# 每日上網時數組別
+USAGE_BINS = [-np.inf, 3, 6, np.inf]
+USAGE_LABELS = ['0-3小時', '3-6小時', '6小時以上']
+
+# 彙總的維度 -> 類別 (依顯示順序)
+DIMENSIONS = {
+    'gender': list(GENDER_MAP.values()),
+    'birth': BIRTH_LABELS,
+    'usage': USAGE_LABELS
+}
+
+
+def gregorian_birth_labels():
+    """出生年組別的西元年標籤 (與 BIRTH_LABELS 同順序，英文圖表使用)"""
+    edges = [int(edge) + ROC_YEAR_OFFSET for edge in BIRTH_BINS[1:-1]]
+    return ([f'{edges[0]} or earlier'] +
+            [f'{low + 1}-{high}' for low, high in zip(edges[:-1], edges[1:])] +
+            [f'{edges[-1] + 1} or later'])
+
+
+def encode_respondents(df):
+    """
+    各受訪者的整數代碼 (地區、性別、出生年組別、上網時間；缺失或無法對應為 -1)
+    """
+    return pd.DataFrame({
+        'region': pd.Categorical(df['q3'].map(REGION_MAP), categories=REGION_ORDER).codes,
+        'gender': pd.Categorical(df['q1'].map(GENDER_MAP), categories=DIMENSIONS['gender']).codes,
+        'birth': pd.cut(df['q2'], bins=BIRTH_BINS, labels=BIRTH_LABELS).cat.codes,
+        'usage': pd.cut(df['q7'], bins=USAGE_BINS, labels=USAGE_LABELS).cat.codes
+    }, index=df.index)
+
+
+def _marginal(joint, dimension):
+    """由聯合表加總出 地區 × 類別 的權數矩陣 (缺失值不計入)"""
+    marginal = joint.groupby(level=['region', dimension]).sum()
+    regions = marginal.index.get_level_values('region')
+    categories = marginal.index.get_level_values(dimension)
+    valid = (regions >= 0) & (categories >= 0)
+
+    grid = np.zeros((len(REGION_ORDER), len(DIMENSIONS[dimension])))
+    grid[regions[valid], categories[valid]] = marginal.to_numpy()[valid]
+    return grid
+
+
+def compute_regional_aggregates(df, weights=None):
+    """
+    計算各地區的性別、出生年組別與上網時間比例
+
+    Parameters:
+    -----------
+    df : DataFrame
+        問卷資料 (需包含 q1、q2、q3、q7)
+    weights : array or None
+        各受訪者的調查權數；None 表示不加權
+
+    Returns:
+    --------
+    DataFrame
+        長表，欄位為 region、dimension、category、weight (加權人數)、share (百分比)；
+        dimension 為 'region' 的列是各地區佔全體的比例，region 為 '全台' 的列是全體的分布
+    """
+    codes = encode_respondents(df)
+    w = pd.Series(1.0 if weights is None else np.asarray(weights, dtype=float), index=df.index)
+
+    # 唯一一次掃描資料：地區 × 性別 × 出生年組別 × 上網時間 的加權人數
+    joint = w.groupby([codes['region'], codes['gender'], codes['birth'], codes['usage']]).sum()
+
+    rows = []
+    region_totals = joint.groupby(level='region').sum()
+    region_totals = region_totals[region_totals.index >= 0].reindex(range(len(REGION_ORDER)), fill_value=0)
+    for region, total in zip(REGION_ORDER, region_totals.to_numpy()):
+        rows.append((region, 'region', region, total, 100 * total / region_totals.sum()))
+
+    for dimension, categories in DIMENSIONS.items():
+        grid = _marginal(joint, dimension)
+        grid = np.vstack([grid, grid.sum(axis=0)])
+        totals = grid.sum(axis=1, keepdims=True)
+        shares = 100 * np.divide(grid, totals, out=np.full_like(grid, np.nan), where=totals > 0)
+        for i, region in enumerate(REGION_ORDER + [NATIONAL]):
+            rows += [(region, dimension, category, grid[i, j], shares[i, j])
+                     for j, category in enumerate(categories)]
+
+    return pd.DataFrame(rows, columns=['region', 'dimension', 'category', 'weight', 'share'])
+
+
+def regional_shares(aggregates, dimension):
+    """
+    取出單一維度的比例表
+
+    Returns:
+    --------
+    DataFrame (dimension 為 'region' 時為 Series)
+        列為地區 (含 '全台')，欄為類別，數值為百分比
+    """
+    subset = aggregates[aggregates['dimension'] == dimension]
+    if dimension == 'region':
+        return subset.set_index('region')['share'].reindex(REGION_ORDER)
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"未知的維度: {dimension} (可用: region、{'、'.join(DIMENSIONS)})")
+    return (subset.pivot(index='region', columns='category', values='share')
+            .reindex(index=REGION_ORDER + [NATIONAL], columns=DIMENSIONS[dimension]))
+
+
+def _aggregate_cache_path(data_path, weights, cache_dir):
+    digest = hashlib.sha256()
+    with open(data_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    if isinstance(weights, str):
+        digest.update(weights.encode('utf-8'))
+    elif weights is not None:
+        digest.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+    return os.path.join(cache_dir, f'regional_aggregates_v{AGGREGATE_VERSION}_{digest.hexdigest()[:16]}.csv')
+
+
+def load_regional_aggregates(data_path=SURVEY_PATH, weights=None, cache_dir=AGGREGATE_CACHE_DIR):
+    """
+    讀取區域彙總；快取不存在或問卷資料、權數變更時重新計算
+
+    Parameters:
+    -----------
+    data_path : str
+        問卷資料 CSV
+    weights : str, array or None
+        權數欄位名稱或各受訪者的權數陣列；None 表示不加權
+    cache_dir : str
+        快取目錄
+
+    Returns:
+    --------
+    DataFrame
+        compute_regional_aggregates 的長表
+    """
+    path = _aggregate_cache_path(data_path, weights, cache_dir)
+    if os.path.exists(path):
+        return pd.read_csv(path)
+
+    df = pd.read_csv(data_path)
+    aggregates = compute_regional_aggregates(df, df[weights] if isinstance(weights, str) else weights)
+    os.makedirs(cache_dir, exist_ok=True)
+    aggregates.to_csv(path, index=False, encoding='utf-8-sig')
+    print(f"已儲存: {path}")
+    return aggregates
+
+
+def main():
+    """主程式：計算並列出各地區的比例"""
+    print("=" * 60)
+    print("區域彙總")
+    print("=" * 60)
+
+    aggregates = load_regional_aggregates()
+    print("\n【各地區受訪者比例 (%)】")
+    print(regional_shares(aggregates, 'region').round(1).to_string())
+    for dimension, title in [('gender', '性別'), ('birth', '出生年'), ('usage', '每日上網時間')]:
+        print(f"\n【各地區{title}分布 (%)】")
+        print(regional_shares(aggregates, dimension).round(1).to_string())
+
+
+if __name__ == "__main__":
+    main()
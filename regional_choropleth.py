@@ -0,0 +1,211 @@
+"""
+區域面量圖 (choropleth)
+=====================================
+plot_generator.py 原本以 COUNTYNAME 對應各縣市數值，對照表漏掉的縣市 (新北市、嘉義市、
+基隆市、新竹市) 再逐一補值並重畫整張地圖，同一張圖上每個縣市被畫了四次。
+
+本模組：
+
+- 縣市 → 區域 → 數值 的對應只解析一次；縣市對照表必須恰好涵蓋圖資中的 22 個縣市，
+  缺漏或未知的縣市、缺少數值的區域都直接拋出例外，不會默默留白
+- 以快取圖資 (taiwan_geometry.py) 的環為每個縣市建立一條複合路徑 (外環與洞)，
+  整張地圖只有一個 PatchCollection
+- 多個指標 (區域比例、性別、年齡、上網時間) 共用同一份路徑，
+  以 figure_renderer 建立繪圖規格後平行批次輸出
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import PatchCollection
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+
+from figure_renderer import FigureSpec
+
+# 縣市所屬區域 (與問卷 q3 的地區對照 grouped_analysis.REGION_MAP、plot_map.py 相同)
+COUNTY_REGIONS = {
+    '臺北市': '北部', '新北市': '北部', '基隆市': '北部', '桃園市': '北部',
+    '新竹市': '北部', '新竹縣': '北部', '臺中市': '中部', '苗栗縣': '中部',
+    '彰化縣': '中部', '南投縣': '中部', '雲林縣': '中部', '高雄市': '南部',
+    '臺南市': '南部', '嘉義市': '中部', '嘉義縣': '中部', '屏東縣': '南部',
+    '宜蘭縣': '東部', '花蓮縣': '東部', '臺東縣': '東部', '澎湖縣': '其他',
+    '金門縣': '其他', '連江縣': '其他'
+}
+
+# 台灣本島與澎湖的顯示範圍 (經度、緯度)
+MAP_XLIM = (119.8, 122.2)
+MAP_YLIM = (21.8, 25.5)
+NO_DATA_COLOR = '#DDDDDD'
+
+
+def region_lookup(county_names, county_regions=COUNTY_REGIONS):
+    """
+    解析各縣市所屬區域
+
+    Parameters:
+    -----------
+    county_names : array of str
+        圖資中的縣市名稱 (依圖資順序)
+    county_regions : dict
+        縣市 -> 區域
+
+    Returns:
+    --------
+    regions : list of str
+        出現的區域名稱
+    county_region : array (n_counties)
+        各縣市所屬區域在 regions 中的索引
+    """
+    names = [str(name) for name in county_names]
+    unknown = sorted(set(names) - set(county_regions))
+    missing = sorted(set(county_regions) - set(names))
+    if unknown or missing:
+        raise ValueError(f"縣市對照表與圖資不一致 (對照表缺少: {', '.join(unknown) or '無'}；"
+                         f"圖資缺少: {', '.join(missing) or '無'})")
+
+    regions = list(dict.fromkeys(county_regions[name] for name in names))
+    county_region = np.array([regions.index(county_regions[name]) for name in names])
+    return regions, county_region
+
+
+def county_values(regions, county_region, region_values):
+    """
+    區域數值展開為各縣市數值
+
+    region_values 必須涵蓋所有區域；某區域沒有資料時明確給 NaN (以灰色顯示)
+    """
+    missing = [region for region in regions if region not in region_values]
+    if missing:
+        raise ValueError(f"缺少區域數值: {', '.join(missing)}")
+    return np.array([region_values[region] for region in regions], dtype=float)[county_region]
+
+
+def county_paths(geometry):
+    """
+    每個縣市建立一條複合路徑 (所有多邊形的外環與洞)
+
+    外環統一為逆時針、洞為順時針，不論填色規則為何，洞都不會被填滿。
+
+    Parameters:
+    -----------
+    geometry : CountyGeometry
+        taiwan_geometry.load_county_geometry 的結果
+
+    Returns:
+    --------
+    list of Path
+        依圖資順序的各縣市路徑
+    """
+    coords = geometry.coords.astype(float)
+    ring_offsets = geometry.ring_offsets
+    starts, stops = ring_offsets[:-1], ring_offsets[1:]
+    ring_id = np.repeat(np.arange(len(starts)), np.diff(ring_offsets))
+
+    # 各環的帶號面積 (shoelace)；環的最後一點與起點相同，不與下一個環相連
+    x, y = coords[:, 0], coords[:, 1]
+    cross = x * np.roll(y, -1) - np.roll(x, -1) * y
+    cross[stops - 1] = 0
+    area = np.bincount(ring_id, weights=cross, minlength=len(starts)) / 2
+    flip = np.where(geometry.ring_is_exterior, area < 0, area > 0)
+
+    # 需要反轉方向的環，在環內以 start + stop - 1 - i 取點
+    index = np.arange(len(coords))
+    flipped = flip[ring_id]
+    index[flipped] = (starts + stops - 1)[ring_id[flipped]] - index[flipped]
+    vertices = coords[index]
+
+    codes = np.full(len(coords), Path.LINETO, dtype=Path.code_type)
+    codes[starts] = Path.MOVETO
+    codes[stops - 1] = Path.CLOSEPOLY
+
+    bounds = ring_offsets[geometry.part_offsets[geometry.county_offsets]]
+    return [Path(vertices[start:stop], codes[start:stop])
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def draw_choropleth(paths, values, title, label, cmap='YlOrRd', vmin=None, vmax=None,
+                    table=None, xlim=MAP_XLIM, ylim=MAP_YLIM):
+    """
+    繪製單張面量圖 (所有縣市為單一 PatchCollection)
+
+    Parameters:
+    -----------
+    paths : list of Path
+        各縣市路徑 (county_paths)
+    values : array
+        各縣市數值；NaN 以 NO_DATA_COLOR 顯示
+    title, label : str
+        圖表標題與色條標籤
+    table : list of list or None
+        圖右側的說明表格 (第一列為欄位名稱)
+    """
+    fig, ax = plt.subplots(1, figsize=(10, 10))
+
+    colormap = plt.get_cmap(cmap).with_extremes(bad=NO_DATA_COLOR)
+    patches = PatchCollection([PathPatch(path) for path in paths], cmap=colormap,
+                              edgecolor='0.8', linewidth=0.8)
+    patches.set_array(np.ma.masked_invalid(values))
+    patches.set_clim(vmin, vmax)
+    ax.add_collection(patches)
+
+    # 設置地圖邊界，放大台灣地區 (經緯度等比例，與 GeoDataFrame.plot 相同)
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    ax.set_aspect(1 / np.cos(np.deg2rad(np.mean(ylim))))
+
+    cbar = fig.colorbar(patches, ax=ax, orientation="vertical", fraction=0.02, pad=0.03)
+    cbar.set_label(label, fontsize=14)
+
+    if table is not None:
+        # 調整表格位置避免遮擋
+        fig.subplots_adjust(right=0.7)
+        cell_table = ax.table(cellText=table, colLabels=None, cellLoc='right',
+                              bbox=[1.03, 0.07, 0.4, 0.15], edges='open')
+        cell_table.auto_set_font_size(False)
+        cell_table.set_fontsize(12)
+        cell_table.scale(1.2, 1.2)
+
+    ax.set_title(title, fontsize=20)
+    fig.tight_layout()
+    return fig
+
+
+def choropleth_specs(geometry, indicators, output_dir, county_regions=COUNTY_REGIONS,
+                     formats=('png',), dpi=300):
+    """
+    為多個指標建立面量圖的繪圖規格 (共用同一份縣市路徑)
+
+    Parameters:
+    -----------
+    geometry : CountyGeometry
+        快取圖資
+    indicators : list of dict
+        每個指標一張圖，鍵為 name (輸出檔名)、title、label、values (區域 -> 數值)，
+        可選 cmap、table
+    output_dir : str
+        輸出目錄
+
+    Returns:
+    --------
+    list of FigureSpec
+        交給 figure_renderer.render_figures 平行繪製
+    """
+    regions, county_region = region_lookup(geometry.names, county_regions)
+    paths = county_paths(geometry)
+
+    specs = []
+    for indicator in indicators:
+        values = county_values(regions, county_region, indicator['values'])
+        data = {
+            'paths': paths,
+            'values': values,
+            'title': indicator['title'],
+            'label': indicator['label'],
+            'cmap': indicator.get('cmap', 'YlOrRd'),
+            'vmin': np.nanmin(values),
+            'vmax': np.nanmax(values),
+            'table': indicator.get('table')
+        }
+        specs.append(FigureSpec(draw_choropleth, indicator['name'], data=data,
+                                output_dir=output_dir, formats=formats, dpi=dpi))
+    return specs
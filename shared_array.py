@@ -0,0 +1,125 @@
+"""
+共享記憶體陣列
+=====================================
+平行運算 (交叉驗證 fold、bootstrap、置換檢定、分組分析) 時，
+若直接把標準化矩陣或 DataFrame 傳給子程序，每個任務都要重新序列化一次，
+且每個子程序各自保有一份複本。
+
+本模組讓主程序把矩陣發布一次 (multiprocessing.shared_memory 或
+記憶體映射的 .npy 檔)，只把一個小的規格字典 (名稱、形狀、型別) 傳給子程序，
+子程序以名稱零複製地掛載同一塊記憶體。
+
+使用方式：
+    with SharedArray(X_scaled) as shared:
+        executor.map(work, [shared.spec] * n_tasks)
+
+    def work(spec):
+        X = attach_shared_array(spec)   # 唯讀視圖，不複製
+"""
+
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 子程序已掛載的共享記憶體，避免被垃圾回收而使視圖失效
+_attached = {}
+
+
+class SharedArray:
+    """發布到共享記憶體的唯讀陣列"""
+
+    def __init__(self, array, name=None):
+        """
+        Parameters:
+        -----------
+        array : array-like
+            要發布的矩陣，會複製一次到共享記憶體
+        name : str or None
+            共享記憶體名稱，None 由系統自動產生
+        """
+        array = np.ascontiguousarray(array)
+        self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                               size=max(array.nbytes, 1))
+        self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)
+        self.array[...] = array
+        self.array.flags.writeable = False
+
+        self.spec = {
+            'name': self._shm.name,
+            'shape': array.shape,
+            'dtype': array.dtype.str
+        }
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def close(self):
+        """釋放共享記憶體 (由發布者呼叫)"""
+        if self._shm is None:
+            return
+        self.array = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # 仍有外部視圖引用時無法關閉映射，但仍可解除連結
+            pass
+        self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def publish_memmap(array, path):
+    """
+    將矩陣寫成 .npy 檔，供子程序以記憶體映射掛載
+
+    適合資料比實體記憶體大，或需要跨多次執行重複使用的情況。
+    """
+    np.save(path, np.ascontiguousarray(array))
+    return {'path': os.path.abspath(path)}
+
+
+def attach_shared_array(spec):
+    """
+    依規格掛載已發布的矩陣，回傳唯讀視圖 (不複製)
+
+    Parameters:
+    -----------
+    spec : dict
+        SharedArray.spec 或 publish_memmap 的回傳值
+    """
+    if 'path' in spec:
+        return np.load(spec['path'], mmap_mode='r')
+
+    name = spec['name']
+    if name not in _attached:
+        try:
+            # Python 3.13+ 可關閉資源追蹤，避免子程序結束時誤刪共享記憶體
+            shm = shared_memory.SharedMemory(name=name, create=False, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name, create=False)
+        _attached[name] = shm
+
+    array = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']),
+                       buffer=_attached[name].buf)
+    array.flags.writeable = False
+    return array
+
+
+def detach_shared_array(spec):
+    """子程序不再需要時關閉掛載 (不會刪除共享記憶體)，呼叫前須先釋放所有視圖"""
+    shm = _attached.pop(spec.get('name'), None)
+    if shm is not None:
+        shm.close()
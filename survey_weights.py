@@ -0,0 +1,237 @@
+"""
+調查加權 (raking)
+=====================================
+所有輸出原本把 672 位受訪者視為等權重，樣本的性別、年齡與地區組成與母體不同
+(例如性別比例明顯偏離)，區域地圖、交叉表與聚類摘要都因此偏誤。
+
+本模組以疊代比例調整 (iterative proportional fitting, raking) 計算事後分層權數：
+
+- 母體邊際分布 (性別、出生年組別、地區) 由 JSON 檔提供，本模組不內建任何母體數字，格式為
+  {"gender": {"男性": 0.49, "女性": 0.51}, "birth": {...}, "region": {...}}
+  (數值為比例或人數皆可，各維度會自行正規化)
+- 受訪者先壓縮為 維度代碼組合 的格子，疊代只在格子層級以 np.bincount 進行，
+  幾十萬筆的多波次合併資料也只需掃描一次
+- 可指定分組 (例如調查波次)，各組分別校準到相同的母體比例
+- 權數正規化為平均 1，可直接作為 sample_weight
+
+使用方式：
+    weights = load_survey_weights()              # 找不到母體邊際檔時回傳 None
+    aggregates = load_regional_aggregates(weights=weights)
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from regional_aggregates import SURVEY_PATH, REGION_ORDER, DIMENSIONS, encode_respondents
+
+MARGINS_PATH = os.path.join('data', 'population_margins.json')
+WEIGHTS_PATH = os.path.join('data', 'survey_weights.csv')
+
+MAX_ITER = 100
+TOL = 1e-6
+
+
+def load_margins(path=MARGINS_PATH):
+    """
+    讀取母體邊際分布
+
+    Returns:
+    --------
+    dict
+        維度名稱 -> Series (類別 -> 比例，總和為 1)
+    """
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+
+    margins = {}
+    for dim, shares in raw.items():
+        shares = pd.Series(shares, dtype=float)
+        if (shares < 0).any() or shares.sum() <= 0:
+            raise ValueError(f"母體邊際分布 {dim} 必須為非負且總和大於 0")
+        margins[dim] = shares / shares.sum()
+    return margins
+
+
+def survey_strata(df):
+    """問卷資料的校準維度 (region、gender、birth 的類別標籤，與 regional_aggregates.py 相同)"""
+    codes = encode_respondents(df)
+    categories = {'region': REGION_ORDER, **DIMENSIONS}
+    return pd.DataFrame({
+        dim: pd.Categorical.from_codes(codes[dim], categories=categories[dim])
+        for dim in ['gender', 'birth', 'region']
+    }, index=df.index)
+
+
+def rake_weights(strata, margins, base_weights=None, by=None, max_iter=MAX_ITER, tol=TOL):
+    """
+    疊代比例調整 (raking)
+
+    Parameters:
+    -----------
+    strata : DataFrame
+        每個校準維度一欄 (類別標籤，欄名與 margins 的鍵相同)
+    margins : dict
+        維度名稱 -> 類別 -> 母體比例 (load_margins 的結果)
+    base_weights : array or None
+        設計權數；None 表示等權重
+    by : array or None
+        分組 (例如調查波次)；各組分別校準到相同的母體比例
+    max_iter : int
+        最多疊代次數 (每次依序調整所有維度)
+    tol : float
+        收斂門檻：所有邊際分布的最大相對誤差
+
+    Returns:
+    --------
+    array
+        各列權數 (平均為 1)；任一校準維度缺失的列保留設計權數
+    """
+    n = len(strata)
+    base = np.ones(n) if base_weights is None else np.asarray(base_weights, dtype=float)
+    group_codes, groups = (np.zeros(n, dtype=np.int64), [None]) if by is None else pd.factorize(np.asarray(by))
+
+    # 各維度轉為整數代碼；母體邊際中沒有的類別視為資料錯誤
+    dims = list(margins)
+    codes, targets = [], []
+    valid = np.ones(n, dtype=bool)
+    for dim in dims:
+        target = pd.Series(margins[dim], dtype=float)
+        labels = pd.Series(np.asarray(strata[dim], dtype=object))
+        code = target.index.get_indexer(labels)
+        unknown = labels.notna().to_numpy() & (code < 0)
+        if unknown.any():
+            raise ValueError(f"{dim} 有母體邊際分布中沒有的類別: "
+                             f"{', '.join(map(str, labels[unknown].unique()))}")
+        valid &= code >= 0
+        codes.append(code)
+        targets.append(target.to_numpy() / target.sum())
+
+    # 受訪者壓縮為格子 (分組 × 各維度類別)，之後只在格子層級疊代
+    shape = (len(groups),) + tuple(len(target) for target in targets)
+    cell = np.ravel_multi_index([group_codes[valid]] + [code[valid] for code in codes], shape)
+    cells, inverse = np.unique(cell, return_inverse=True)
+    cell_base = np.bincount(inverse, weights=base[valid])
+    cell_index = np.unravel_index(cells, shape)
+
+    group_total = np.bincount(cell_index[0], weights=cell_base, minlength=len(groups))
+    # 各維度的邊際格 = 分組 × 類別
+    margin_index = [cell_index[0] * len(target) + cell_index[k + 1] for k, target in enumerate(targets)]
+    target_totals = [np.outer(group_total, target).ravel() for target in targets]
+
+    for dim, index, target_total in zip(dims, margin_index, target_totals):
+        observed = np.bincount(index, weights=cell_base, minlength=len(target_total))
+        empty = (target_total > 0) & (observed == 0)
+        if empty.any():
+            categories = pd.Series(margins[dim]).index
+            missing = sorted({str(categories[i % len(categories)]) for i in np.flatnonzero(empty)})
+            raise ValueError(f"樣本中沒有 {dim} = {', '.join(missing)} 的受訪者，無法校準")
+
+    factor = np.ones(len(cells))
+    for iteration in range(1, max_iter + 1):
+        for index, target_total in zip(margin_index, target_totals):
+            current = np.bincount(index, weights=cell_base * factor, minlength=len(target_total))
+            ratio = np.divide(target_total, current, out=np.ones_like(current), where=current > 0)
+            factor *= ratio[index]
+
+        error = 0.0
+        for index, target_total in zip(margin_index, target_totals):
+            current = np.bincount(index, weights=cell_base * factor, minlength=len(target_total))
+            positive = target_total > 0
+            error = max(error, np.max(np.abs(current[positive] / target_total[positive] - 1)))
+        if error < tol:
+            print(f"raking 收斂: {iteration} 次疊代 (最大相對誤差 {error:.2e})")
+            break
+    else:
+        print(f"警告: raking 在 {max_iter} 次疊代內未收斂 (最大相對誤差 {error:.2e})")
+
+    weights = base.copy()
+    weights[valid] *= factor[inverse]
+    if (~valid).any():
+        print(f"校準維度缺失的受訪者: {(~valid).sum()} 位 (保留設計權數)")
+    return weights * (n / weights.sum())
+
+
+def weight_summary(weights):
+    """權數摘要：Kish 有效樣本數與設計效應"""
+    weights = np.asarray(weights, dtype=float)
+    effective_n = weights.sum() ** 2 / np.sum(weights ** 2)
+    return {
+        'n': len(weights),
+        'effective_n': effective_n,
+        'design_effect': len(weights) / effective_n,
+        'min': weights.min(),
+        'max': weights.max()
+    }
+
+
+def load_survey_weights(data_path=SURVEY_PATH, margins_path=MARGINS_PATH, df=None, by=None):
+    """
+    計算問卷資料的調查權數
+
+    Parameters:
+    -----------
+    data_path : str
+        問卷資料 CSV (df 為 None 時讀取)
+    margins_path : str
+        母體邊際分布 JSON
+    df : DataFrame or None
+        已讀入的問卷資料
+    by : str or None
+        分組欄位 (例如調查波次)
+
+    Returns:
+    --------
+    array or None
+        各受訪者權數；找不到母體邊際檔時回傳 None (即不加權)
+    """
+    if not os.path.exists(margins_path):
+        print(f"找不到母體邊際分布 ({margins_path})，不加權")
+        return None
+
+    if df is None:
+        df = pd.read_csv(data_path)
+    weights = rake_weights(survey_strata(df), load_margins(margins_path),
+                           by=None if by is None else df[by])
+    summary = weight_summary(weights)
+    print(f"調查權數: 有效樣本數 {summary['effective_n']:.0f} / {summary['n']}，"
+          f"設計效應 {summary['design_effect']:.2f}，範圍 {summary['min']:.2f}-{summary['max']:.2f}")
+    return weights
+
+
+def main():
+    """主程式：python survey_weights.py [問卷資料.csv] [母體邊際.json]"""
+    print("=" * 60)
+    print("調查加權 (raking)")
+    print("=" * 60)
+
+    data_path = sys.argv[1] if len(sys.argv) > 1 else SURVEY_PATH
+    margins_path = sys.argv[2] if len(sys.argv) > 2 else MARGINS_PATH
+    if not os.path.exists(margins_path):
+        raise FileNotFoundError(f"找不到母體邊際分布: {margins_path}")
+
+    df = pd.read_csv(data_path)
+    weights = load_survey_weights(df=df, margins_path=margins_path)
+
+    strata = survey_strata(df)
+    for dim, target in load_margins(margins_path).items():
+        observed = pd.Series(weights, index=df.index)[strata[dim].notna()]
+        comparison = pd.DataFrame({
+            '樣本': strata[dim].value_counts(normalize=True),
+            '加權後': observed.groupby(strata[dim], observed=True).sum() / observed.sum(),
+            '母體': target
+        }).reindex(target.index) * 100
+        print(f"\n【{dim} (%)】")
+        print(comparison.round(1).to_string())
+
+    os.makedirs(os.path.dirname(WEIGHTS_PATH) or '.', exist_ok=True)
+    pd.DataFrame({'weight': weights}).to_csv(WEIGHTS_PATH, index=False)
+    print(f"\n已儲存: {WEIGHTS_PATH}")
+    return weights
+
+
+if __name__ == "__main__":
+    weights = main()
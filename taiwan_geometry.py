@@ -0,0 +1,372 @@
+"""
+台灣縣市圖資前處理
+=====================================
+plot_map.py、plot_3Dmap.py、plot_generator.py 每次執行都以 gpd.read_file 讀取內政部
+完整解析度的縣市界，plot_3Dmap.py 還會再轉一次座標系統。
+
+本模組只在圖資變更時處理一次：
+
+- 讀取 shapefile 並轉為 WGS84 (EPSG:4326)
+- 依多個容許誤差簡化多邊形；相鄰縣市共用的邊界以 coverage simplification 一起簡化，
+  簡化後不會出現縫隙或重疊 (舊版 shapely / GEOS 退回逐一 simplify(preserve_topology=True))
+- 各精細度的座標存成扁平的座標陣列與位移陣列 (GeoArrow 排列：
+  座標 → 環 → 多邊形 → 縣市)，寫入單一 .npz，以 shapefile 各組成檔的 SHA-256 為快取鍵
+- 組成檔的大小與修改時間記錄在快取目錄的 shapefile_checksum.json，未變更時沿用記錄的
+  SHA-256，不必每次載入都重新雜湊整份圖資
+
+地圖程式以 load_county_geometry(level) 取得所需精細度，只需載入 numpy 陣列；
+3D 地圖所需的三角剖分 (load_county_triangles) 也依相同的快取鍵存檔。
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import shapely
+
+try:
+    import mapbox_earcut
+    HAS_EARCUT = True
+except ImportError:
+    HAS_EARCUT = False
+
+SHAPEFILE_PATH = os.path.join('taiwan_map', 'COUNTY_MOI_1130718.shp')
+GEOMETRY_CACHE_DIR = os.path.join('taiwan_map', 'cache')
+TARGET_CRS = 'EPSG:4326'
+GEOMETRY_VERSION = 1
+
+# 各精細度的簡化容許誤差 (度；0.001 度約 100 公尺)
+DETAIL_LEVELS = {
+    'full': 0.0,
+    'high': 0.0005,
+    'medium': 0.002,
+    'low': 0.01
+}
+
+# 參與快取鍵的 shapefile 組成檔
+SHAPEFILE_PARTS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+ATTRIBUTE_COLUMNS = ['COUNTYID', 'COUNTYCODE', 'COUNTYNAME', 'COUNTYENG']
+# 快取目錄中記錄組成檔大小、修改時間與 SHA-256 的清單
+CHECKSUM_MANIFEST_NAME = 'shapefile_checksum.json'
+
+
+def _shapefile_parts(shapefile_path):
+    """shapefile 的組成檔 (副檔名小寫, 路徑)，依檔名排序"""
+    if not os.path.exists(shapefile_path):
+        raise FileNotFoundError(f"找不到縣市界圖資: {shapefile_path}")
+
+    stem, _ = os.path.splitext(shapefile_path)
+    directory = os.path.dirname(shapefile_path) or '.'
+    prefix = os.path.basename(stem)
+    parts = []
+    for name in sorted(os.listdir(directory)):
+        base, ext = os.path.splitext(name)
+        if base == prefix and ext.lower() in SHAPEFILE_PARTS:
+            parts.append((ext.lower(), os.path.join(directory, name)))
+    return parts
+
+
+def shapefile_checksum(shapefile_path=SHAPEFILE_PATH):
+    """shapefile 各組成檔 (.shp、.shx、.dbf、.prj、.cpg) 內容的 SHA-256"""
+    digest = hashlib.sha256()
+    for ext, path in _shapefile_parts(shapefile_path):
+        digest.update(ext.encode('utf-8'))
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_shapefile_checksum(shapefile_path=SHAPEFILE_PATH, cache_dir=GEOMETRY_CACHE_DIR):
+    """
+    shapefile 的 SHA-256；組成檔的 (大小, 修改時間) 與上次記錄相同時直接沿用，
+    有任何變更 (或尚無記錄) 時才重新雜湊並更新快取目錄的清單
+
+    Parameters:
+    -----------
+    shapefile_path : str
+        內政部縣市界 shapefile
+    cache_dir : str
+        快取目錄 (清單存於 CHECKSUM_MANIFEST_NAME)
+
+    Returns:
+    --------
+    str
+    """
+    signature = []
+    for ext, path in _shapefile_parts(shapefile_path):
+        stat = os.stat(path)
+        signature.append([ext, stat.st_size, stat.st_mtime_ns])
+
+    manifest_path = os.path.join(cache_dir, CHECKSUM_MANIFEST_NAME)
+    key = os.path.abspath(shapefile_path)
+    entries = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            entries = json.load(f)
+    entry = entries.get(key)
+    if entry is not None and entry['signature'] == signature:
+        return entry['checksum']
+
+    checksum = shapefile_checksum(shapefile_path)
+    entries[key] = {'signature': signature, 'checksum': checksum}
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    return checksum
+
+
+def _simplify(geometries, tolerance):
+    """簡化縣市多邊形，相鄰縣市共用的邊界一起簡化"""
+    if tolerance <= 0:
+        return geometries
+    if hasattr(shapely, 'coverage_simplify') and shapely.geos_version >= (3, 12, 0):
+        simplified = shapely.coverage_simplify(geometries, tolerance)
+    else:
+        simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    # 小島在較大的容許誤差下可能被簡化為空，保留原始形狀
+    empty = shapely.is_empty(simplified)
+    simplified[empty] = geometries[empty]
+    return simplified
+
+
+class CountyGeometry:
+    """單一精細度的縣市多邊形 (扁平座標陣列)"""
+
+    def __init__(self, attributes, coords, ring_offsets, part_offsets, county_offsets,
+                 level=None, tolerance=None):
+        """
+        Parameters:
+        -----------
+        attributes : dict
+            欄位名稱 -> 各縣市的屬性 (COUNTYNAME 等)
+        coords : array (n_points × 2)
+            所有環的經緯度，依 縣市 → 多邊形 → 環 的順序串接 (每個環首尾相同)
+        ring_offsets : array (n_rings + 1)
+            各環在 coords 中的起點
+        part_offsets : array (n_parts + 1)
+            各多邊形的環在 ring_offsets 中的起點 (第一個環為外環，其餘為洞)
+        county_offsets : array (n_counties + 1)
+            各縣市的多邊形在 part_offsets 中的起點
+        """
+        self.attributes = {key: np.asarray(values) for key, values in attributes.items()}
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.county_offsets = county_offsets
+        self.level = level
+        self.tolerance = tolerance
+
+    @property
+    def names(self):
+        return self.attributes['COUNTYNAME']
+
+    @property
+    def n_counties(self):
+        return len(self.county_offsets) - 1
+
+    @property
+    def ring_county(self):
+        """各環所屬縣市的索引"""
+        part_county = np.repeat(np.arange(self.n_counties), np.diff(self.county_offsets))
+        return part_county[np.repeat(np.arange(len(self.part_offsets) - 1), np.diff(self.part_offsets))]
+
+    @property
+    def ring_is_exterior(self):
+        """各環是否為多邊形的外環"""
+        is_exterior = np.zeros(len(self.ring_offsets) - 1, dtype=bool)
+        is_exterior[self.part_offsets[:-1]] = True
+        return is_exterior
+
+    @property
+    def bounds(self):
+        return (*self.coords.min(axis=0), *self.coords.max(axis=0))
+
+    def geometries(self):
+        """還原為 shapely MultiPolygon 陣列"""
+        return shapely.from_ragged_array(
+            shapely.GeometryType.MULTIPOLYGON, self.coords.astype(np.float64),
+            (self.ring_offsets, self.part_offsets, self.county_offsets))
+
+    def to_geodataframe(self):
+        """還原為 GeoDataFrame (欄位與 shapefile 相同，座標為 WGS84)"""
+        import geopandas as gpd
+        return gpd.GeoDataFrame(self.attributes, geometry=self.geometries(), crs=TARGET_CRS)
+
+
+def prepare_county_geometry(shapefile_path=SHAPEFILE_PATH, levels=DETAIL_LEVELS):
+    """
+    讀取 shapefile、轉換座標系統並依各精細度簡化
+
+    Returns:
+    --------
+    dict
+        精細度名稱 -> CountyGeometry
+    """
+    import geopandas as gpd
+
+    county_map = gpd.read_file(shapefile_path)
+    if county_map.crs is not None and not county_map.crs.equals(TARGET_CRS):
+        county_map = county_map.to_crs(TARGET_CRS)
+
+    attributes = {col: county_map[col].astype(str).to_numpy(dtype=str)
+                  for col in ATTRIBUTE_COLUMNS if col in county_map.columns}
+    geometries = shapely.force_2d(county_map.geometry.to_numpy())
+
+    prepared = {}
+    for level, tolerance in levels.items():
+        _, coords, (ring_offsets, part_offsets, county_offsets) = shapely.to_ragged_array(
+            _simplify(geometries, tolerance))
+        # 完整解析度保留 float64；簡化後的座標以 float32 儲存 (約 1 公尺精度)
+        coord_dtype = np.float64 if tolerance == 0 else np.float32
+        prepared[level] = CountyGeometry(
+            attributes, coords.astype(coord_dtype), ring_offsets.astype(np.int32),
+            part_offsets.astype(np.int32), county_offsets.astype(np.int32), level, tolerance)
+    return prepared
+
+
+def _cache_path(checksum, cache_dir, kind='county_geometry'):
+    return os.path.join(cache_dir, f'{kind}_v{GEOMETRY_VERSION}_{checksum[:16]}.npz')
+
+
+def save_county_geometry(prepared, path, checksum):
+    """將各精細度的座標陣列寫入單一 .npz"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    arrays = {'checksum': np.array(checksum), 'levels': np.array(list(prepared), dtype=str)}
+    first = next(iter(prepared.values()))
+    for col, values in first.attributes.items():
+        arrays[f'attr_{col}'] = values
+    for level, geometry in prepared.items():
+        arrays[f'{level}_coords'] = geometry.coords
+        arrays[f'{level}_ring_offsets'] = geometry.ring_offsets
+        arrays[f'{level}_part_offsets'] = geometry.part_offsets
+        arrays[f'{level}_county_offsets'] = geometry.county_offsets
+        arrays[f'{level}_tolerance'] = np.array(geometry.tolerance)
+    np.savez(path, **arrays)
+    return path
+
+
+def load_county_geometry(level='high', shapefile_path=SHAPEFILE_PATH, cache_dir=GEOMETRY_CACHE_DIR,
+                         checksum=None):
+    """
+    讀取指定精細度的縣市多邊形；快取不存在或圖資變更時先重新處理
+
+    Parameters:
+    -----------
+    level : str
+        精細度 ('full'、'high'、'medium'、'low')
+    shapefile_path : str
+        內政部縣市界 shapefile
+    cache_dir : str
+        快取目錄
+    checksum : str or None
+        已取得的圖資 SHA-256 (避免同一次呼叫重複計算)；None 時由 cached_shapefile_checksum 取得
+
+    Returns:
+    --------
+    CountyGeometry
+    """
+    if level not in DETAIL_LEVELS:
+        raise ValueError(f"未知的精細度: {level} (可用: {', '.join(DETAIL_LEVELS)})")
+
+    if checksum is None:
+        checksum = cached_shapefile_checksum(shapefile_path, cache_dir)
+    path = _cache_path(checksum, cache_dir)
+    if not os.path.exists(path):
+        print(f"處理縣市界圖資: {shapefile_path}")
+        save_county_geometry(prepare_county_geometry(shapefile_path), path, checksum)
+        print(f"已儲存: {path}")
+
+    with np.load(path) as data:
+        attributes = {key[len('attr_'):]: data[key] for key in data.files if key.startswith('attr_')}
+        return CountyGeometry(
+            attributes, data[f'{level}_coords'], data[f'{level}_ring_offsets'],
+            data[f'{level}_part_offsets'], data[f'{level}_county_offsets'],
+            level, float(data[f'{level}_tolerance']))
+
+
+def _earcut_triangles(geometry):
+    """以 earcut 逐一剖分每個多邊形 (含洞)，回傳三角形頂點座標與所屬縣市"""
+    coords = geometry.coords.astype(np.float64)
+    ring_offsets, part_offsets = geometry.ring_offsets, geometry.part_offsets
+    part_county = np.repeat(np.arange(geometry.n_counties), np.diff(geometry.county_offsets))
+
+    triangles, county_index = [], []
+    for part in range(len(part_offsets) - 1):
+        starts = ring_offsets[part_offsets[part]:part_offsets[part + 1]]
+        stops = ring_offsets[part_offsets[part] + 1:part_offsets[part + 1] + 1]
+        # 環的最後一點與起點相同，剖分時去除
+        vertices = np.concatenate([coords[start:stop - 1] for start, stop in zip(starts, stops)])
+        ring_ends = np.cumsum(stops - starts - 1).astype(np.uint32)
+        index = mapbox_earcut.triangulate_float64(vertices, ring_ends).reshape(-1, 3)
+        triangles.append(vertices[index])
+        county_index.append(np.full(len(index), part_county[part]))
+    return np.concatenate(triangles), np.concatenate(county_index)
+
+
+def _delaunay_triangles(geometry):
+    """以 shapely 的 constrained Delaunay 剖分 (未安裝 mapbox_earcut 時使用)"""
+    triangles, county_index = shapely.get_parts(
+        shapely.constrained_delaunay_triangles(geometry.geometries()), return_index=True)
+    return shapely.get_coordinates(triangles).reshape(-1, 4, 2)[:, :3], county_index
+
+
+def triangulate_counties(geometry):
+    """
+    將所有縣市多邊形 (含離島與洞) 剖分為三角形
+
+    Returns:
+    --------
+    triangles : array (n_triangles × 3 × 2)
+        三角形頂點的經緯度 (float32)
+    county_index : array (n_triangles)
+        各三角形所屬縣市的索引
+    """
+    if HAS_EARCUT:
+        triangles, county_index = _earcut_triangles(geometry)
+    else:
+        triangles, county_index = _delaunay_triangles(geometry)
+    return triangles.astype(np.float32), county_index.astype(np.int32)
+
+
+def load_county_triangles(level='high', shapefile_path=SHAPEFILE_PATH, cache_dir=GEOMETRY_CACHE_DIR):
+    """
+    讀取指定精細度的三角剖分；快取不存在或圖資變更時先重新剖分
+
+    Returns:
+    --------
+    geometry : CountyGeometry
+    triangles : array (n_triangles × 3 × 2)
+    county_index : array (n_triangles)
+    """
+    checksum = cached_shapefile_checksum(shapefile_path, cache_dir)
+    geometry = load_county_geometry(level, shapefile_path, cache_dir, checksum=checksum)
+    method = 'earcut' if HAS_EARCUT else 'delaunay'
+    path = _cache_path(checksum, cache_dir, kind=f'county_triangles_{level}_{method}')
+    if not os.path.exists(path):
+        triangles, county_index = triangulate_counties(geometry)
+        np.savez(path, triangles=triangles, county_index=county_index)
+        print(f"已儲存: {path}")
+
+    with np.load(path) as data:
+        return geometry, data['triangles'], data['county_index']
+
+
+def main():
+    """主程式：處理圖資並列出各精細度的頂點數與載入時間"""
+    print("=" * 60)
+    print("台灣縣市圖資前處理")
+    print("=" * 60)
+
+    for level, tolerance in DETAIL_LEVELS.items():
+        start = time.perf_counter()
+        geometry = load_county_geometry(level)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"  {level:<8} 容許誤差 {tolerance:<7} 頂點 {len(geometry.coords):>8,}，"
+              f"環 {len(geometry.ring_offsets) - 1:>5,}，載入 {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()